@@ -19,13 +19,10 @@
 #    Eugenio "g7" Paolantonio <me@medesimo.eu>
 #
 
-# This module is only "one-way", so it doesn't react to events from the
-# outside (i.e. changes made via dconf-editor).
-# We do not bind anything here, so we keep everything simple by
-# not implementing "two-way" syncronization of settings.
-# If you change something via another application while vera-control-center
-# (and this module) is open, you should close and reopen the control center
-# again. 
+# This module reacts to events from the outside: SEARCH_PATH is
+# monitored, and the rows are added, updated or removed as the desktop
+# files change. Changes to autostart-ignore (i.e. made via dconf-editor)
+# are reflected in the BLACKLIST and in the switches.
 
 import os
 
@@ -33,26 +30,44 @@ import shutil
 
 import random
 
+import time
+
+from collections import deque
+
 import quickstart
 
-from gi.repository import Gtk, GdkPixbuf, GObject, Gio
+from gi.repository import Gtk, GdkPixbuf, GObject, Gio, GLib
 
 from xdg.DesktopEntry import DesktopEntry
 
 from veracc.utils import Settings
 
+import veracc.desktopcache as desktopcache
+
+import veracc.autostart as autostart
+import veracc.autostarttiming as autostarttiming
+
 from veracc.widgets.ApplicationSelectionDialog import ApplicationSelectionDialog
 
 # Search path for the applications.
-#
-# /usr/share/vera/autostart is taken out volountairly because it contains
-# core applications that the user doesn't want to disable.
-# You can still disable those by manually modifying the vera settings via
-# e.g. dconf-editor.
-SEARCH_PATH = (
-	"/etc/xdg/autostart",
-	os.path.expanduser("~/.config/autostart")
-)
+SEARCH_PATH = autostart.SEARCH_PATH
+
+# Time budget (in seconds) for the creation of rows in a single
+# main loop iteration
+ROWS_FRAME_BUDGET = 0.008
+
+# Translated names of the autostart phases
+PHASE_NAMES = {
+	"Panel" : _("Panel"),
+	"Desktop" : _("Desktop"),
+	"Other" : _("Other"),
+}
+
+# Translated names of the ionice classes
+IOCLASS_NAMES = {
+	"best-effort" : _("Best effort"),
+	"idle" : _("Idle"),
+}
 
 # dconf settings
 SETTINGS = Settings("org.semplicelinux.vera")
@@ -65,10 +80,11 @@ class ApplicationRow(Gtk.ListBoxRow):
 	"""
 	An ApplicationRow is a modified Gtk.ListBoxRow that shows informations
 	about an application to autostart.
-	It permits to enable or disable the application via a Switch.
+	It permits to enable or disable the application via a Switch, and
+	to demote it (lower its CPU and disk priority) with a single click.
 	
 	--------------------------------------------------------------------
-	|  ICON   Program name                                       ##ON  |
+	|  ICON   Program name                               [v] [E] ##ON  |
 	--------------------------------------------------------------------
 	"""
 	
@@ -83,6 +99,11 @@ class ApplicationRow(Gtk.ListBoxRow):
 			None,
 			(object,)
 		),
+		"requests-demote" : (
+			GObject.SIGNAL_RUN_LAST,
+			None,
+			(bool,)
+		),
 	}
 	
 	def reset_default(self):
@@ -99,14 +120,15 @@ class ApplicationRow(Gtk.ListBoxRow):
 		base_name is the basename of the desktop file used to obtain
 		application_desktop.
 		
-		application_desktop is the xdg.DesktopEntry of the application
+		application_desktop is the (Cached)DesktopEntry of the application
 		to show.
 		"""
 		
 		super().__init__()
 		
 		self.base_name = base_name
-		self.application_desktop = application_desktop
+		self.application_desktop = None
+		self.timing = None
 		
 		# Main container
 		self.main_container = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
@@ -118,6 +140,10 @@ class ApplicationRow(Gtk.ListBoxRow):
 		self.name = Gtk.Label()
 		self.name.set_alignment(0, 0.5)
 		
+		# Login-time cost
+		self.cost = Gtk.Label()
+		self.cost.get_style_context().add_class("dim-label")
+		
 		# Switch
 		self.switch = Gtk.Switch()
 		
@@ -125,13 +151,86 @@ class ApplicationRow(Gtk.ListBoxRow):
 		self.edit = Gtk.Button.new_from_icon_name("edit-symbolic", Gtk.IconSize.BUTTON)
 		self.edit.set_always_show_image(True)
 		
+		# Resource limits indicator, toggles the demotion
+		self.limits = Gtk.ToggleButton()
+		self.limits.set_image(Gtk.Image.new_from_icon_name("go-down-symbolic", Gtk.IconSize.BUTTON))
+		self.limits.set_relief(Gtk.ReliefStyle.NONE)
+		
 		# Add to container
 		self.main_container.pack_start(self.icon, False, False, 2)
 		self.main_container.pack_start(self.name, True, True, 2)
+		self.main_container.pack_start(self.cost, False, False, 2)
+		self.main_container.pack_start(self.limits, False, False, 2)
 		self.main_container.pack_start(self.edit, False, False, 2)
 		self.main_container.pack_start(self.switch, False, False, 2)
 		
+		# Connect the limits button before populating, update() blocks
+		# the handler
+		self.limits_handler = self.limits.connect(
+			"toggled",
+			lambda x: self.emit("requests_demote", x.get_active())
+		)
+		
 		# Populate using informations from the DesktopEntry
+		self.update(application_desktop)
+		
+		# Value
+		self.reset_default()
+		
+		# Connect the switch and edit button
+		self.switch.connect(
+			"notify::active",
+			lambda x, y: self.emit("changed", self.base_name, x.get_active())
+		)
+		self.edit.connect(
+			"clicked",
+			lambda x: self.emit("requests_edit", self.application_desktop)
+		)
+		
+		# Finally add the container to the row
+		self.add(self.main_container)
+		self.show_all()
+	
+	def set_timing(self, timing):
+		"""
+		Shows the login-time cost of the application, given its
+		autostarttiming.ApplicationTiming (or None if there's no data).
+		"""
+		
+		self.timing = timing
+		
+		if timing is None:
+			# Don't make it look cheap
+			self.cost.set_text(_("n/a"))
+			self.cost.set_tooltip_text(
+				_("Not measured: there's no startup time recorded for this application yet.")
+			)
+			return
+		
+		self.cost.set_text(_("%.1f s") % timing.duration)
+		
+		details = [
+			_("Phase: %s") % timing.phase,
+			_("Average startup time over the last %(sessions)d logins: %(duration).2f s") % {
+				"sessions" : timing.sessions,
+				"duration" : timing.duration
+			}
+		]
+		if timing.cpu_time is not None:
+			details.append(_("CPU time: %.2f s") % timing.cpu_time)
+		if timing.max_rss is not None:
+			details.append(_("Memory: %.1f MiB") % (timing.max_rss / 1024))
+		
+		self.cost.set_tooltip_text("\n".join(details))
+	
+	def update(self, application_desktop):
+		"""
+		(Re)populates the row using the informations from the given
+		(Cached)DesktopEntry.
+		"""
+		
+		self.application_desktop = application_desktop
+		
 		icon = self.application_desktop.getIcon()
 		if icon.startswith("/"):
 			# Path to icon
@@ -153,31 +252,39 @@ class ApplicationRow(Gtk.ListBoxRow):
 		
 		self.name.set_text(self.application_desktop.getName())
 		
-		# Value
-		self.reset_default()
-		
-		# Connect the switch and edit button
-		self.switch.connect(
-			"notify::active",
-			lambda x, y: self.emit("changed", self.base_name, x.get_active())
-		)
-		
 		# Check for writeability of the desktop file, and disable the edit
 		# button if the file is not writeable
 		if not os.access(self.application_desktop.filename, os.W_OK):
 			self.edit.set_sensitive(False)
 			self.edit.set_tooltip_text(_("You don't have enough permissions to edit or remove «%s»") % self.application_desktop.getName())
 		else:
-			# Create connection
-			self.edit.connect(
-				"clicked",
-				lambda x: self.emit("requests_edit", self.application_desktop)
-			)
+			self.edit.set_sensitive(True)
 			self.edit.set_tooltip_text(_("Edit or remove «%s»") % self.application_desktop.getName())
 		
-		# Finally add the container to the row
-		self.add(self.main_container)
-		self.show_all()
+		# Resource limits
+		limits = autostart.get_resource_limits(self.application_desktop)
+		
+		self.limits.handler_block(self.limits_handler)
+		self.limits.set_active(limits != autostart.NO_LIMITS)
+		self.limits.handler_unblock(self.limits_handler)
+		
+		self.limits.set_sensitive(self.edit.get_sensitive())
+		
+		if limits == autostart.NO_LIMITS:
+			self.limits.set_tooltip_text(_("Lower the priority of «%s»") % self.application_desktop.getName())
+		else:
+			details = []
+			if limits.nice:
+				details.append(_("Priority (nice level): %d") % limits.nice)
+			if limits.ioclass:
+				details.append(_("Disk priority: %s") % IOCLASS_NAMES.get(limits.ioclass, limits.ioclass))
+			if limits.memory:
+				details.append(_("Memory limit: %d MiB") % limits.memory)
+			if limits.cpu:
+				details.append(_("CPU limit: %d%%") % limits.cpu)
+			details.append(_("Click to remove the limits"))
+			
+			self.limits.set_tooltip_text("\n".join(details))
 
 @quickstart.builder.from_file("./modules/autostart/autostart.glade")
 class Scene(quickstart.scenes.BaseScene):
@@ -188,13 +295,13 @@ class Scene(quickstart.scenes.BaseScene):
 	events = {
 		"response": ("add_new_custom_dialog",), # the application selection dialog is handled manually
 		"delete-event" : ("add_new_custom_dialog",),
-		"changed" : ("custom_name", "custom_command",),
+		"changed" : ("custom_name", "custom_command", "custom_phase",),
+		"value-changed" : ("custom_delay",),
+		"toggled" : ("sort_by_cost", "custom_when_idle",),
 	}
 	
 	application_selection_dialog = None
 	
-	desktop_list = []
-	
 	current_edit_informations = {}
 	
 	def on_custom_entry_changed(self, entry):
@@ -214,9 +321,109 @@ class Scene(quickstart.scenes.BaseScene):
 				)
 			)
 		)
+		
+		self.update_schedule_preview()
 	
 	on_custom_name_changed = on_custom_entry_changed
 	on_custom_command_changed = on_custom_entry_changed
+	on_custom_phase_changed = on_custom_entry_changed
+	on_custom_delay_value_changed = on_custom_entry_changed
+	on_custom_when_idle_toggled = on_custom_entry_changed
+	
+	def set_schedule_options(self, phase, delay, when_idle):
+		"""
+		Sets the schedule options in the add_new_custom_dialog.
+		"""
+		
+		if not self.objects.custom_phase.set_active_id(phase):
+			# Unknown phase, keep it
+			self.objects.custom_phase.append(phase, phase)
+			self.objects.custom_phase.set_active_id(phase)
+		
+		self.objects.custom_delay.set_value(delay)
+		self.objects.custom_when_idle.set_active(when_idle)
+	
+	def set_resource_limits(self, limits):
+		"""
+		Sets the given autostart.ResourceLimits in the add_new_custom_dialog.
+		"""
+		
+		self.objects.custom_nice.set_value(limits.nice)
+		self.objects.custom_ioclass.set_active_id(limits.ioclass)
+		self.objects.custom_memory.set_value(limits.memory)
+		self.objects.custom_cpu.set_value(limits.cpu)
+	
+	def get_resource_limits(self):
+		"""
+		Returns the autostart.ResourceLimits in the add_new_custom_dialog.
+		"""
+		
+		return autostart.ResourceLimits(
+			self.objects.custom_nice.get_value_as_int(),
+			self.objects.custom_ioclass.get_active_id() or "",
+			self.objects.custom_memory.get_value_as_int(),
+			self.objects.custom_cpu.get_value_as_int()
+		)
+	
+	def get_schedule_options(self):
+		"""
+		Returns a (phase, delay, when_idle) tuple with the schedule options
+		in the add_new_custom_dialog.
+		"""
+		
+		return (
+			self.objects.custom_phase.get_active_id() or autostart.DEFAULT_PHASE,
+			self.objects.custom_delay.get_value_as_int(),
+			self.objects.custom_when_idle.get_active()
+		)
+	
+	def update_schedule_preview(self):
+		"""
+		Updates the launch schedule shown in the add_new_custom_dialog,
+		with the application being added or edited in bold.
+		"""
+		
+		if not self.objects.add_new_custom_dialog.get_visible():
+			return
+		
+		edited = self.current_edit_informations.get("row")
+		edited = edited.base_name if edited else None
+		
+		items = [
+			autostart.schedule_item(application, row.application_desktop)
+			for application, row in self.rows.items()
+			if application != edited and not application in BLACKLIST
+		]
+		items.append(
+			autostart.ScheduleItem(
+				*self.get_schedule_options(),
+				application=edited,
+				name=self.objects.custom_name.get_text() or _("New application")
+			)
+		)
+		
+		lines = []
+		phase = None
+		for item in autostart.sort_schedule(items):
+			if item.phase != phase:
+				phase = item.phase
+				lines.append("<b>%s</b>" % GLib.markup_escape_text(phase))
+			
+			line = "%s  %s" % (
+				_("when idle") if item.when_idle else ("+%d s" % item.delay),
+				GLib.markup_escape_text(item.name)
+			)
+			
+			timing = self.timings.get(item.application)
+			if timing:
+				line += " <small>(%s)</small>" % (_("%.1f s") % timing.duration)
+			
+			if item.application == edited:
+				line = "<b>%s</b>" % line
+			
+			lines.append("    %s" % line)
+		
+		self.objects.schedule_preview.set_markup("\n".join(lines))
 	
 	def on_application_selection_dialog_response(self, dialog, response_id):
 		"""
@@ -233,7 +440,7 @@ class Scene(quickstart.scenes.BaseScene):
 		desktop_file = dialog.get_selection()[1]
 		desktop_basename = os.path.basename(desktop_file)
 		
-		if os.path.basename(desktop_file) in self.desktop_list:
+		if desktop_basename in self.rows:
 			# Already in list, bye
 			return
 		
@@ -246,7 +453,7 @@ class Scene(quickstart.scenes.BaseScene):
 		# https://github.com/vera-desktop/vera/issues/2
 		
 		# Copy the desktop file to ~/.config/autostart
-		directory = os.path.expanduser("~/.config/autostart")
+		directory = autostart.USER_DIRECTORY
 		target_file = os.path.join(directory, desktop_basename)
 		if not os.path.exists(directory):
 			os.makedirs(directory)
@@ -255,20 +462,10 @@ class Scene(quickstart.scenes.BaseScene):
 			target_file
 		)
 
-		entry = DesktopEntry(target_file)
-		
-		row = ApplicationRow(desktop_basename, entry)
-		
-		# Connect the changed signal
-		row.connect("changed", self.on_row_changed)
-		
-		# Connect the requests_edit signal
-		row.connect("requests_edit", self.on_row_requests_edit)
+		entry = desktopcache.get_entry(target_file)
 		
 		# Prepend the row
-		self.objects.list.prepend(row)
-		
-		self.desktop_list.append(desktop_basename)
+		self.add_row(desktop_basename, entry, prepend=True)
 	
 	def on_add_new_application_activated(self, menuitem, parameter):
 		"""
@@ -309,8 +506,13 @@ class Scene(quickstart.scenes.BaseScene):
 		# Grab focus on the custom_name entry
 		self.objects.custom_name.grab_focus()
 		
+		# Default schedule and no limits
+		self.set_schedule_options(autostart.DEFAULT_PHASE, 0, False)
+		self.set_resource_limits(autostart.NO_LIMITS)
+		
 		# Show the add_new_custom dialog
 		self.objects.add_new_custom_dialog.show()
+		self.update_schedule_preview()
 
 	def on_row_requests_edit(self, row, application_desktop):
 		"""
@@ -331,14 +533,20 @@ class Scene(quickstart.scenes.BaseScene):
 
 		# Preload Name and Exec
 		self.objects.custom_name.set_text(application_desktop.getName())
-		self.objects.custom_command.set_text(application_desktop.getExec())
+		self.objects.custom_command.set_text(autostart.get_command(application_desktop))
 		
 		# Populate self.current_edit_informations
 		self.current_edit_informations["row"] = row
-		self.current_edit_informations["desktop"] = application_desktop
+		# (the row holds a read-only cached entry, load the real one)
+		self.current_edit_informations["desktop"] = DesktopEntry(application_desktop.filename)
+		
+		# Preload the schedule
+		self.set_schedule_options(*autostart.get_schedule_options(application_desktop))
+		self.set_resource_limits(autostart.get_resource_limits(application_desktop))
 		
 		# Show the add_new_custom dialog
 		self.objects.add_new_custom_dialog.show()
+		self.update_schedule_preview()
 	
 	def on_add_new_custom_dialog_response(self, dialog, response_id):
 		"""
@@ -350,7 +558,7 @@ class Scene(quickstart.scenes.BaseScene):
 		
 		if not on_edit and response_id == Gtk.ResponseType.OK:
 			# Obtain a working filename
-			directory = os.path.expanduser("~/.config/autostart")
+			directory = autostart.USER_DIRECTORY
 			if not os.path.exists(directory):
 				os.makedirs(directory)
 			
@@ -367,30 +575,27 @@ class Scene(quickstart.scenes.BaseScene):
 			entry = DesktopEntry(filename)
 			entry.set("Version", 1.0)
 			entry.set("Name", self.objects.custom_name.get_text())
-			entry.set("Exec", self.objects.custom_command.get_text())
-			entry.set("X-Vera-Autostart-Phase", "Other")
+			autostart.set_resource_limits(entry, self.objects.custom_command.get_text(), self.get_resource_limits())
+			autostart.set_schedule_options(entry, *self.get_schedule_options())
 			entry.write()
 			
-			row = ApplicationRow(desktop_basename, entry)
-			
-			# Connect the changed signal
-			row.connect("changed", self.on_row_changed)
-
-			# Connect the requests_edit signal
-			row.connect("requests_edit", self.on_row_requests_edit)
-			
 			# Prepend the row
-			self.objects.list.prepend(row)
-			
-			self.desktop_list.append(desktop_basename)
+			self.add_row(desktop_basename, desktopcache.get_entry(filename), prepend=True)
 		elif on_edit and response_id == Gtk.ResponseType.OK:
 			# Edit
 			
 			self.current_edit_informations["desktop"].set("Name", self.objects.custom_name.get_text(), locale=True)
-			self.current_edit_informations["desktop"].set("Exec", self.objects.custom_command.get_text())
+			autostart.set_resource_limits(
+				self.current_edit_informations["desktop"],
+				self.objects.custom_command.get_text(),
+				self.get_resource_limits()
+			)
+			autostart.set_schedule_options(self.current_edit_informations["desktop"], *self.get_schedule_options())
 			self.current_edit_informations["desktop"].write()
 			
-			self.current_edit_informations["row"].name.set_text(self.objects.custom_name.get_text())
+			self.current_edit_informations["row"].update(
+				desktopcache.get_entry(self.current_edit_informations["desktop"].filename)
+			)
 		elif on_edit and response_id == Gtk.ResponseType.NO:
 			# Remove
 			
@@ -404,6 +609,8 @@ class Scene(quickstart.scenes.BaseScene):
 			
 			# Finally, remove
 			os.remove(self.current_edit_informations["desktop"].filename)
+			desktopcache.invalidate(self.current_edit_informations["desktop"].filename)
+			self.rows.pop(self.current_edit_informations["row"].base_name, None)
 			self.current_edit_informations["row"].destroy()
 		
 		# Hide
@@ -427,55 +634,215 @@ class Scene(quickstart.scenes.BaseScene):
 		Fired when the switch of a row has been modified.
 		"""
 		
-		if enabled and application in BLACKLIST:
-			# Remove from the blacklist
-			BLACKLIST.remove(application)
-		elif not enabled and application not in BLACKLIST:
-			# Add to the blacklist
-			BLACKLIST.append(application)
+		autostart.set_enabled(SETTINGS, BLACKLIST, application, enabled)
+	
+	def on_row_requests_demote(self, row, demote):
+		"""
+		Fired when the limits button of a row has been toggled.
+		"""
+		
+		entry = DesktopEntry(row.application_desktop.filename)
+		autostart.set_resource_limits(
+			entry,
+			autostart.get_command(entry),
+			autostart.DEMOTED_LIMITS if demote else autostart.NO_LIMITS
+		)
 		
-		# Set the new array
-		SETTINGS.set_strv("autostart-ignore", BLACKLIST)
+		try:
+			entry.write()
+		except OSError:
+			print("Unable to change the limits of %s." % row.base_name)
+		
+		row.update(desktopcache.get_entry(entry.filename))
 	
-	#@quickstart.threads.on_idle
-	@quickstart.threads.thread
-	def add_applications(self):
+	def on_blacklist_changed(self, settings, key):
 		"""
-		Populates the self.objects.list ListBox with the applications
-		in SEARCH_PATH.
+		Fired when autostart-ignore has been changed.
 		"""
 		
-		for path in SEARCH_PATH:
-			
-			if not os.path.exists(path): continue
+		# Update BLACKLIST in place, everyone holds a reference to it
+		BLACKLIST[:] = settings.get_strv(key)
+		
+		for row in self.rows.values():
+			row.reset_default()
+	
+	def on_search_path_changed(self, monitor, file, other_file, event_type):
+		"""
+		Fired when something changed in a SEARCH_PATH directory.
+		"""
+		
+		if not event_type in (
+			Gio.FileMonitorEvent.CREATED,
+			Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+			Gio.FileMonitorEvent.DELETED,
+			Gio.FileMonitorEvent.ATTRIBUTE_CHANGED
+		):
+			return
+		
+		application = file.get_basename()
+		if not application.endswith(".desktop"):
+			return
+		
+		# Changes usually come in bursts (created, changed, done...),
+		# so collapse them
+		self.changed_applications.add(application)
+		if self.refresh_source is None:
+			self.refresh_source = GObject.idle_add(self.refresh_applications)
+	
+	def refresh_applications(self):
+		"""
+		Adds, updates or removes the rows of the applications changed
+		on disk.
+		"""
+		
+		self.refresh_source = None
+		
+		changed = self.changed_applications
+		self.changed_applications = set()
+		
+		for application in changed:
+			entry = autostart.find_application(application)
+			row = self.rows.get(application)
 			
-			for application in os.listdir(path):
-				
-				# Add the application, if we can
+			if entry is None and row is not None:
+				# Removed
+				del self.rows[application]
+				row.destroy()
+			elif entry is not None and row is not None:
+				# Updated
 				try:
-					entry = DesktopEntry(os.path.join(path, application))
-					if not "KDE" in entry.getOnlyShowIn() and not application in self.desktop_list:
-						
-						# While excluding only KDE is not ideal, we do so
-						# to have consistency with vera's AutostartManager.
-						# This check is obviously a FIXME.
-						
-						row = ApplicationRow(application, entry)
-						
-						# Connect the changed signal
-						row.connect("changed", self.on_row_changed)
-						
-						# Connect the requests_edit signal
-						row.connect("requests_edit", self.on_row_requests_edit)
-						
-						GObject.idle_add(self.objects.list.insert,
-							row,
-							-1
-						)
-						
-						self.desktop_list.append(application)
+					row.update(entry)
 				except:
 					print("Unable to show informations for %s." % application)
+			elif entry is not None:
+				# Added
+				try:
+					self.add_row(application, entry)
+				except:
+					print("Unable to show informations for %s." % application)
+		
+		return False
+	
+	def set_timings(self, timings):
+		"""
+		Sets the login-time costs read from the timing log.
+		"""
+		
+		self.timings = timings
+		
+		for application, row in self.rows.items():
+			row.set_timing(self.timings.get(application))
+		
+		self.objects.sort_by_cost.set_sensitive(bool(self.timings))
+		
+		# Per-phase summary
+		totals = autostarttiming.phase_totals(self.timings)
+		if totals:
+			self.objects.phase_summary.set_markup(
+				"<small>%s %s</small>" % (
+					_("Average startup time per phase:"),
+					", ".join(
+						"%s %s" % (GLib.markup_escape_text(phase), _("%.1f s") % total)
+						for phase, total in totals.items()
+					)
+				)
+			)
+			self.objects.phase_summary.show()
+		else:
+			self.objects.phase_summary.hide()
+		
+		return False
+	
+	def sort_by_cost(self, row1, row2):
+		"""
+		Sort function that puts the most expensive applications first.
+		"""
+		
+		cost1 = row1.timing.duration if row1.timing else -1
+		cost2 = row2.timing.duration if row2.timing else -1
+		
+		return (cost1 < cost2) - (cost1 > cost2)
+	
+	def on_sort_by_cost_toggled(self, button):
+		"""
+		Fired when the "Slowest first" button has been toggled.
+		"""
+		
+		self.objects.list.set_sort_func(
+			self.sort_by_cost if button.get_active() else None
+		)
+		self.objects.list.invalidate_sort()
+	
+	def add_row(self, application, entry, prepend=False):
+		"""
+		Creates an ApplicationRow for the given application and adds it
+		to the list.
+		
+		Must be called from the main thread.
+		"""
+		
+		row = ApplicationRow(application, entry)
+		
+		# Connect the changed signal
+		row.connect("changed", self.on_row_changed)
+		
+		# Connect the requests_edit signal
+		row.connect("requests_edit", self.on_row_requests_edit)
+		
+		# Connect the requests_demote signal
+		row.connect("requests_demote", self.on_row_requests_demote)
+		
+		if prepend:
+			self.objects.list.prepend(row)
+		else:
+			self.objects.list.insert(row, -1)
+		
+		self.rows[application] = row
+		
+		row.set_timing(self.timings.get(application))
+		
+		return row
+	
+	def add_rows(self, entries):
+		"""
+		Adds the rows for the given (application, entry) deque,
+		stopping when the ROWS_FRAME_BUDGET is exhausted.
+		
+		This is an idle callback, so it's called again (in another
+		main loop iteration) until every row has been created.
+		"""
+		
+		deadline = time.monotonic() + ROWS_FRAME_BUDGET
+		
+		while entries and time.monotonic() < deadline:
+			application, entry = entries.popleft()
+			
+			if application in self.rows:
+				continue
+			
+			# Add the application, if we can
+			try:
+				self.add_row(application, entry)
+			except:
+				print("Unable to show informations for %s." % application)
+		
+		return bool(entries)
+	
+	@quickstart.threads.thread
+	def add_applications(self):
+		"""
+		Populates the self.objects.list ListBox with the applications
+		in SEARCH_PATH.
+		
+		The desktop files are parsed here, in a thread. The rows are
+		then created in the main thread, in batches (see add_rows()).
+		"""
+		
+		entries = deque(autostart.iter_applications())
+		timings = autostarttiming.read_timings()
+		
+		GObject.idle_add(self.set_timings, timings)
+		GObject.idle_add(self.add_rows, entries)
 	
 	def prepare_scene(self):
 		"""
@@ -484,6 +851,19 @@ class Scene(quickstart.scenes.BaseScene):
 				
 		self.scene_container = self.objects.main
 		
+		# Drop what a previous set-up left behind
+		self.stop_monitoring()
+		
+		# Basename of the applications in the list -> ApplicationRow
+		self.rows = {}
+		
+		# Login-time costs (application -> ApplicationTiming)
+		self.timings = {}
+		
+		# Applications changed on disk, waiting for refresh_applications()
+		self.changed_applications = set()
+		self.refresh_source = None
+		
 		# Create menu
 		actiongroup = Gio.SimpleActionGroup.new()
 		
@@ -531,10 +911,52 @@ class Scene(quickstart.scenes.BaseScene):
 		# Make the Select button the default
 		self.objects.add_new_custom_dialog.set_default_response(Gtk.ResponseType.OK)
 		
+		# Populate the phase combobox
+		for phase in autostart.PHASES:
+			self.objects.custom_phase.append(phase, PHASE_NAMES.get(phase, phase))
+		
 		# Set destructive-action to the Remove button
 		self.objects.add_new_custom_dialog.get_widget_for_response(Gtk.ResponseType.NO).get_style_context().add_class("destructive-action")
 		
 		self.add_applications()
+		
+		self.start_monitoring()
+	
+	def start_monitoring(self):
+		"""
+		Monitors SEARCH_PATH and the blacklist.
+		"""
+		
+		# (monitor, handler id)
+		self.monitors = []
+		for path in SEARCH_PATH:
+			monitor = Gio.File.new_for_path(path).monitor_directory(
+				Gio.FileMonitorFlags.NONE,
+				None
+			)
+			self.monitors.append(
+				(monitor, monitor.connect("changed", self.on_search_path_changed))
+			)
+		
+		self.blacklist_handler = SETTINGS.connect("changed::autostart-ignore", self.on_blacklist_changed)
+	
+	def stop_monitoring(self):
+		"""
+		Stops what start_monitoring() started, and the pending refresh.
+		"""
+		
+		for monitor, handler in getattr(self, "monitors", ()):
+			monitor.disconnect(handler)
+			monitor.cancel()
+		self.monitors = []
+		
+		if getattr(self, "blacklist_handler", None) is not None:
+			SETTINGS.disconnect(self.blacklist_handler)
+		self.blacklist_handler = None
+		
+		if getattr(self, "refresh_source", None) is not None:
+			GLib.source_remove(self.refresh_source)
+		self.refresh_source = None
 	
 	def on_scene_asked_to_close(self):
 		"""
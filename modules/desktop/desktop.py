@@ -20,21 +20,77 @@
 #
 
 import os
+import time
 import quickstart
 import configparser
 
-from gi.repository import GdkPixbuf, GObject, Gio, Gtk, Gdk
+from collections import OrderedDict
+
+from concurrent.futures import ThreadPoolExecutor
+
+from gi.repository import GObject, Gio, Gtk, Gdk, GLib
 
 from veracc.utils import Settings
 
-SUPPORTED_MIMETYPES = (
-	"image/bmp",
-	"image/gif",
-	"image/jpeg",
-	"image/x-portable-bitmap",
-	"image/png",
-	"image/xbm",
-)
+import veracc.wallpapers as wallpapers
+import veracc.thumbnails as thumbnails
+import veracc.wallpaperindex as wallpaperindex
+import veracc.wallpapercache as wallpapercache
+import veracc.wallpapercolor as wallpapercolor
+import veracc.wallpaperrotation as wallpaperrotation
+
+SUPPORTED_MIMETYPES = wallpaperindex.SUPPORTED_MIMETYPES
+
+# Size of the wallpaper previews
+THUMBNAIL_WIDTH = 150
+THUMBNAIL_HEIGHT = 200
+
+# Number of workers decoding the previews
+DECODE_WORKERS = os.cpu_count() or 1
+
+# Rows of previews decoded ahead of the visible region (in the scroll
+# direction) and behind it
+PREFETCH_ROWS_AHEAD = 3
+PREFETCH_ROWS_BEHIND = 1
+
+# Previews farther than this (in rows) from the visible region are dropped
+KEEP_ROWS = 10
+
+# Memory budget (in bytes) of the previews in the list. When it's
+# exceeded, the least recently seen previews outside of the visible
+# region are dropped (they're loaded again from the thumbnail cache
+# when needed). Can be overridden with VERACC_PREVIEW_BUDGET.
+PREVIEW_BUDGET = int(os.environ.get("VERACC_PREVIEW_BUDGET", 16 * 1024 * 1024))
+
+# Set VERACC_DEBUG to print the memory usage of the previews
+DEBUG = bool(os.environ.get("VERACC_DEBUG"))
+
+# Minimum interval (in seconds) between scan progress updates
+SCAN_PROGRESS_INTERVAL = 0.1
+
+# Time (in milliseconds) without changes in the monitored directories
+# before the changes are applied
+MONITOR_DEBOUNCE = 500
+
+# Maximum number of monitored directories. Every monitor takes an inotify
+# watch, and those are limited per user: the shallowest directories are
+# monitored first, the changes in the other ones are picked up by a
+# refresh.
+MAX_MONITORS = 256
+
+# Number of placeholders added to the list in a single main loop iteration
+PLACEHOLDER_BATCH = 200
+
+# Returned by decode_wallpaper() for images over the pixel budget, and
+# for the ones that weren't wanted anymore when their turn came
+TOO_LARGE = "too-large"
+SKIPPED = "skipped"
+
+# wallpaper_list columns
+COLUMN_PATH = 0
+COLUMN_THUMBNAIL = 1
+COLUMN_INFO = 2
+COLUMN_TOOLTIP = 3
 
 class Properties(GObject.GObject):
 	"""
@@ -111,7 +167,7 @@ class Scene(quickstart.scenes.BaseScene):
 
 	wallpapers = {}
 	
-	infos = configparser.ConfigParser()
+	infos = configparser.ConfigParser(interpolation=None)
 	
 	properties = Properties()
 		
@@ -140,11 +196,14 @@ class Scene(quickstart.scenes.BaseScene):
 		of the wallpaper).
 		"""
 		
+		# Copies are shown as a single wallpaper
+		path = self.duplicates.get(path, path)
+		
 		if path in self.wallpapers:
 			self.objects.wallpapers.select_path(self.objects.wallpaper_list.get_path(self.wallpapers[path]))
 
 			# Show/Hide the About button
-			if os.path.basename(self.objects.wallpaper_list.get_value(self.get_selection(), 0)) in self.infos:
+			if self.objects.wallpaper_list.get_value(self.get_selection(), COLUMN_INFO):
 				GObject.idle_add(self.objects.about_button.show)
 			else:
 				GObject.idle_add(self.objects.about_button.hide)
@@ -177,13 +236,15 @@ class Scene(quickstart.scenes.BaseScene):
 			window.set_preview_widget_active(True)
 		
 		try:
-			pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(
+			# Never decode at full size
+			pixbuf = thumbnails.decode_scaled(
 				window.get_preview_filename(),
-				150,
-				200,
-				True
+				THUMBNAIL_WIDTH,
+				THUMBNAIL_HEIGHT
 			)
 			self.objects.preview.set_from_pixbuf(pixbuf)
+		except thumbnails.ImageTooLarge:
+			self.objects.preview.set_from_icon_name("image-missing", Gtk.IconSize.DIALOG)
 		except:
 			window.set_preview_widget_active(False)
 	
@@ -204,21 +265,9 @@ class Scene(quickstart.scenes.BaseScene):
 						# Already there!
 						continue
 					
-					include = self.settings.get_strv("background-include")
-					exclude = self.settings.get_strv("background-exclude")
-					
-					if wall in exclude:
-						# Already excluded, so we can simply remove it
-						# from the list
-						exclude.remove(wall)
-					elif wall not in include:
-						# Not excluded, append to the include list
-						include.append(wall)
+					wallpapers.include_wallpaper(self.settings, wall)
 					
 					self.add_wallpaper_to_list(wall)
-
-					self.settings.set_strv("background-include", include)
-					self.settings.set_strv("background-exclude", exclude)
 				else:
 					# Entire directories, append them to the search path
 					
@@ -302,15 +351,9 @@ class Scene(quickstart.scenes.BaseScene):
 		wall = self.objects.wallpaper_list.get_value(itr, 0)
 		
 		# If wallpaper is in background-include, remove from there.
-		# Otherwise, add an exclusion rule
-		include = self.settings.get_strv("background-include")
-		if wall in include:
-			include.remove(wall)
-			self.settings.set_strv("background-include", include)
-		else:
-			exclude = self.settings.get_strv("background-exclude")
-			exclude.append(wall)
-			self.settings.set_strv("background-exclude", exclude)
+		# Otherwise, add an exclusion rule. Its copies go as well.
+		for path in [wall] + self.alternates.get(wall, []):
+			wallpapers.exclude_wallpaper(self.settings, path)
 		
 		new = self.objects.wallpaper_list.iter_next(itr)
 		if not new:
@@ -326,8 +369,7 @@ class Scene(quickstart.scenes.BaseScene):
 			self.objects.wallpapers.select_path(path)
 			self.objects.wallpapers.emit("item_activated", path)
 		
-		self.objects.wallpaper_list.remove(itr)
-		del self.wallpapers[wall]
+		self.remove_wallpaper_from_list(wall)
 	
 	def on_wallpapers_item_activated(self, widget, path):
 		"""
@@ -335,9 +377,9 @@ class Scene(quickstart.scenes.BaseScene):
 		"""
 				
 		itr = self.objects.wallpaper_list.get_iter(path)
-		wall = self.objects.wallpaper_list.get_value(itr, 0)
+		wall = self.objects.wallpaper_list.get_value(itr, COLUMN_PATH)
 		# Show/Hide the About button
-		if os.path.basename(wall) in self.infos:
+		if self.objects.wallpaper_list.get_value(itr, COLUMN_INFO):
 			GObject.idle_add(self.objects.about_button.show)
 		else:
 			GObject.idle_add(self.objects.about_button.hide)
@@ -351,84 +393,762 @@ class Scene(quickstart.scenes.BaseScene):
 			current_wallpapers[self.properties.current_selected_monitor-1] = wall
 		
 		self.properties.set_property("current-wallpapers", current_wallpapers)
+		
+		self.apply_wallpaper_color(current_wallpapers[0])
+		self.prepare_scaled_wallpapers()
+	
+	def apply_wallpaper_color(self, path):
+		"""
+		Sets vera-color to the colour of the given wallpaper, if it has
+		to follow the wallpaper (see wallpapercolor).
+		"""
+		
+		color = self.colors.get(path)
+		if color is not None:
+			wallpapercolor.apply_color(self.settings, color)
+		else:
+			# Not extracted yet, do it before scaling
+			self.scale_pool.submit(self.compute_wallpaper_color, path)
+	
+	def compute_wallpaper_color(self, path):
+		"""
+		Extracts the colour of the given wallpaper and applies it.
+		
+		This runs in the scaling worker.
+		"""
+		
+		color = self.colors.compute(path)
+		self.colors.save()
+		
+		GObject.idle_add(wallpapercolor.apply_color, self.settings, color)
+	
+	def on_background_random_enabled_changed(self, settings, key):
+		"""
+		Fired when the random rotation has been enabled or disabled.
+		"""
+		
+		# The scheduler exits by itself when it's disabled
+		if settings.get_boolean(key):
+			wallpaperrotation.start()
+	
+	def prepare_scaled_wallpapers(self, *args):
+		"""
+		Pre-scales the current wallpapers for every monitor, in the
+		background (see wallpapercache).
+		"""
+		
+		mode = self.settings.get_string("background-mode")
+		screen = Gdk.Screen.get_default()
+		
+		# In device pixels
+		monitors = []
+		scale = 1
+		for monitor in range(0, self.monitor_number):
+			geometry = screen.get_monitor_geometry(monitor)
+			factor = screen.get_monitor_scale_factor(monitor)
+			monitors.append((geometry.width * factor, geometry.height * factor))
+			scale = max(scale, factor)
+		
+		variants = wallpapercache.get_variants(
+			self.properties.current_wallpapers,
+			mode,
+			monitors,
+			(screen.get_width() * scale, screen.get_height() * scale)
+		)
+		if not variants:
+			return
+		
+		# Supersede what's still queued
+		self.scale_generation += 1
+		self.scale_pool.submit(self.scale_wallpapers, variants, mode, self.scale_generation)
+	
+	def scale_wallpapers(self, variants, mode, generation):
+		"""
+		Renders the given (path, width, height) variants in the cache.
+		
+		This runs in the scaling worker.
+		"""
+		
+		for path, width, height in variants:
+			if generation != self.scale_generation:
+				# The wallpaper changed again in the meantime
+				return
+			
+			wallpapercache.prepare(path, width, height, mode)
+		
+		wallpapercache.prune()
 
-	def add_wallpaper_to_list(self, path, set=False):
+	def is_supported(self, path):
 		"""
-		Appends the given wallpaper to the list.
-		"""
-		
-		if Gio.File.new_for_path(path).query_info(
-			Gio.FILE_ATTRIBUTE_STANDARD_CONTENT_TYPE,
-			Gio.FileQueryInfoFlags.NONE
-		).get_content_type() in SUPPORTED_MIMETYPES:
-			try:
-				itr = self.objects.wallpaper_list.append(
-					(
-						path,
-						GdkPixbuf.Pixbuf.new_from_file_at_scale(
-							path,
-							150,
-							200,
-							True
-						)
-					)
-				)
-				
-				self.wallpapers[path] = itr
-				
-				if set:
-					self.set_selection(path)
-			except:
-				pass
+		Returns True if the given file is a supported image.
+		"""
+		
+		# Trust the extension, sniff only if needed
+		return wallpaperindex.get_content_type(
+			path,
+			os.path.basename(path),
+			None
+		) in SUPPORTED_MIMETYPES and not thumbnails.has_failed(path)
 	
-	def load_wallpaperpack(self, path):
+	def decode_wallpaper(self, path):
 		"""
-		Loads the given wallpaperpack.
+		Returns the thumbnails.PixbufData of the preview of the given
+		wallpaper, TOO_LARGE if it's over the pixel budget, or None if it
+		can't be decoded (now, or the last time we tried).
+		
+		This runs in the decoding workers: GdkPixbuf releases the GIL
+		while decoding, so the workers scale with the available cores.
+		Requests for previews that were scrolled away in the meantime
+		are skipped (SKIPPED is returned).
 		"""
 		
+		if not path in self.wanted:
+			return SKIPPED
+		elif thumbnails.has_failed(path):
+			return None
+		
 		try:
-			self.infos.read(path)
-		except:
-			# FIXME: Implement true logging
-			print("Unable to load wallpaperpack %s" % path)
+			# Use the shared thumbnail, the full image is decoded
+			# only if there isn't a valid one
+			thumbnail = thumbnails.get_thumbnail(path)
+			
+			# Extract its colour while we're at it, so that it can
+			# be applied right away
+			self.colors.update(path, thumbnail)
+			
+			return thumbnails.to_data(
+				thumbnails.scale_to_fit(
+					thumbnail,
+					THUMBNAIL_WIDTH,
+					THUMBNAIL_HEIGHT
+				)
+			)
+		except thumbnails.ImageTooLarge:
+			return TOO_LARGE
+		except (GLib.Error, OSError):
+			return None
+	
+	def queue_wallpaper(self, path):
+		"""
+		Queues the preview of the given wallpaper for decoding.
+		"""
+		
+		self.pending.add(path)
+		self.pool.submit(self.decode_wallpaper, path).add_done_callback(
+			lambda future: GObject.idle_add(self.on_wallpaper_decoded, path, future.result())
+		)
+	
+	def on_wallpaper_decoded(self, path, data):
+		"""
+		Sets the decoded preview of the given wallpaper.
+		"""
+		
+		self.pending.discard(path)
+		
+		if not path in self.wallpapers or not path in self.wanted:
+			# Removed or scrolled away
+			return False
+		elif data == SKIPPED:
+			# Wanted again in the meantime, keep the placeholder and
+			# let update_visible() queue it again
+			self.queue_visible_update()
+			return False
+		elif data is None:
+			# Not an image after all
+			self.remove_wallpaper_from_list(path)
+			return False
+		
+		self.objects.wallpaper_list.set_value(
+			self.wallpapers[path],
+			COLUMN_THUMBNAIL,
+			# Flag the images we refused to decode. The pixels of the
+			# others are not copied.
+			self.too_large if data == TOO_LARGE else thumbnails.from_data(data)
+		)
+		
+		# The flag icon is shared, it doesn't count
+		size = 0 if data == TOO_LARGE else data.rowstride * data.height
+		self.previews_size += size - self.previews.get(path, 0)
+		self.previews[path] = size
+		
+		self.evict_previews()
+		
+		return False
+	
+	def drop_preview(self, path):
+		"""
+		Replaces the preview of the given wallpaper with the placeholder.
+		"""
+		
+		self.previews_size -= self.previews.pop(path)
+		
+		if path in self.wallpapers:
+			self.objects.wallpaper_list.set_value(
+				self.wallpapers[path],
+				COLUMN_THUMBNAIL,
+				self.placeholder
+			)
+	
+	def evict_previews(self):
+		"""
+		Drops the least recently seen previews outside of the visible
+		region until the previews fit in PREVIEW_BUDGET.
+		"""
+		
+		if self.previews_size > PREVIEW_BUDGET:
+			for path in list(self.previews):
+				if self.previews_size <= PREVIEW_BUDGET:
+					break
+				elif not path in self.visible:
+					self.drop_preview(path)
+		
+		if DEBUG:
+			print(
+				"Previews: %d, %.1f of %.1f MiB" % (
+					len(self.previews),
+					self.previews_size / 1048576,
+					PREVIEW_BUDGET / 1048576
+				)
+			)
+	
+	def queue_visible_update(self, *args):
+		"""
+		Schedules an update_visible() call.
+		"""
+		
+		if self.visible_source is None:
+			self.visible_source = GObject.idle_add(self.update_visible)
+	
+	def update_visible(self):
+		"""
+		Queues the decoding of the previews in (or near) the visible
+		region of the IconView, nearest first and prioritizing the
+		scroll direction, and drops the previews that are far away.
+		"""
+		
+		self.visible_source = None
+		
+		visible = self.objects.wallpapers.get_visible_range()
+		if not visible:
+			return False
+		
+		model = self.objects.wallpaper_list
+		count = len(model)
+		columns = max(1, self.objects.wallpapers.get_columns())
+		start, end = visible[0].get_indices()[0], visible[1].get_indices()[0]
+		
+		# Scroll direction
+		value = self.objects.scrolledwindow1.get_vadjustment().get_value()
+		forward = (value >= self.last_scroll_value)
+		self.last_scroll_value = value
+		
+		ahead = PREFETCH_ROWS_AHEAD * columns
+		behind = PREFETCH_ROWS_BEHIND * columns
+		if forward:
+			first, last = max(0, start - behind), min(count - 1, end + ahead)
+		else:
+			first, last = max(0, start - ahead), min(count - 1, end + behind)
+		
+		# Visible items first, then the prefetched ones in the scroll
+		# direction, then the others
+		order = list(range(start, end + 1))
+		if forward:
+			order += list(range(end + 1, last + 1)) + list(range(start - 1, first - 1, -1))
+		else:
+			order += list(range(start - 1, first - 1, -1)) + list(range(end + 1, last + 1))
+		
+		self.wanted = set(model[index][COLUMN_PATH] for index in range(first, last + 1))
+		self.visible = set(model[index][COLUMN_PATH] for index in range(start, end + 1))
+		
+		for index in order:
+			path = model[index][COLUMN_PATH]
+			if path in self.previews:
+				# Seen, so recently used
+				self.previews.move_to_end(path)
+			elif not path in self.pending:
+				self.queue_wallpaper(path)
+		
+		# Drop the previews far away
+		keep = KEEP_ROWS * columns
+		for index in list(range(0, max(0, first - keep))) + list(range(last + keep + 1, count)):
+			path = model[index][COLUMN_PATH]
+			if path in self.previews:
+				self.drop_preview(path)
+		
+		return False
+	
+	def add_placeholders(self, paths, default=None, cancellable=None):
+		"""
+		Adds the given wallpapers to the list, with a placeholder in
+		place of the preview (see update_visible()).
+		If default is in paths, it gets selected.
+		
+		Nothing is added if cancellable (the token of the scan that found
+		the wallpapers) has been cancelled.
+		"""
+		
+		if cancellable and cancellable.is_cancelled():
+			return False
+		
+		for path in paths:
+			if path in self.wallpapers:
+				continue
+			
+			self.wallpapers[path] = self.objects.wallpaper_list.append(
+				(
+					path,
+					self.placeholder,
+					os.path.basename(path) in self.infos,
+					self.get_tooltip(path)
+				)
+			)
+		
+		if default in paths:
+			self.set_selection(default)
+		
+		self.queue_visible_update()
+		
+		return False
+	
+	def get_tooltip(self, path):
+		"""
+		Returns the tooltip of the given wallpaper: its path, and the
+		paths of its copies.
+		"""
+		
+		return "\n".join(
+			GLib.markup_escape_text(x) for x in [path] + self.alternates.get(path, [])
+		)
+	
+	def set_alternates(self, alternates, shown, cancellable):
+		"""
+		Sets the copies of the wallpapers in the list (see
+		wallpaperindex.WallpaperIndex.find_duplicates()), removing them
+		from the list, unless cancellable has been cancelled.
+		
+		shown are the wallpapers hidden before that aren't copies
+		anymore, they're added back.
+		"""
+		
+		if cancellable.is_cancelled():
+			return False
+		
+		changed = set(self.alternates) | set(alternates)
+		
+		self.alternates = alternates
+		self.duplicates = {
+			alternate : path
+			for path, group in alternates.items()
+			for alternate in group
+		}
+		
+		selected = None
+		for path in self.duplicates:
+			if path in self.wallpapers:
+				self.remove_wallpaper_from_list(path)
+				if path in self.properties.current_wallpapers:
+					selected = path
+		
+		self.add_placeholders(shown)
+		
+		# Picked while we were looking for copies, select the one shown
+		if selected:
+			self.set_selection(selected)
+		
+		for path in changed:
+			if path in self.wallpapers:
+				self.objects.wallpaper_list.set_value(
+					self.wallpapers[path],
+					COLUMN_TOOLTIP,
+					self.get_tooltip(path)
+				)
+		
+		return False
+	
+	def add_wallpaper_to_list(self, path, set=False):
+		"""
+		Appends the given wallpaper to the list, right away.
+		"""
+		
+		if self.is_supported(path):
+			self.add_placeholders([path], path if set else None)
 	
-	@quickstart.threads.thread
 	def populate_wallpapers(self):
 		"""
 		Populates the wallpaper_list.
+		
+		The scan runs in a thread; a new scan supersedes the running one.
 		"""
 		
+		# Cancel the running scan, if any
+		if self.scan_cancellable:
+			self.scan_cancellable.cancel()
+		self.scan_cancellable = Gio.Cancellable()
+		self.scan_interrupted = False
+		
 		# Clear things up
 		self.wallpapers = {}
+		self.alternates = {}
+		self.duplicates = {}
+		self.previews = OrderedDict()
+		self.previews_size = 0
+		self.wanted = set()
+		self.visible = set()
 		self.objects.wallpaper_list.clear()
 		
-		excluded = self.settings.get_strv("background-exclude")
+		# Show the progress
+		self.scan_last_progress = 0
+		self.objects.scan_label.set_text(_("Looking for wallpapers..."))
+		self.objects.scan_spinner.start()
+		self.objects.scan_spinner.show()
+		self.objects.scan_box.show()
+		
+		self.scan_wallpapers(self.scan_cancellable)
+	
+	def on_scan_progress(self, cancellable, directories, wallpapers):
+		"""
+		Shows the progress of the scan.
+		"""
+		
+		if not cancellable.is_cancelled():
+			self.objects.scan_label.set_text(
+				_("Looking for wallpapers... %(directories)d folders, %(wallpapers)d images") % {
+					"directories" : directories,
+					"wallpapers" : wallpapers
+				}
+			)
+		
+		return False
+	
+	def on_scan_listed(self, cancellable):
+		"""
+		Fired when the wallpapers found by a scan have been queued for
+		the list (the copies are still being looked for).
+		"""
+		
+		if not cancellable.is_cancelled():
+			self.objects.wallpapers.set_sensitive(True)
+		
+		return False
+	
+	def on_scan_finished(self, cancellable, truncated):
+		"""
+		Fired when a scan is finished.
+		"""
+		
+		if cancellable.is_cancelled():
+			return False
+		
+		# Not running anymore
+		self.scan_cancellable = None
+		
+		self.objects.scan_spinner.stop()
+		if not truncated:
+			self.objects.scan_box.hide()
+		else:
+			# Keep the box, tell why something may be missing
+			self.objects.scan_spinner.hide()
+			self.objects.scan_label.set_text(
+				_("Some folders are too large or too deep: not every wallpaper is shown.")
+			)
+		
+		self.objects.wallpapers.set_sensitive(True)
+		
+		return False
+	
+	def refresh_wallpapers(self):
+		"""
+		Rescans for wallpapers and updates the list with what changed,
+		without clearing it.
+		"""
+		
+		if self.scan_cancellable:
+			self.scan_cancellable.cancel()
+		self.scan_cancellable = Gio.Cancellable()
+		
+		self.scan_wallpapers(self.scan_cancellable, refresh=True)
+	
+	def sync_wallpapers(self, paths, cancellable):
+		"""
+		Adds and removes wallpapers so that the list matches paths.
+		"""
+		
+		if cancellable.is_cancelled():
+			return False
+		
+		# Keep the wallpapers in use, even if they've been added from
+		# outside of the search paths (see set_selection())
+		wanted = set(paths) | set(self.properties.current_wallpapers)
+		
+		self.apply_changes(
+			[path for path in paths if not path in self.wallpapers],
+			[path for path in self.wallpapers if not path in wanted],
+			[],
+			cancellable
+		)
+		
+		return False
+	
+	@quickstart.threads.thread
+	def scan_wallpapers(self, cancellable, refresh=False):
+		"""
+		Scans for wallpapers and adds them to the list, unless cancellable
+		gets cancelled.
+		
+		If refresh is True, the list is updated with what changed (see
+		sync_wallpapers()) rather than populated.
+		"""
+		
+		excluded = set(self.settings.get_strv("background-exclude"))
 		include = self.settings.get_strv("background-include")
 		
 		default = self.settings.get_strv("image-path")[0]
 		
-		for directory in self.settings.get_strv("background-search-paths"):
-			for root, dirs, files in os.walk(directory):
-				for wall in files:
-					path = os.path.join(root, wall)
-					if not os.path.exists(path) or path in excluded: continue
-					
-					# .wallpaperpack file?
-					if wall.endswith(".wallpaperpack"):
-						# Load it
-						self.load_wallpaperpack(path)
-					
-					GObject.idle_add(self.add_wallpaper_to_list, path, (path == default))
+		def progress(directories, wallpapers):
+			# Update the label at most every SCAN_PROGRESS_INTERVAL
+			now = time.monotonic()
+			if now - self.scan_last_progress >= SCAN_PROGRESS_INTERVAL:
+				self.scan_last_progress = now
+				GObject.idle_add(self.on_scan_progress, cancellable, directories, wallpapers)
+		
+		max_depth, max_wallpapers = wallpaperindex.get_scan_limits(self.settings)
+		
+		# Only the directories changed since the last time are listed
+		result = self.index.scan(
+			self.settings.get_strv("background-search-paths"),
+			cancellable,
+			progress,
+			max_depth=max_depth,
+			max_wallpapers=max_wallpapers
+		)
+		
+		entries = [
+			entry for entry in result.wallpapers
+			if entry.content_type in SUPPORTED_MIMETYPES and not entry.path in excluded
+		]
+		
+		if cancellable.is_cancelled():
+			self.index.save()
+			return
+		
+		# Load the .wallpaperpack informations first, so that the
+		# info flag of the wallpapers is right
+		self.infos.read_dict(result.infos)
+		
+		# The copies found by the previous scan stay hidden until
+		# we know better
+		hidden = set(self.duplicates) if refresh else set()
+		paths = [entry.path for entry in entries if not entry.path in hidden]
+		seen = set(paths) | hidden
 		
 		# Add to the Included wallpapers
 		for wallpaper in include:
-			if not os.path.exists(wallpaper):
-				continue
-
-			GObject.idle_add(self.add_wallpaper_to_list, wallpaper, (path == default))
+			if not wallpaper in seen and os.path.exists(wallpaper) and self.is_supported(wallpaper):
+				seen.add(wallpaper)
+				paths.append(wallpaper)
+		
+		if refresh:
+			GObject.idle_add(self.sync_wallpapers, paths, cancellable)
+		else:
+			for index in range(0, len(paths), PLACEHOLDER_BATCH):
+				GObject.idle_add(self.add_placeholders, paths[index:index+PLACEHOLDER_BATCH], default, cancellable)
+		
+		GObject.idle_add(self.on_scan_listed, cancellable)
+		GObject.idle_add(self.monitor_directories, result.directories, cancellable)
+		
+		# Then show the copies of the same image once (the current
+		# wallpaper wins), so that they're decoded once. This may need
+		# to decode the images, the list is usable in the meantime.
+		alternates = self.index.find_duplicates(
+			entries,
+			cancellable,
+			self.settings.get_strv("image-path")
+		)
+		self.index.save()
+		
+		copies = set(alternate for group in alternates.values() for alternate in group)
+		GObject.idle_add(
+			self.set_alternates,
+			alternates,
+			[entry.path for entry in entries if entry.path in hidden and not entry.path in copies],
+			cancellable
+		)
+		GObject.idle_add(self.on_scan_finished, cancellable, result.truncated)
+	
+	def monitor_directories(self, directories, cancellable=None):
+		"""
+		Monitors the given directories (replacing the directories
+		monitored before), unless cancellable has been cancelled.
+		"""
+		
+		if cancellable and cancellable.is_cancelled():
+			return False
+		
+		self.stop_monitoring()
+		# Shallowest first, see MAX_MONITORS
+		self.monitored_directories = sorted(directories, key=lambda x: x.count(os.sep))
+		self.start_monitoring()
+		
+		return False
+	
+	def start_monitoring(self):
+		"""
+		Starts monitoring the directories in self.monitored_directories.
+		"""
+		
+		for directory in self.monitored_directories:
+			self.monitor_directory(directory)
+	
+	def monitor_directory(self, directory):
+		"""
+		Starts monitoring the given directory.
+		"""
+		
+		if directory in self.monitors:
+			return
+		elif len(self.monitors) >= MAX_MONITORS:
+			if not self.monitors_exhausted:
+				self.monitors_exhausted = True
+				print("Too many wallpaper folders: only %d of them are monitored" % MAX_MONITORS)
+			return
+		
+		try:
+			monitor = Gio.File.new_for_path(directory).monitor_directory(
+				Gio.FileMonitorFlags.NONE,
+				None
+			)
+		except:
+			print("Unable to monitor %s" % directory)
+			return
+		
+		monitor.connect("changed", self.on_wallpaper_directory_changed)
+		self.monitors[directory] = monitor
+	
+	def stop_monitoring(self):
+		"""
+		Stops monitoring every directory, and drops the pending changes.
+		"""
+		
+		for monitor in self.monitors.values():
+			monitor.cancel()
+		self.monitors = {}
+		self.monitors_exhausted = False
+		
+		self.monitor_changes = {}
+		if self.monitor_source is not None:
+			GLib.source_remove(self.monitor_source)
+			self.monitor_source = None
+	
+	def on_wallpaper_directory_changed(self, monitor, file, other_file, event_type):
+		"""
+		Fired when something changed in a monitored directory.
+		"""
+		
+		if event_type in (Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.CHANGES_DONE_HINT):
+			created = True
+		elif event_type == Gio.FileMonitorEvent.DELETED:
+			created = False
+		else:
+			return
+		
+		# Changes usually come in bursts (e.g. when copying a lot of
+		# photos), so collect them and apply them when things calm down
+		self.monitor_changes[file.get_path()] = created
+		self.monitor_last_change = time.monotonic()
+		if self.monitor_source is None:
+			self.monitor_source = GLib.timeout_add(MONITOR_DEBOUNCE, self.on_monitor_timeout)
+	
+	def on_monitor_timeout(self):
+		"""
+		Applies the collected changes, if nothing changed in the last
+		MONITOR_DEBOUNCE milliseconds.
+		"""
+		
+		if time.monotonic() - self.monitor_last_change < MONITOR_DEBOUNCE / 1000:
+			# Still busy, check again later
+			return True
+		
+		self.monitor_source = None
+		
+		changes = self.monitor_changes
+		self.monitor_changes = {}
+		
+		self.process_changes(changes, self.scan_cancellable)
+		
+		return False
+	
+	@quickstart.threads.thread
+	def process_changes(self, changes, cancellable):
+		"""
+		Finds out what to add to and remove from the list, given the
+		changes collected by on_wallpaper_directory_changed().
+		"""
+		
+		excluded = set(self.settings.get_strv("background-exclude"))
+		max_depth, max_wallpapers = wallpaperindex.get_scan_limits(self.settings)
+		
+		added = []
+		removed = []
+		directories = []
+		for path, created in changes.items():
+			if not created or not os.path.exists(path):
+				removed.append(path)
+			elif os.path.isdir(path):
+				# New directory, scan it
+				result = self.index.scan(
+					[path],
+					cancellable,
+					max_depth=max_depth,
+					max_wallpapers=max_wallpapers,
+					prune=False
+				)
+				added.extend(
+					entry.path for entry in result.wallpapers
+					if entry.content_type in SUPPORTED_MIMETYPES and not entry.path in excluded
+				)
+				directories.extend(result.directories)
+			elif not path in excluded and self.is_supported(path):
+				added.append(path)
+		
+		GObject.idle_add(self.apply_changes, added, removed, directories, cancellable)
+	
+	def apply_changes(self, added, removed, directories, cancellable):
+		"""
+		Applies the changes found by process_changes() to the list.
+		"""
+		
+		if cancellable and cancellable.is_cancelled():
+			return False
+		
+		for path in removed:
+			# A removed directory takes its wallpapers (and
+			# subdirectories) with it
+			prefix = path + os.sep
+			for wallpaper in [x for x in self.wallpapers if x == path or x.startswith(prefix)]:
+				self.remove_wallpaper_from_list(wallpaper)
+			
+			for directory in [x for x in self.monitors if x == path or x.startswith(prefix)]:
+				self.monitors.pop(directory).cancel()
+				self.monitored_directories.remove(directory)
+		
+		for directory in directories:
+			if not directory in self.monitored_directories:
+				self.monitored_directories.append(directory)
+			self.monitor_directory(directory)
+		
+		for index in range(0, len(added), PLACEHOLDER_BATCH):
+			self.add_placeholders(added[index:index+PLACEHOLDER_BATCH])
+		
+		return False
+	
+	def remove_wallpaper_from_list(self, path):
+		"""
+		Removes the given wallpaper from the list.
+		"""
 		
-		#GObject.idle_add(self.set_selection, self.settings.get_strv("image-path")[0])
-		GObject.idle_add(self.objects.wallpapers.set_sensitive, True)
+		self.objects.wallpaper_list.remove(self.wallpapers.pop(path))
+		if path in self.previews:
+			self.previews_size -= self.previews.pop(path)
 	
 	def on_current_selected_monitor_changed(self, properties, param):
 		"""
@@ -454,7 +1174,72 @@ class Scene(quickstart.scenes.BaseScene):
 		
 		self.scene_container = self.objects.main
 		
-		self.objects.wallpapers.set_pixbuf_column(1)
+		# Wallpaper index, and the token of the running scan
+		self.index = wallpaperindex.WallpaperIndex()
+		self.scan_cancellable = None
+		self.scan_interrupted = False
+		
+		# Copies of the same image: wallpaper in the list -> paths of
+		# its copies, and copy -> wallpaper in the list
+		self.alternates = {}
+		self.duplicates = {}
+		
+		# Monitored directories (directory -> Gio.FileMonitor), and the
+		# changes waiting to be applied
+		self.monitors = {}
+		self.monitors_exhausted = False
+		self.monitored_directories = []
+		self.monitor_changes = {}
+		self.monitor_last_change = 0
+		self.monitor_source = None
+		
+		# Preview decoding workers
+		self.pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS)
+		
+		# Wallpaper pre-scaling worker, and the generation of the latest
+		# request (older ones are skipped)
+		self.scale_pool = ThreadPoolExecutor(max_workers=1)
+		self.scale_generation = 0
+		
+		# Colours of the wallpapers, for vera-color
+		self.colors = wallpapercolor.ColorCache()
+		
+		# Previews are decoded only near the visible region: these are
+		# the paths we want a preview for, the ones actually visible, the
+		# ones being decoded and the ones that have their preview in the
+		# list (path -> size in bytes, least recently seen first)
+		self.wanted = set()
+		self.visible = set()
+		self.pending = set()
+		self.previews = OrderedDict()
+		self.previews_size = 0
+		self.visible_source = None
+		self.last_scroll_value = 0
+		
+		try:
+			self.placeholder = Gtk.IconTheme.get_default().load_icon(
+				"image-x-generic",
+				64,
+				0
+			)
+		except:
+			self.placeholder = None
+		
+		# Shown in place of the images over the pixel budget
+		try:
+			self.too_large = Gtk.IconTheme.get_default().load_icon(
+				"image-missing",
+				64,
+				0
+			)
+		except:
+			self.too_large = self.placeholder
+		
+		vadjustment = self.objects.scrolledwindow1.get_vadjustment()
+		vadjustment.connect("value-changed", self.queue_visible_update)
+		vadjustment.connect("changed", self.queue_visible_update)
+		
+		self.objects.wallpapers.set_pixbuf_column(COLUMN_THUMBNAIL)
 		
 		self.settings = Settings("org.semplicelinux.vera.desktop")
 		self.openbox_settings = Settings("org.semplicelinux.vera.openbox")
@@ -521,6 +1306,7 @@ class Scene(quickstart.scenes.BaseScene):
 			self.objects.background_mode,
 			"active_id"
 		)
+		self.settings.connect("changed::background-mode", self.prepare_scaled_wallpapers)
 		
 		# Background random enabled?
 		self.settings.bind(
@@ -528,6 +1314,7 @@ class Scene(quickstart.scenes.BaseScene):
 			self.objects.background_random_enabled,
 			"active"
 		)
+		self.settings.connect("changed::background-random-enabled", self.on_background_random_enabled_changed)
 		
 		# Background random timeout
 		self.settings.bind(
@@ -576,3 +1363,38 @@ class Scene(quickstart.scenes.BaseScene):
 		GObject.idle_add(self.objects.wallpapers.set_sensitive, False)
 		
 		self.populate_wallpapers()
+	
+	def on_scene_called(self):
+		"""
+		Fired when the scene has been called.
+		"""
+		
+		# Resume the scan if it has been interrupted when leaving
+		if self.scan_interrupted:
+			self.populate_wallpapers()
+		elif self.scan_cancellable is None:
+			# Catch up with what changed while we weren't monitoring
+			# (it's cheap, see wallpaperindex), then monitor again.
+			# Also decode what has been skipped.
+			self.refresh_wallpapers()
+			self.queue_visible_update()
+	
+	def on_scene_asked_to_close(self):
+		"""
+		Stops the running scan and the pending decodes.
+		"""
+		
+		if self.scan_cancellable:
+			self.scan_cancellable.cancel()
+			self.scan_cancellable = None
+			self.scan_interrupted = True
+		
+		# Nothing is wanted anymore, the workers will skip what's queued
+		self.wanted = set()
+		
+		# Don't monitor while the scene is not visible
+		self.stop_monitoring()
+		
+		self.colors.save()
+		
+		return True
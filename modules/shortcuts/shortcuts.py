@@ -25,16 +25,7 @@ from gi.repository import Gtk
 
 from veracc.utils import Settings
 
-# A bit hacky, but it seems we can't set directly the enum value in GSettings :(
-ALLOWED_ACTIONS = [
-	'PowerOff',
-	'Reboot',
-	'Suspend',
-	'Logout',
-	'Lock',
-	'Hibernate',
-	'Switch User'
-]
+import veracc.exitactions as exitactions
 
 @quickstart.builder.from_file("./modules/shortcuts/shortcuts.glade")
 class Scene(quickstart.scenes.BaseScene):
@@ -51,26 +42,14 @@ class Scene(quickstart.scenes.BaseScene):
 		Converts the exit action from dconf.
 		"""
 		
-		value = self.settings.get_enum("last-exit-action")
-		
-		if not self.settings.get_boolean("lock-last-exit-action"):
-			# Not locked, this is the "Last action" item
-			return 0
-		else:
-			return value
+		return exitactions.convert_exit_action_from_dconf(self.settings)
 	
 	def convert_exit_action_from_ui(self, value):
 		"""
 		Converts the exit action from the UI.
 		"""
-				
-		if value == 0:
-			# Not locked, unset lock-last-exit-action
-			self.settings.set_boolean("lock-last-exit-action", False)
-			return self.settings.get_string("last-exit-action")
-		else:
-			self.settings.set_boolean("lock-last-exit-action", True)
-			return ALLOWED_ACTIONS[value-1]
+		
+		return exitactions.convert_exit_action_from_ui(self.settings, value)
 	
 	def on_enable_launcher_toggled(self, checkbutton):
 		"""
@@ -25,6 +25,8 @@ from veracc.widgets.CommonFrame import CommonFrame
 
 from veracc.utils import Settings
 
+import veracc.fonts as fonts
+
 from gi.repository import Gtk, Gdk
 import quickstart
 
@@ -159,29 +161,21 @@ class WindowsFontsFrame(CommonFrame):
 		Updates every openbox font name by looking at the newly changed GTK+ one.
 		"""
 		
-		font_without_size = " ".join(settings.get_string(key).split(" ")[:-1])
-		
-		for place in ["activewindow", "inactivewindow", "menuitem", "onscreendisplay"]:
-			place = "font-%s" % place
-			self.openboxsettings.set_string(
-				place,
-				"%s %s" % (font_without_size, self.openboxsettings.get_string(place).split(" ")[-1])
-			)
+		fonts.propagate_font_name(settings.get_string(key), self.openboxsettings)
 	
 	def update_menuheader(self, openboxsettings, key):
 		"""
 		Updates the menu header setting.
 		"""
 		
-		openboxsettings.set_string("font-menuheader", openboxsettings.get_string(key))
+		fonts.propagate_openbox_font(openboxsettings, key)
 	
 	def update_onscreendisplay(self, openboxsettings, key):
 		"""
 		Updates the (active,inactive)onscreendisplay settings.
 		"""
-				
-		for place in ["activeonscreendisplay", "inactiveonscreendisplay"]:
-			openboxsettings.set_string("font-%s" % place, openboxsettings.get_string(key))
+		
+		fonts.propagate_openbox_font(openboxsettings, key)
 		
 	def __init__(self, settings, openboxsettings):
 		"""
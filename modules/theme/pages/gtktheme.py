@@ -25,6 +25,8 @@ from veracc.widgets.CommonFrame import CommonFrame
 
 from veracc.utils import Settings
 
+import veracc.wallpapercolor as wallpapercolor
+
 from gi.repository import Gtk, Gdk, GObject
 import quickstart
 
@@ -186,6 +188,33 @@ class GtkThemeFrame(CommonFrame):
 		self.main_container.pack_start(self.vera_color_selection, False, False, 2)
 		
 		self.get_alignment().add(self.main_container)
+		
+		# Pick the colour as soon as it's asked for
+		self.colors = wallpapercolor.ColorCache()
+		self.vera_color_enabled.connect("toggled", self.on_vera_color_source_changed)
+		self.vera_color_from_wallpaper.connect("toggled", self.on_vera_color_source_changed)
+	
+	def on_vera_color_source_changed(self, button):
+		"""
+		Fired when the vera color has been enabled, or the user chose to
+		pick it from the wallpaper.
+		"""
+		
+		if self.vera_color_enabled.get_active() and self.vera_color_from_wallpaper.get_active():
+			wallpaper = self.desktopsettings.get_strv("image-path")
+			if wallpaper and wallpaper[0]:
+				self.pick_color_from_wallpaper(wallpaper[0])
+	
+	@quickstart.threads.thread
+	def pick_color_from_wallpaper(self, path):
+		"""
+		Extracts the colour of the given wallpaper and applies it.
+		"""
+		
+		color = self.colors.compute(path)
+		self.colors.save()
+		
+		GObject.idle_add(wallpapercolor.apply_color, self.desktopsettings, color)
 
 class OpenboxThemeFrame(CommonFrame):
 	"""
@@ -22,11 +22,12 @@
 from gi.repository import Gtk, GMenu, GObject, Gio
 import quickstart
 import os
-import xdg.DesktopEntry
+
+import veracc.desktopcache as desktopcache
 
 from veracc.widgets.ApplicationSelectionDialog import ApplicationSelectionDialog
 
-CONFIG = os.path.expanduser("~/.config/tint2/secondary_config")
+import veracc.tint2config as tint2config
 
 #tr = quickstart.translations.Translation("tint2-panel-config")
 #tr.install()
@@ -120,41 +121,18 @@ class Scene(quickstart.scenes.BaseScene):
 		""" Fired when the back button has been pressed """
 		
 		settings = Gtk.Settings.get_default()
-		icon_theme = settings.get_property("gtk-icon-theme-name")
-		
-		if not os.path.exists(os.path.dirname(CONFIG)):
-			os.makedirs(os.path.dirname(CONFIG))
 		
-		with open(CONFIG, "w") as f:
-			if self.objects["position_combo"].get_active() != position_dict["bottom"]:
-				# Panel position. If it is Bottom do not save it.
-				# This avoids messing up with the panel position for those
-				# who already modified it in the *primary* config.
-				f.write("panel_position = %s left horizontal\n" % self.objects["combostore"][self.objects["position_combo"].get_active_iter()][1])
-				
-				# Ensure that windows can be on top of the panel if the position is top
-				if self.objects["position_combo"].get_active() == position_dict["top"]:
-					f.write("panel_layer = bottom\n")
-			if self.objects["Hide_checkbox"].get_active():
-				f.write("autohide = 1\n")
-				
-			if self.objects["ampm_enabled"].get_active():
-				f.write("time1_format = %I:%M %p\n")
-				
-			if self.objects["enabled_checkbox"].get_active():
-				f.write("panel_items = LTSC\n")
-			else:
-				f.write("panel_items = TSC\n")
-				
-			f.write("launcher_icon_theme = %s\n" % icon_theme)
-			
-			for treeiter in self.enabled_model:
-				f.write("launcher_item_app = %s\n" % treeiter[1])				
-			
-			if self.objects["inverted_scroll_actions"].get_active():
-				f.write("mouse_scroll_down = toggle\nmouse_scroll_up = iconify\n")
+		config = tint2config.default_config()
+		config["position"] = self.objects["combostore"][self.objects["position_combo"].get_active_iter()][1]
+		config["autohide"] = self.objects["Hide_checkbox"].get_active()
+		config["ampm"] = self.objects["ampm_enabled"].get_active()
+		config["launcher"] = self.objects["enabled_checkbox"].get_active()
+		config["icon-theme"] = settings.get_property("gtk-icon-theme-name")
+		config["launchers"] = [treeiter[1] for treeiter in self.enabled_model]
+		config["inverted-scroll"] = self.objects["inverted_scroll_actions"].get_active()
 		
-		os.system("killall -SIGUSR1 tint2")
+		tint2config.write_config(config)
+		tint2config.reload_panel()
 		
 		# Destroy application_selection_dialog
 		if self.application_selection_dialog:
@@ -221,70 +199,38 @@ class Scene(quickstart.scenes.BaseScene):
 		self.objects["position_combo"].set_active(position_dict["bottom"])
 
 		# Open config
-		if os.path.exists(CONFIG):
+		if os.path.exists(tint2config.CONFIG):
 			
-			up_inverted = False
-			down_inverted = False
+			config = tint2config.read_config()
+			
+			for path in config["launchers"]:
+				# A launcher!
+				try:
+					desktopentry = desktopcache.get_entry(path)
+					iconpath = desktopentry.getIcon()
+					if iconpath and iconpath.startswith("/"):
+						icon = Gio.Icon.new_for_string(iconpath)
+					elif iconpath:
+						icon = Gio.ThemedIcon.new(iconpath.replace(".png",""))
+					else:
+						icon = None
+					self.enabled_model.append((desktopentry.getName(), path, icon))
+				except Exception:
+					print("Error while loading configuration.")
+			
+			# Is the launcher enabled or not?
+			if config["launcher"]:
+				# YES!
+				self.objects["enabled_checkbox"].set_active(True)
+			else:
+				# No :/
+				GObject.idle_add(self.objects["enabled_box"].set_sensitive, False)
 			
-			with open(CONFIG) as f:
-				for line in f.readlines():
-					try:
-						line = line.split("=")
-						if line[0].startswith("launcher_item_app"):
-							# A launcher!
-							path = line[1].strip("\n").replace(" /","/",1)
-							desktopentry = xdg.DesktopEntry.DesktopEntry(path)
-							iconpath = desktopentry.getIcon()
-							if iconpath and iconpath.startswith("/"):
-								icon = Gio.Icon.new_for_string(iconpath)
-							elif iconpath:
-								icon = Gio.ThemedIcon.new(iconpath.replace(".png",""))
-							else:
-								icon = None
-							self.enabled_model.append((desktopentry.getName(), path, icon))
-						elif line[0].startswith("panel_items"):
-							# Is the launcher enabled or not?
-							if "L" in line[1]:
-								# YES!
-								self.objects["enabled_checkbox"].set_active(True)
-							else:
-								# No :/
-								GObject.idle_add(self.objects["enabled_box"].set_sensitive, False)
-						elif line[0].startswith("time1_format"):
-							# AM/PM?
-							if "%p" in line[1]:
-								# Yes!
-								self.objects["ampm_enabled"].set_active(True)
-							else:
-								# No
-								self.objects["ampm_enabled"].set_active(False)
-						elif line[0].startswith("autohide"):
-							# Autohide?
-							if "1" in line[1]:
-								# Yes
-								self.objects["Hide_checkbox"].set_active(True)
-							else:
-								# No
-								self.objects["Hide_checkbox"].set_active(False)
-						elif line[0].startswith("panel_position"):
-							# Position
-							splt = line[1].strip("\n").split(" ")
-							while splt.count(""):
-								splt.remove("")
-							self.objects["position_combo"].set_active(position_dict[splt[0]])
-						elif line[0].startswith("mouse_scroll_"):
-							# Mouse scroll (up/down) actions.
-							# Usually if they are on the secondary_config
-							# it's because they're inverted, but let's check
-							# anyways...
-							if "down" in line[0] and "toggle" in line[1]:
-								down_inverted = True
-							elif "up" in line[0] and "iconify" in line[1]:
-								up_inverted = True
-					except Exception:
-						print("Error while loading configuration.")
+			self.objects["ampm_enabled"].set_active(config["ampm"])
+			self.objects["Hide_checkbox"].set_active(config["autohide"])
+			self.objects["position_combo"].set_active(position_dict[config["position"]])
 			
-			self.objects["inverted_scroll_actions"].set_active(down_inverted and up_inverted)
+			self.objects["inverted_scroll_actions"].set_active(config["inverted-scroll"])
 
 		else:
 			# Ensure the enabled_checkbox is not active.
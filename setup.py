@@ -200,6 +200,7 @@ def get_module_files():
 data_files = get_module_files()
 data_files += [
 	(data_path, ["controlcenterui.glade", "veracc.css"]),	
+	("/etc/xdg/autostart", ["vera-wallpaper-rotation.desktop"]),
 ]
 
 setup(
@@ -214,7 +215,7 @@ setup(
 	author='Eugenio Paolantonio',
 	author_email='me@medesimo.eu',
 	url='https://github.com/vera-desktop/vera-control-center',
-	scripts=['vera-control-center.py'],
+	scripts=['vera-control-center.py', 'veracc-cli.py'],
 	packages=[
 		'veracc',
 		'veracc.widgets',
@@ -23,6 +23,7 @@
 import os
 
 import veracc.module
+import veracc.profile
 
 from veracc.widgets.SectionFrame import SectionFrame
 
@@ -136,6 +137,87 @@ class ControlCenter:
 		for section in self.section_box.get_children():
 			section.search(box.get_text().lower())
 	
+	def on_profile_dialog_response(self, dialog, response_id):
+		"""
+		Fired when the user triggered a response on the profile
+		import/export FileChooser.
+		"""
+		
+		filename = dialog.get_filename()
+		action = dialog.get_action()
+		dialog.destroy()
+		
+		if response_id != Gtk.ResponseType.ACCEPT or not filename:
+			return
+		
+		try:
+			if action == Gtk.FileChooserAction.SAVE:
+				veracc.profile.export_profile(filename)
+			else:
+				veracc.profile.apply_profile(filename)
+		except (OSError, veracc.profile.ProfileError) as e:
+			error = Gtk.MessageDialog(
+				transient_for=self.objects.main,
+				modal=True,
+				message_type=Gtk.MessageType.ERROR,
+				buttons=Gtk.ButtonsType.CLOSE,
+				text=_("Unable to import or export the profile")
+			)
+			error.format_secondary_text(str(e))
+			error.run()
+			error.destroy()
+	
+	def on_profile_action_activated(self, action, parameter):
+		"""
+		Fired when the import or export profile items have been selected.
+		"""
+		
+		export = (action.get_name() == "export")
+		
+		dialog = Gtk.FileChooserDialog(
+			title=_("Export profile") if export else _("Import profile"),
+			transient_for=self.objects.main,
+			action=Gtk.FileChooserAction.SAVE if export else Gtk.FileChooserAction.OPEN
+		)
+		dialog.add_buttons(
+			_("_Cancel"), Gtk.ResponseType.CANCEL,
+			_("_Save") if export else _("_Open"), Gtk.ResponseType.ACCEPT
+		)
+		dialog.set_default_response(Gtk.ResponseType.ACCEPT)
+		if export:
+			dialog.set_do_overwrite_confirmation(True)
+			dialog.set_current_name("profile.veraprofile")
+		
+		dialog.connect("response", self.on_profile_dialog_response)
+		dialog.show()
+	
+	def build_profile_menu(self):
+		"""
+		Builds the profile (import/export) menu and adds it to the toolbar.
+		"""
+		
+		actiongroup = Gio.SimpleActionGroup.new()
+		
+		menu = Gio.Menu()
+		menu.append(_("Import profile..."), "profile.import")
+		menu.append(_("Export profile..."), "profile.export")
+		
+		for name in ("import", "export"):
+			action = Gio.SimpleAction.new(name, None)
+			action.connect("activate", self.on_profile_action_activated)
+			actiongroup.add_action(action)
+		
+		button = Gtk.MenuButton()
+		button.set_relief(Gtk.ReliefStyle.NONE)
+		button.set_tooltip_text(_("Profiles"))
+		button.add(Gtk.Image.new_from_icon_name("open-menu-symbolic", Gtk.IconSize.BUTTON))
+		button.set_menu_model(menu)
+		button.insert_action_group("profile", actiongroup)
+		
+		item = Gtk.ToolItem()
+		item.add(button)
+		self.objects.toolbar1.insert(item, -1)
+	
 	def on_main_destroy(self, window):
 		""" Called when destroying window. """
 		
@@ -252,6 +334,9 @@ class ControlCenter:
 		# Do detections...
 		self.detect_modules()
 		
+		# Profile menu
+		self.build_profile_menu()
+		
 		# Finally, show the window
 		self.objects.main.show_all()
 
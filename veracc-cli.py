@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+# veracc-cli - change vera settings without starting the UI.
+# See veracc/cli.py for the usage.
+
+import os
+import sys
+
+# Ensure we can import veracc even if we are a link (see vera-control-center.py)
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+import veracc.cli
+
+sys.exit(veracc.cli.main())
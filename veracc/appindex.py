@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+# A search index over the applications in the menu.
+#
+# Every application is indexed by its Name, GenericName, Keywords and
+# the basename of its Exec, lowercased once when the index is built, so
+# that a search is just a pass of substring checks over short strings.
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+import os
+
+import shlex
+
+from collections import namedtuple
+
+import veracc.desktopcache as desktopcache
+
+# An indexed application.
+# item is the veracc.menusnapshot.MenuItem, the other fields are
+# lowercased.
+IndexEntry = namedtuple("IndexEntry", ("item", "name", "generic_name", "keywords", "executable"))
+
+# Scores of the different kinds of match
+SCORE_NAME_PREFIX = 100
+SCORE_EXECUTABLE_PREFIX = 90
+SCORE_WORD_PREFIX = 80
+SCORE_NAME = 60
+SCORE_EXECUTABLE = 50
+SCORE_OTHER = 40
+SCORE_FUZZY = 20
+
+def get_executable(command):
+	"""
+	Returns the basename of the executable in the given Exec.
+	"""
+	
+	try:
+		command = shlex.split(command)
+	except ValueError:
+		command = command.split()
+	
+	if not command:
+		return ""
+	
+	return os.path.basename(command[0])
+
+def fuzzy_match(query, text):
+	"""
+	Returns True if every character of query is in text, in order.
+	"""
+	
+	position = 0
+	for char in query:
+		position = text.find(char, position) + 1
+		if not position:
+			return False
+	
+	return True
+
+class ApplicationIndex:
+	"""
+	The index. It's built once (possibly in a thread) and then only read.
+	"""
+	
+	def __init__(self, items):
+		"""
+		Builds the index from the given iterable of MenuItems.
+		Directories and applications listed more than once are skipped.
+		"""
+		
+		self.entries = []
+		
+		seen = set()
+		for item in items:
+			if item.desktop_file is None or item.desktop_file in seen:
+				continue
+			seen.add(item.desktop_file)
+			
+			try:
+				entry = desktopcache.get_entry(item.desktop_file)
+			except Exception:
+				entry = None
+			
+			if entry is not None:
+				generic_name = entry.getGenericName()
+				keywords = " ".join(entry.getKeywords())
+				executable = get_executable(entry.getExec())
+			else:
+				generic_name = keywords = executable = ""
+			
+			self.entries.append(
+				IndexEntry(
+					item,
+					item.name.lower(),
+					generic_name.lower(),
+					keywords.lower(),
+					executable.lower()
+				)
+			)
+	
+	def score(self, entry, query):
+		"""
+		Returns the score of entry for the given (lowercased) query,
+		0 if it doesn't match.
+		"""
+		
+		if entry.name.startswith(query):
+			return SCORE_NAME_PREFIX
+		elif entry.executable.startswith(query):
+			return SCORE_EXECUTABLE_PREFIX
+		elif (" " + query) in entry.name:
+			return SCORE_WORD_PREFIX
+		elif query in entry.name:
+			return SCORE_NAME
+		elif query in entry.executable:
+			return SCORE_EXECUTABLE
+		elif query in entry.generic_name or query in entry.keywords:
+			return SCORE_OTHER
+		elif fuzzy_match(query, entry.name) or fuzzy_match(query, entry.executable):
+			return SCORE_FUZZY
+		
+		return 0
+	
+	def search(self, query, limit=None):
+		"""
+		Returns a list of the MenuItems matching query, best first.
+		"""
+		
+		query = query.strip().lower()
+		if not query:
+			return []
+		
+		results = []
+		for entry in self.entries:
+			score = self.score(entry, query)
+			if score:
+				results.append((-score, entry.name, entry.item))
+		
+		results.sort(key=lambda x: (x[0], x[1]))
+		
+		return [item for score, name, item in results[:limit]]
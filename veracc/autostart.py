@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+
+# Autostart helpers shared by the autostart module and veracc-cli.
+# They don't depend on Gtk so they can be used outside of the UI too.
+
+import os
+
+import shlex
+
+from collections import namedtuple
+
+import veracc.desktopcache as desktopcache
+
+# Search path for the applications.
+#
+# /usr/share/vera/autostart is taken out volountairly because it contains
+# core applications that the user doesn't want to disable.
+# You can still disable those by manually modifying the vera settings via
+# e.g. dconf-editor.
+SEARCH_PATH = (
+	"/etc/xdg/autostart",
+	os.path.expanduser("~/.config/autostart")
+)
+
+# Where user entries are stored
+USER_DIRECTORY = os.path.expanduser("~/.config/autostart")
+
+# Autostart phases, in launch order
+PHASES = ("Panel", "Desktop", "Other")
+DEFAULT_PHASE = "Other"
+
+# Desktop entry keys that control when an application is started
+PHASE_KEY = "X-Vera-Autostart-Phase"
+DELAY_KEY = "X-Vera-Autostart-Delay"
+WHEN_IDLE_KEY = "X-Vera-Autostart-When-Idle"
+
+# Desktop entry keys that control the resources of an application.
+# When any limit is set, Exec is wrapped (see wrap_command()) and the
+# original command is kept in COMMAND_KEY.
+NICE_KEY = "X-Vera-Autostart-Nice"
+IOCLASS_KEY = "X-Vera-Autostart-IOClass"
+MEMORY_KEY = "X-Vera-Autostart-MemoryMax"
+CPU_KEY = "X-Vera-Autostart-CPUQuota"
+COMMAND_KEY = "X-Vera-Autostart-Command"
+
+# ionice classes
+IOCLASSES = {
+	"best-effort" : 2,
+	"idle" : 3,
+}
+
+# Resource limits: nice level (0 = default), ionice class ("" = default),
+# memory cap in MiB and CPU cap in percent (0 = no limit)
+ResourceLimits = namedtuple("ResourceLimits", ("nice", "ioclass", "memory", "cpu"))
+
+NO_LIMITS = ResourceLimits(0, "", 0, 0)
+
+# What "demote" means
+DEMOTED_LIMITS = ResourceLimits(10, "idle", 0, 0)
+
+# An item of the launch schedule (see sort_schedule())
+ScheduleItem = namedtuple("ScheduleItem", ("phase", "delay", "when_idle", "application", "name"))
+
+def set_enabled(settings, blacklist, application, enabled):
+	"""
+	Enables or disables the given application (basename of the desktop
+	file) by updating the blacklist list in place, and stores it in
+	the autostart-ignore key of settings.
+	"""
+	
+	if enabled and application in blacklist:
+		# Remove from the blacklist
+		blacklist.remove(application)
+	elif not enabled and application not in blacklist:
+		# Add to the blacklist
+		blacklist.append(application)
+	else:
+		# Nothing to do
+		return
+	
+	# Set the new array
+	settings.set_strv("autostart-ignore", blacklist)
+
+def load_application(path):
+	"""
+	Returns the CachedDesktopEntry of the application at path, or None
+	if it can't be loaded or vera doesn't autostart it.
+	"""
+	
+	try:
+		entry = desktopcache.get_entry(path)
+	except Exception:
+		print("Unable to show informations for %s." % os.path.basename(path))
+		return None
+	
+	# While excluding only KDE is not ideal, we do so
+	# to have consistency with vera's AutostartManager.
+	# This check is obviously a FIXME.
+	if "KDE" in entry.getOnlyShowIn():
+		return None
+	
+	return entry
+
+def find_application(application):
+	"""
+	Returns the CachedDesktopEntry that is used for the given application
+	(basename of the desktop file), or None if there isn't one.
+	
+	The first SEARCH_PATH directory that provides a loadable entry wins,
+	like in iter_applications().
+	"""
+	
+	for path in SEARCH_PATH:
+		path = os.path.join(path, application)
+		
+		if os.path.exists(path):
+			entry = load_application(path)
+			if entry is not None:
+				return entry
+	
+	return None
+
+def iter_applications():
+	"""
+	Yields a (basename, CachedDesktopEntry) tuple for every application
+	that vera autostarts from SEARCH_PATH.
+	"""
+	
+	seen = set()
+	
+	for path in SEARCH_PATH:
+		
+		if not os.path.exists(path): continue
+		
+		for application in os.listdir(path):
+			
+			if application in seen:
+				continue
+			
+			entry = load_application(os.path.join(path, application))
+			if entry is not None:
+				seen.add(application)
+				yield application, entry
+
+def get_schedule_options(entry):
+	"""
+	Returns a (phase, delay, when_idle) tuple for the given
+	(Cached)DesktopEntry.
+	"""
+	
+	phase = entry.get(PHASE_KEY) or DEFAULT_PHASE
+	
+	try:
+		delay = max(0, int(entry.get(DELAY_KEY) or 0))
+	except ValueError:
+		delay = 0
+	
+	when_idle = (entry.get(WHEN_IDLE_KEY).lower() == "true")
+	
+	return phase, delay, when_idle
+
+def set_schedule_options(entry, phase, delay, when_idle):
+	"""
+	Sets the schedule options on the given xdg.DesktopEntry.DesktopEntry.
+	The entry is not written.
+	
+	Default values are removed from the entry, except the phase that
+	is always written.
+	"""
+	
+	entry.set(PHASE_KEY, phase)
+	
+	for key, value in (
+		(DELAY_KEY, str(delay) if delay > 0 else None),
+		(WHEN_IDLE_KEY, "true" if when_idle else None)
+	):
+		if value is not None:
+			entry.set(key, value)
+		elif entry.hasKey(key):
+			entry.removeKey(key)
+
+def schedule_item(application, entry):
+	"""
+	Returns the ScheduleItem of the given application.
+	"""
+	
+	return ScheduleItem(*get_schedule_options(entry), application=application, name=entry.getName())
+
+def sort_schedule(items):
+	"""
+	Sorts the given ScheduleItems in launch order: by phase, then
+	immediate launches by delay, then the ones that wait for idle.
+	"""
+	
+	def key(item):
+		phase = PHASES.index(item.phase) if item.phase in PHASES else len(PHASES)
+		return (phase, item.phase, item.when_idle, item.delay, item.name.lower())
+	
+	return sorted(items, key=key)
+
+def _get_int(entry, key):
+	"""
+	Returns the integer value of key in entry, or 0.
+	"""
+	
+	try:
+		return int(entry.get(key) or 0)
+	except ValueError:
+		return 0
+
+def get_resource_limits(entry):
+	"""
+	Returns the ResourceLimits of the given (Cached)DesktopEntry.
+	"""
+	
+	ioclass = entry.get(IOCLASS_KEY)
+	
+	return ResourceLimits(
+		min(19, max(0, _get_int(entry, NICE_KEY))),
+		ioclass if ioclass in IOCLASSES else "",
+		max(0, _get_int(entry, MEMORY_KEY)),
+		max(0, _get_int(entry, CPU_KEY))
+	)
+
+def get_command(entry):
+	"""
+	Returns the command of the given (Cached)DesktopEntry, without the
+	wrappers added by set_resource_limits().
+	"""
+	
+	return entry.get(COMMAND_KEY) or entry.getExec()
+
+def wrap_command(command, limits):
+	"""
+	Returns command wrapped so that the given ResourceLimits are applied.
+	The result is escaped for the Exec key.
+	"""
+	
+	wrapper = []
+	
+	if limits.memory or limits.cpu:
+		# systemd scope for the caps
+		wrapper += ["systemd-run", "--user", "--scope", "--quiet"]
+		if limits.memory:
+			wrapper += ["-p", "MemoryMax=%dM" % limits.memory]
+		if limits.cpu:
+			# % must be escaped in the Exec key
+			wrapper += ["-p", "CPUQuota=%d%%%%" % limits.cpu]
+	
+	if limits.nice:
+		wrapper += ["nice", "-n", str(limits.nice)]
+	
+	if limits.ioclass:
+		wrapper += ["ionice", "-c", str(IOCLASSES[limits.ioclass])]
+	
+	if not wrapper:
+		return command
+	
+	return "%s %s" % (" ".join(shlex.quote(x) for x in wrapper), command)
+
+def set_resource_limits(entry, command, limits):
+	"""
+	Sets command and the given ResourceLimits on the given
+	xdg.DesktopEntry.DesktopEntry. The entry is not written.
+	"""
+	
+	entry.set("Exec", wrap_command(command, limits))
+	
+	for key, value in (
+		(NICE_KEY, str(limits.nice) if limits.nice else None),
+		(IOCLASS_KEY, limits.ioclass or None),
+		(MEMORY_KEY, str(limits.memory) if limits.memory else None),
+		(CPU_KEY, str(limits.cpu) if limits.cpu else None),
+		(COMMAND_KEY, command if limits != NO_LIMITS else None)
+	):
+		if value is not None:
+			entry.set(key, value)
+		elif entry.hasKey(key):
+			entry.removeKey(key)
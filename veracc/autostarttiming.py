@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+
+# Login-time cost of the autostarted applications.
+#
+# The session appends a line to TIMING_LOG for every application it
+# autostarts. Every line is a JSON object:
+#
+#   {
+#     "session": "1413716400",             # an unique id of the login
+#     "application": "nm-applet.desktop",  # basename of the desktop file
+#     "phase": "Panel",                    # X-Vera-Autostart-Phase
+#     "spawn": 1413716401.12,              # when it was spawned
+#     "settled": 1413716402.70,            # when it settled
+#     "cpu": 0.48,                         # CPU time (seconds)
+#     "rss": 18432                         # resident set size (KiB)
+#   }
+#
+# record() writes such a line, sampling CPU time and RSS from
+# /proc/<pid> (see sample_process()); read_timings() aggregates the
+# most recent sessions.
+#
+# The lines are written by the session, for every entry it autostarts
+# (the system ones in /etc/xdg/autostart too): right after spawning an
+# application it calls watch() in a thread, with get_session_id() as the
+# session (or writes an equivalent line itself). watch() records the application once it settles, i.e. when it
+# hasn't used CPU for SETTLE_INTERVAL, or after SETTLE_TIMEOUT. The
+# autostart entries are not touched, so measuring costs nothing to the
+# applications.
+#
+# Applications without lines (e.g. on a session that doesn't write the
+# log) are shown as not measured.
+#
+# The log is trimmed, once it grows over MAX_LOG_SIZE, to the last
+# KEPT_SESSIONS sessions of every application.
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+import os
+
+import json
+
+import time
+
+import fcntl
+
+from collections import OrderedDict
+
+from veracc.autostart import DEFAULT_PHASE
+
+TIMING_LOG = os.path.join(
+	os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+	"vera",
+	"autostart-timing.log"
+)
+
+# Number of recent sessions to consider
+RECENT_SESSIONS = 5
+
+# Sessions kept in the log for every application, and the size of the
+# log that triggers the trimming
+KEPT_SESSIONS = RECENT_SESSIONS
+MAX_LOG_SIZE = 128 * 1024
+
+# An application is settled when it didn't use CPU for SETTLE_INTERVAL
+# seconds (sampled every SETTLE_POLL seconds), or after SETTLE_TIMEOUT
+SETTLE_INTERVAL = 0.5
+SETTLE_POLL = 0.1
+SETTLE_TIMEOUT = 30
+
+class ApplicationTiming:
+	"""
+	The login-time cost of an application, over the recent sessions.
+	"""
+	
+	def __init__(self, application, phase):
+		"""
+		Initializes the class.
+		"""
+		
+		self.application = application
+		self.phase = phase
+		
+		self.durations = []
+		self.cpu = []
+		self.rss = []
+	
+	def add(self, record):
+		"""
+		Adds a log record.
+		"""
+		
+		self.phase = record.get("phase", self.phase)
+		self.durations.append(max(0.0, record["settled"] - record["spawn"]))
+		
+		if record.get("cpu") is not None:
+			self.cpu.append(record["cpu"])
+		if record.get("rss") is not None:
+			self.rss.append(record["rss"])
+	
+	@property
+	def sessions(self):
+		""" Returns the number of sessions we have data for. """
+		
+		return len(self.durations)
+	
+	@property
+	def duration(self):
+		""" Returns the average time (seconds) from spawn to settled. """
+		
+		return sum(self.durations) / len(self.durations) if self.durations else 0.0
+	
+	@property
+	def cpu_time(self):
+		""" Returns the average CPU time (seconds). """
+		
+		return sum(self.cpu) / len(self.cpu) if self.cpu else None
+	
+	@property
+	def max_rss(self):
+		""" Returns the maximum resident set size (KiB). """
+		
+		return max(self.rss) if self.rss else None
+
+def sample_process(pid):
+	"""
+	Returns a (cpu_time, rss) tuple for the given pid, where cpu_time
+	is in seconds and rss in KiB, or None if the process is gone.
+	"""
+	
+	try:
+		with open("/proc/%d/stat" % pid) as f:
+			# The command name may contain spaces, so skip it
+			fields = f.read().rsplit(")", 1)[1].split()
+		
+		# utime and stime are the 14th and 15th fields of stat,
+		# that is the 12th and 13th after the command name
+		ticks = os.sysconf("SC_CLK_TCK")
+		cpu_time = (int(fields[11]) + int(fields[12])) / ticks
+		
+		rss = None
+		with open("/proc/%d/status" % pid) as f:
+			for line in f:
+				if line.startswith("VmRSS:"):
+					rss = int(line.split()[1])
+					break
+	except (OSError, IndexError, ValueError):
+		return None
+	
+	return cpu_time, rss
+
+def trim(lines, sessions=KEPT_SESSIONS):
+	"""
+	Returns the given log lines, minus the ones of the sessions older
+	than the last `sessions` sessions of their application.
+	"""
+	
+	parsed = []
+	application_sessions = {}
+	for line in lines:
+		try:
+			record = json.loads(line)
+			application, session = record["application"], record["session"]
+		except (ValueError, KeyError, TypeError):
+			continue
+		
+		parsed.append((line, application, session))
+		recent = application_sessions.setdefault(application, [])
+		if not session in recent:
+			recent.append(session)
+	
+	return [
+		line for line, application, session in parsed
+		if session in application_sessions[application][-sessions:]
+	]
+
+def record(session, application, phase, spawn, settled=None, pid=None, path=TIMING_LOG):
+	"""
+	Appends a record to the timing log, trimming it if needed.
+	
+	If settled is None, the current time is used. If pid is specified,
+	CPU time and RSS are sampled from /proc.
+	"""
+	
+	line = {
+		"session" : session,
+		"application" : application,
+		"phase" : phase,
+		"spawn" : spawn,
+		"settled" : settled if settled is not None else time.time(),
+		"cpu" : None,
+		"rss" : None,
+	}
+	
+	if pid is not None:
+		sample = sample_process(pid)
+		if sample is not None:
+			line["cpu"], line["rss"] = sample
+	
+	directory = os.path.dirname(path)
+	if not os.path.exists(directory):
+		os.makedirs(directory)
+	
+	# Every watcher of the session writes here at login
+	with open(path, "a+") as f:
+		fcntl.flock(f, fcntl.LOCK_EX)
+		
+		if os.fstat(f.fileno()).st_size > MAX_LOG_SIZE:
+			f.seek(0)
+			lines = trim(f.readlines())
+			f.truncate(0)
+			f.writelines(lines)
+		
+		f.write(json.dumps(line) + "\n")
+
+def get_session_id():
+	"""
+	Returns an unique id of the current login.
+	"""
+	
+	try:
+		with open("/proc/sys/kernel/random/boot_id") as f:
+			boot = f.read().strip()
+	except OSError:
+		boot = "unknown"
+	
+	return "%s-%s" % (boot, os.environ.get("XDG_SESSION_ID") or os.getsid(0))
+
+def watch(session, application, phase, spawn, pid, path=TIMING_LOG):
+	"""
+	Waits for the process pid (spawned at spawn) to settle, then records
+	it. Blocks for up to SETTLE_TIMEOUT seconds.
+	"""
+	
+	last = None
+	settled = time.time()
+	while time.time() < spawn + SETTLE_TIMEOUT:
+		time.sleep(SETTLE_POLL)
+		
+		sample = sample_process(pid)
+		if sample is None:
+			# Gone
+			break
+		elif sample[0] != last:
+			last = sample[0]
+			settled = time.time()
+		elif time.time() - settled >= SETTLE_INTERVAL:
+			break
+	else:
+		settled = time.time()
+	
+	record(session, application, phase, spawn, settled, pid, path)
+
+def read_timings(path=TIMING_LOG, sessions=RECENT_SESSIONS):
+	"""
+	Reads the timing log and returns a dictionary of application ->
+	ApplicationTiming, considering only the last `sessions` sessions.
+	"""
+	
+	records = OrderedDict()
+	
+	try:
+		with open(path) as f:
+			for line in f:
+				try:
+					record = json.loads(line)
+					records.setdefault(record["session"], []).append(record)
+				except (ValueError, KeyError, TypeError):
+					continue
+	except OSError:
+		return {}
+	
+	timings = {}
+	for session in list(records.keys())[-sessions:]:
+		for record in records[session]:
+			try:
+				application = record["application"]
+				if not application in timings:
+					timings[application] = ApplicationTiming(application, DEFAULT_PHASE)
+				
+				timings[application].add(record)
+			except (KeyError, TypeError):
+				continue
+	
+	return timings
+
+def phase_totals(timings):
+	"""
+	Returns an OrderedDict of phase -> average time spent by the
+	applications in that phase, most expensive first.
+	"""
+	
+	totals = {}
+	for timing in timings.values():
+		totals[timing.phase] = totals.get(timing.phase, 0.0) + timing.duration
+	
+	return OrderedDict(sorted(totals.items(), key=lambda x: x[1], reverse=True))
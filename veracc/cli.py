@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+
+# veracc-cli: change the settings without starting the UI.
+#
+# This module must not import Gtk: it reuses the Gtk-free helpers in
+# veracc (exitactions, fonts, autostart, wallpapers, tint2config).
+#
+# Usage:
+#   veracc-cli list [<schema>]
+#   veracc-cli get <schema> <key>
+#   veracc-cli set <schema> <key> <value>
+#   veracc-cli batch < operations
+#   veracc-cli rotation
+#
+# <schema> is either a full schema id or an alias (see SCHEMAS).
+# The special "schemas" autostart, wallpapers and tint2 are handled
+# by the relevant helpers:
+#   veracc-cli set autostart <desktop-file-basename> true|false
+#   veracc-cli set wallpapers <path> true|false
+#   veracc-cli set tint2 <position|autohide|ampm|launcher|launchers|inverted-scroll> <value>
+#
+# In batch mode every line of stdin is an operation (without the
+# leading veracc-cli, e.g. "set openbox theme-name Numix"). Lines
+# starting with # are ignored. Every schema is written in a single
+# transaction and tint2 is reloaded once, at the end.
+#
+# rotation keeps running, planning the random wallpaper rotation and
+# prefetching the next wallpaper (see wallpaperrotation). It's the only
+# command that needs a display. It's started in the session by
+# vera-wallpaper-rotation.desktop, and exits at once (or as soon as the
+# random rotation is disabled) when there's nothing to plan.
+
+import sys
+
+import shlex
+
+from collections import OrderedDict
+
+from gi.repository import Gio, GLib
+
+from veracc.utils import Settings
+
+import veracc.exitactions as exitactions
+import veracc.fonts as fonts
+import veracc.autostart as autostart
+import veracc.wallpapers as wallpapers
+import veracc.tint2config as tint2config
+
+SCHEMAS = OrderedDict([
+	("vera", "org.semplicelinux.vera"),
+	("settings", "org.semplicelinux.vera.settings"),
+	("openbox", "org.semplicelinux.vera.openbox"),
+	("compton", "org.semplicelinux.vera.compton"),
+	("desktop", "org.semplicelinux.vera.desktop"),
+])
+
+SPECIAL = ("autostart", "wallpapers", "tint2")
+
+USAGE = """usage: veracc-cli list [<schema>]
+       veracc-cli get <schema> <key>
+       veracc-cli set <schema> <key> <value>
+       veracc-cli batch < operations
+       veracc-cli rotation
+
+schemas: %s""" % ", ".join(list(SCHEMAS.keys()) + list(SPECIAL))
+
+TRUE_VALUES = ("true", "yes", "on", "1")
+FALSE_VALUES = ("false", "no", "off", "0")
+
+class CLIError(Exception):
+	"""
+	Raised when an operation can't be completed.
+	"""
+	
+	pass
+
+def parse_boolean(value):
+	"""
+	Converts value to a boolean, raising CLIError if it's not valid.
+	"""
+	
+	if value.lower() in TRUE_VALUES:
+		return True
+	elif value.lower() in FALSE_VALUES:
+		return False
+	
+	raise CLIError("Invalid boolean value %s" % value)
+
+class Session:
+	"""
+	A Session executes operations, keeping the Settings objects around
+	so that batches can be applied in a single transaction per schema.
+	"""
+	
+	def __init__(self, delay=False):
+		"""
+		Initializes the class.
+		
+		If delay is True, every change is kept in memory until commit()
+		is called.
+		"""
+		
+		self.delay = delay
+		
+		self.settings = {}
+		self.blacklist = None
+		self.tint2 = None
+		self.tint2_changed = False
+	
+	def get_settings(self, schema):
+		"""
+		Returns the Settings object for the given schema (or alias).
+		"""
+		
+		schema = SCHEMAS.get(schema, schema)
+		
+		if not schema in self.settings:
+			if not schema in Gio.Settings.list_schemas():
+				raise CLIError("Unknown schema %s" % schema)
+			
+			self.settings[schema] = Settings(schema)
+			if self.delay:
+				self.settings[schema].delay()
+		
+		return self.settings[schema]
+	
+	def get_blacklist(self):
+		"""
+		Returns the autostart blacklist.
+		"""
+		
+		if self.blacklist is None:
+			self.blacklist = self.get_settings("vera").get_strv("autostart-ignore")
+		
+		return self.blacklist
+	
+	def get_tint2(self):
+		"""
+		Returns the tint2 configuration.
+		"""
+		
+		if self.tint2 is None:
+			self.tint2 = tint2config.read_config()
+		
+		return self.tint2
+	
+	def list(self, schema=None):
+		"""
+		Returns a list of (key, value) tuples for the given schema, or
+		the list of the available schemas if schema is None.
+		"""
+		
+		if schema is None:
+			return [(alias, SCHEMAS.get(alias, "")) for alias in list(SCHEMAS.keys()) + list(SPECIAL)]
+		elif schema == "autostart":
+			blacklist = self.get_blacklist()
+			return [
+				(application, "false" if application in blacklist else "true")
+				for application, entry in autostart.iter_applications()
+			]
+		elif schema == "wallpapers":
+			settings = self.get_settings("desktop")
+			return (
+				[(path, "true") for path in settings.get_strv("background-include")] +
+				[(path, "false") for path in settings.get_strv("background-exclude")]
+			)
+		elif schema == "tint2":
+			return [(key, self.get(schema, key)) for key in self.get_tint2()]
+		
+		settings = self.get_settings(schema)
+		return [(key, self.get(schema, key)) for key in sorted(settings.list_keys())]
+	
+	def get(self, schema, key):
+		"""
+		Returns the value of key in schema, as a string.
+		"""
+		
+		if schema == "autostart":
+			return "false" if key in self.get_blacklist() else "true"
+		elif schema == "wallpapers":
+			settings = self.get_settings("desktop")
+			return "false" if key in settings.get_strv("background-exclude") else "true"
+		elif schema == "tint2":
+			config = self.get_tint2()
+			if not key in config:
+				raise CLIError("Unknown tint2 key %s" % key)
+			
+			value = config[key]
+			if isinstance(value, bool):
+				return "true" if value else "false"
+			elif isinstance(value, list):
+				return ";".join(value)
+			
+			return value if value is not None else ""
+		
+		settings = self.get_settings(schema)
+		if not key in settings.list_keys():
+			raise CLIError("Unknown key %s" % key)
+		
+		value = settings.get_value(key)
+		if value.get_type_string() == "s":
+			return value.get_string()
+		
+		return value.print_(False)
+	
+	def set(self, schema, key, value):
+		"""
+		Sets key in schema to value.
+		"""
+		
+		if schema == "autostart":
+			autostart.set_enabled(
+				self.get_settings("vera"),
+				self.get_blacklist(),
+				key,
+				parse_boolean(value)
+			)
+		elif schema == "wallpapers":
+			if parse_boolean(value):
+				wallpapers.include_wallpaper(self.get_settings("desktop"), key)
+			else:
+				wallpapers.exclude_wallpaper(self.get_settings("desktop"), key)
+		elif schema == "tint2":
+			self.set_tint2(key, value)
+		else:
+			self.set_key(self.get_settings(schema), key, value)
+	
+	def set_tint2(self, key, value):
+		"""
+		Sets key in the tint2 configuration.
+		"""
+		
+		config = self.get_tint2()
+		
+		if not key in config:
+			raise CLIError("Unknown tint2 key %s" % key)
+		elif isinstance(config[key], bool):
+			config[key] = parse_boolean(value)
+		elif isinstance(config[key], list):
+			config[key] = [x for x in value.split(";") if x]
+		elif key == "position" and not value in tint2config.POSITIONS:
+			raise CLIError("Invalid position %s" % value)
+		else:
+			config[key] = value
+		
+		self.tint2_changed = True
+		if not self.delay:
+			self.commit()
+	
+	def set_key(self, settings, key, value):
+		"""
+		Sets a key in the given Settings object, applying the same
+		conversions and side effects of the UI.
+		"""
+		
+		if not key in settings.list_keys():
+			raise CLIError("Unknown key %s" % key)
+		
+		schema = settings.props.schema_id
+		
+		if schema == SCHEMAS["vera"] and key == "last-exit-action":
+			# "last" means "Last action", as in the shortcuts module
+			if value == "last":
+				index = 0
+			elif value in exitactions.ALLOWED_ACTIONS:
+				index = exitactions.ALLOWED_ACTIONS.index(value) + 1
+			else:
+				raise CLIError("Invalid exit action %s" % value)
+			
+			settings.set_string(key, exitactions.convert_exit_action_from_ui(settings, index))
+			return
+		
+		type_ = settings.get_value(key).get_type()
+		if type_.equal(GLib.VariantType.new("s")) and not value[:1] in ("'", "\""):
+			# Allow unquoted strings
+			variant = GLib.Variant("s", value)
+		else:
+			try:
+				variant = GLib.Variant.parse(type_, value, None, None)
+			except GLib.Error as e:
+				raise CLIError("Invalid value for %s: %s" % (key, e))
+		
+		if not settings.set_value(key, variant):
+			raise CLIError("Unable to set %s" % key)
+		
+		# Font propagation, as done in the fonts page
+		if schema == SCHEMAS["settings"] and key == "font-name":
+			openboxsettings = self.get_settings("openbox")
+			fonts.propagate_font_name(settings.get_string(key), openboxsettings)
+			
+			# The UI gets these via the changed signals of openbox
+			for place in fonts.OPENBOX_FONT_FOLLOWERS:
+				fonts.propagate_openbox_font(openboxsettings, place)
+		elif schema == SCHEMAS["openbox"]:
+			fonts.propagate_openbox_font(settings, key)
+	
+	def execute(self, args):
+		"""
+		Executes an operation. args is the argument list (without
+		the program name).
+		
+		Returns a list of lines to print.
+		"""
+		
+		if not args:
+			raise CLIError(USAGE)
+		
+		command, args = args[0], args[1:]
+		
+		if command == "list" and len(args) <= 1:
+			return ["%s %s" % item for item in self.list(*args)]
+		elif command == "get" and len(args) == 2:
+			return [self.get(*args)]
+		elif command == "set" and len(args) == 3:
+			self.set(*args)
+			return []
+		
+		raise CLIError(USAGE)
+	
+	def commit(self):
+		"""
+		Applies the pending changes.
+		"""
+		
+		for settings in self.settings.values():
+			if settings.get_has_unapplied():
+				settings.apply()
+		
+		Gio.Settings.sync()
+		
+		if self.tint2_changed:
+			tint2config.write_config(self.tint2)
+			tint2config.reload_panel()
+			self.tint2_changed = False
+
+def batch(session, stream):
+	"""
+	Executes every operation in stream. Returns the number of failed
+	operations.
+	"""
+	
+	failed = 0
+	
+	for number, line in enumerate(stream, start=1):
+		line = line.strip()
+		if not line or line.startswith("#"):
+			continue
+		
+		try:
+			for output in session.execute(shlex.split(line)):
+				print(output)
+		except (CLIError, ValueError) as e:
+			print("line %d: %s" % (number, e), file=sys.stderr)
+			failed += 1
+	
+	return failed
+
+def get_geometry():
+	"""
+	Returns the sizes of the monitors and of the screen, as wanted by
+	wallpaperrotation.
+	"""
+	
+	# Imported here, the other commands work without a display
+	from gi.repository import Gdk
+	
+	screen = Gdk.Screen.get_default()
+	if screen is None:
+		return [], (0, 0)
+	
+	# In device pixels
+	monitors = []
+	scale = 1
+	for monitor in range(0, screen.get_n_monitors()):
+		geometry = screen.get_monitor_geometry(monitor)
+		factor = screen.get_monitor_scale_factor(monitor)
+		monitors.append((geometry.width * factor, geometry.height * factor))
+		scale = max(scale, factor)
+	
+	return monitors, (screen.get_width() * scale, screen.get_height() * scale)
+
+def main(args=None):
+	"""
+	Entry point.
+	"""
+	
+	if args is None:
+		args = sys.argv[1:]
+	
+	if args == ["batch"]:
+		session = Session(delay=True)
+		failed = batch(session, sys.stdin)
+		session.commit()
+		
+		return 1 if failed else 0
+	elif args == ["rotation"]:
+		# Imported here, it's heavy and the other commands don't need it
+		import veracc.wallpaperrotation as wallpaperrotation
+		
+		wallpaperrotation.run(get_geometry)
+		
+		return 0
+	
+	session = Session()
+	try:
+		for output in session.execute(args):
+			print(output)
+	except (CLIError, ValueError) as e:
+		# Like in batch mode
+		print(e, file=sys.stderr)
+		return 1
+	
+	session.commit()
+	
+	return 0
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+
+# A cache of the desktop entries we read.
+#
+# Parsing a desktop file means reading and tokenizing every (localized)
+# key, while we only need a few of them. This cache stores only those
+# fields (see FIELDS), keyed by path and validated against the file mtime
+# and size. It is shared by everything in the process, and is persisted
+# in CACHE_FILE when the process exits.
+#
+# The returned CachedDesktopEntry objects are read-only: use a real
+# xdg.DesktopEntry.DesktopEntry to modify desktop files.
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+import os
+
+import json
+
+import atexit
+
+import threading
+
+import xdg.Locale
+
+from xdg.DesktopEntry import DesktopEntry
+
+CACHE_VERSION = 1
+
+CACHE_FILE = os.path.join(
+	os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+	"vera-control-center",
+	"desktopentries.json"
+)
+
+# Fields we store, with the DesktopEntry method that retrieves them.
+# Every X-Vera* key is stored too.
+FIELDS = {
+	"Name" : "getName",
+	"GenericName" : "getGenericName",
+	"Comment" : "getComment",
+	"Icon" : "getIcon",
+	"Exec" : "getExec",
+	"OnlyShowIn" : "getOnlyShowIn",
+	"Keywords" : "getKeywords",
+}
+
+EXTRA_PREFIX = "X-Vera"
+
+class CachedDesktopEntry:
+	"""
+	A read-only, lightweight stand-in for xdg.DesktopEntry.DesktopEntry.
+	It implements only the getters we use.
+	"""
+	
+	def __init__(self, filename, fields):
+		"""
+		Initializes the class.
+		"""
+		
+		self.filename = filename
+		self.fields = fields
+	
+	def get(self, key):
+		"""
+		Returns the given key (Name, Icon, ..., X-Vera-*), or an
+		empty string.
+		"""
+		
+		return self.fields.get(key, "")
+	
+	def getName(self):
+		""" Returns the Name. """
+		
+		return self.fields.get("Name", "")
+	
+	def getGenericName(self):
+		""" Returns the GenericName. """
+		
+		return self.fields.get("GenericName", "")
+	
+	def getComment(self):
+		""" Returns the Comment. """
+		
+		return self.fields.get("Comment", "")
+	
+	def getIcon(self):
+		""" Returns the Icon. """
+		
+		return self.fields.get("Icon", "")
+	
+	def getExec(self):
+		""" Returns the Exec. """
+		
+		return self.fields.get("Exec", "")
+	
+	def getOnlyShowIn(self):
+		""" Returns the OnlyShowIn. """
+		
+		return self.fields.get("OnlyShowIn", [])
+	
+	def getKeywords(self):
+		""" Returns the Keywords. """
+		
+		return self.fields.get("Keywords", [])
+
+class DesktopEntryCache:
+	"""
+	The cache itself. Use the module-level get_entry() rather than
+	creating new instances.
+	"""
+	
+	def __init__(self, path=CACHE_FILE):
+		"""
+		Initializes the class.
+		"""
+		
+		self.path = path
+		
+		# The localized fields depend on the locale
+		self.locale = ":".join(xdg.Locale.langs)
+		
+		self.entries = {}
+		self.dirty = False
+		self.lock = threading.Lock()
+		
+		self.load()
+	
+	def load(self):
+		"""
+		Loads the persisted cache, if it's valid.
+		"""
+		
+		try:
+			with open(self.path) as f:
+				data = json.load(f)
+			
+			if data["version"] == CACHE_VERSION and data["locale"] == self.locale:
+				self.entries = data["entries"]
+		except (OSError, ValueError, KeyError, TypeError):
+			self.entries = {}
+	
+	def save(self):
+		"""
+		Persists the cache, if it has been changed.
+		Entries of files that don't exist anymore are dropped.
+		"""
+		
+		with self.lock:
+			if not self.dirty:
+				return
+			
+			entries = {
+				path : entry for path, entry in self.entries.items()
+				if os.path.exists(path)
+			}
+			self.dirty = False
+		
+		try:
+			directory = os.path.dirname(self.path)
+			if not os.path.exists(directory):
+				os.makedirs(directory)
+			
+			with open(self.path + ".tmp", "w") as f:
+				json.dump(
+					{
+						"version" : CACHE_VERSION,
+						"locale" : self.locale,
+						"entries" : entries
+					},
+					f
+				)
+			os.replace(self.path + ".tmp", self.path)
+		except OSError:
+			print("Unable to save the desktop entry cache to %s" % self.path)
+	
+	def parse(self, path):
+		"""
+		Parses the desktop file at path and returns the fields we store.
+		"""
+		
+		entry = DesktopEntry(path)
+		
+		fields = {}
+		for field, method in FIELDS.items():
+			value = getattr(entry, method)()
+			if value:
+				fields[field] = value
+		
+		for key, value in entry.content.get(entry.defaultGroup, {}).items():
+			if key.startswith(EXTRA_PREFIX):
+				fields[key] = value
+		
+		return fields
+	
+	def get_entry(self, path):
+		"""
+		Returns a CachedDesktopEntry for the desktop file at path.
+		
+		Raises the same exceptions of xdg.DesktopEntry.DesktopEntry
+		(plus OSError if the file doesn't exist).
+		"""
+		
+		stat = os.stat(path)
+		
+		with self.lock:
+			cached = self.entries.get(path)
+		
+		if cached and cached["mtime"] == stat.st_mtime and cached["size"] == stat.st_size:
+			return CachedDesktopEntry(path, cached["fields"])
+		
+		fields = self.parse(path)
+		
+		with self.lock:
+			self.entries[path] = {
+				"mtime" : stat.st_mtime,
+				"size" : stat.st_size,
+				"fields" : fields
+			}
+			self.dirty = True
+		
+		return CachedDesktopEntry(path, fields)
+	
+	def invalidate(self, path):
+		"""
+		Drops path from the cache.
+		"""
+		
+		with self.lock:
+			if self.entries.pop(path, None) is not None:
+				self.dirty = True
+
+# The shared cache
+CACHE = DesktopEntryCache()
+atexit.register(CACHE.save)
+
+def get_entry(path):
+	"""
+	Returns a CachedDesktopEntry for the desktop file at path, using
+	the shared cache.
+	"""
+	
+	return CACHE.get_entry(path)
+
+def invalidate(path):
+	"""
+	Drops path from the shared cache.
+	"""
+	
+	CACHE.invalidate(path)
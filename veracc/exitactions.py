@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+
+# Conversion of the exit action between the UI and dconf.
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+# A bit hacky, but it seems we can't set directly the enum value in GSettings :(
+ALLOWED_ACTIONS = [
+	'PowerOff',
+	'Reboot',
+	'Suspend',
+	'Logout',
+	'Lock',
+	'Hibernate',
+	'Switch User'
+]
+
+def convert_exit_action_from_dconf(settings):
+	"""
+	Converts the exit action from dconf.
+	
+	Returns the index of the action in the UI (0 is "Last action").
+	"""
+	
+	value = settings.get_enum("last-exit-action")
+	
+	if not settings.get_boolean("lock-last-exit-action"):
+		# Not locked, this is the "Last action" item
+		return 0
+	else:
+		return value
+
+def convert_exit_action_from_ui(settings, value):
+	"""
+	Converts the exit action from the UI.
+	
+	value is the index of the action in the UI (0 is "Last action").
+	Returns the string that should be stored in last-exit-action.
+	"""
+	
+	if value == 0:
+		# Not locked, unset lock-last-exit-action
+		settings.set_boolean("lock-last-exit-action", False)
+		return settings.get_string("last-exit-action")
+	else:
+		settings.set_boolean("lock-last-exit-action", True)
+		return ALLOWED_ACTIONS[value-1]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+
+# Propagation of the font settings to openbox.
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+# Openbox fonts that follow the GTK+ font family
+OPENBOX_FONT_PLACES = ("activewindow", "inactivewindow", "menuitem", "onscreendisplay")
+
+# Openbox fonts that mirror another openbox font
+OPENBOX_FONT_FOLLOWERS = {
+	"font-menuitem" : ("font-menuheader",),
+	"font-onscreendisplay" : ("font-activeonscreendisplay", "font-inactiveonscreendisplay"),
+}
+
+def propagate_font_name(font_name, openboxsettings):
+	"""
+	Updates every openbox font name by looking at the given GTK+ one.
+	The size of every openbox font is preserved.
+	"""
+	
+	font_without_size = " ".join(font_name.split(" ")[:-1])
+	
+	for place in OPENBOX_FONT_PLACES:
+		place = "font-%s" % place
+		openboxsettings.set_string(
+			place,
+			"%s %s" % (font_without_size, openboxsettings.get_string(place).split(" ")[-1])
+		)
+
+def propagate_openbox_font(openboxsettings, key):
+	"""
+	Updates the openbox fonts that mirror key (e.g. the menu header
+	follows the menu item font).
+	"""
+	
+	for follower in OPENBOX_FONT_FOLLOWERS.get(key, ()):
+		openboxsettings.set_string(follower, openboxsettings.get_string(key))
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+# An on-disk snapshot of the flattened application menu.
+#
+# Loading a menu means parsing the menu file and every desktop file in
+# the applications directories. The snapshot stores the result (see
+# MenuItem) together with the mtimes of the menu files and of the
+# directories they are built from, so that it can be shown right away
+# and trusted until one of those changes.
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+import os
+
+import json
+
+from collections import namedtuple
+
+import xdg.Locale
+import xdg.BaseDirectory
+
+SNAPSHOT_VERSION = 1
+
+SNAPSHOT_FILE = os.path.join(
+	os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+	"vera-control-center",
+	"menu.json"
+)
+
+# A flattened menu item.
+# parent is the tuple of the names of the directories that contain the
+# item, desktop_file is None if the item is a directory, and icon is the
+# serialized GIcon (or None).
+MenuItem = namedtuple("MenuItem", ("parent", "name", "desktop_file", "icon"))
+
+def get_watched_paths(menu_file):
+	"""
+	Returns a list of the paths the given menu is built from.
+	"""
+	
+	paths = []
+	
+	for directory in xdg.BaseDirectory.xdg_config_dirs:
+		paths.append(os.path.join(directory, "menus", menu_file))
+		paths.append(os.path.join(directory, "menus", "applications-merged"))
+	
+	for directory in xdg.BaseDirectory.xdg_data_dirs:
+		paths.append(os.path.join(directory, "desktop-directories"))
+		
+		# Desktop files may be in subdirectories too
+		applications = os.path.join(directory, "applications")
+		paths.append(applications)
+		for root, directories, files in os.walk(applications):
+			paths.extend(os.path.join(root, x) for x in directories)
+	
+	return paths
+
+def get_mtimes(menu_file):
+	"""
+	Returns a dictionary with the mtime of every path the given menu is
+	built from (None if the path doesn't exist).
+	"""
+	
+	mtimes = {}
+	
+	for path in get_watched_paths(menu_file):
+		try:
+			mtimes[path] = os.stat(path).st_mtime
+		except OSError:
+			mtimes[path] = None
+	
+	return mtimes
+
+def load_snapshot(menu_file, path=SNAPSHOT_FILE):
+	"""
+	Returns a (items, mtimes) tuple with the MenuItems and the mtimes
+	stored in the snapshot of the given menu, or (None, None) if there
+	isn't an usable snapshot.
+	
+	The snapshot may be stale: compare mtimes with get_mtimes().
+	"""
+	
+	try:
+		with open(path) as f:
+			data = json.load(f)
+		
+		if (
+			data["version"] != SNAPSHOT_VERSION or
+			data["menu"] != menu_file or
+			data["locale"] != ":".join(xdg.Locale.langs)
+		):
+			return None, None
+		
+		items = [
+			MenuItem(tuple(parent), name, desktop_file, icon)
+			for parent, name, desktop_file, icon in data["items"]
+		]
+		
+		return items, data["mtimes"]
+	except (OSError, ValueError, KeyError, TypeError):
+		return None, None
+
+def save_snapshot(menu_file, items, mtimes, path=SNAPSHOT_FILE):
+	"""
+	Saves the snapshot of the given menu.
+	"""
+	
+	try:
+		directory = os.path.dirname(path)
+		if not os.path.exists(directory):
+			os.makedirs(directory)
+		
+		with open(path + ".tmp", "w") as f:
+			json.dump(
+				{
+					"version" : SNAPSHOT_VERSION,
+					"menu" : menu_file,
+					"locale" : ":".join(xdg.Locale.langs),
+					"mtimes" : mtimes,
+					"items" : items
+				},
+				f
+			)
+		os.replace(path + ".tmp", path)
+	except OSError:
+		print("Unable to save the menu snapshot to %s" % path)
@@ -21,7 +21,7 @@
 
 import os
 
-from xdg.DesktopEntry import DesktopEntry
+import veracc.desktopcache as desktopcache
 
 from gi.repository import Gtk
 
@@ -42,7 +42,7 @@ class VeraCCModule:
 		self.launcher_comment = None
 		self.launcher_section = None
 			
-		self.module_launcher = DesktopEntry(os.path.join(self.module_path, "%s.desktop" % self.module_name))
+		self.module_launcher = desktopcache.get_entry(os.path.join(self.module_path, "%s.desktop" % self.module_name))
 			
 		# Icon
 		self.launcher_icon = self.module_launcher.getIcon()
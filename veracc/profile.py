@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+# Appearance/desktop profiles.
+#
+# A profile is a keyfile with a section for every schema and a [tint2]
+# section for the panel. Values are stored as GVariant text (the same
+# format used by `dconf dump`), e.g.
+#
+#   [org.semplicelinux.vera.settings]
+#   theme-name='Adwaita'
+#
+#   [tint2]
+#   position=top
+#   launchers=/usr/share/applications/firefox.desktop
+#
+# Every schema is written in a single delayed-apply transaction, and the
+# tint2 configuration is rewritten (and the panel reloaded) only once.
+
+import configparser
+
+from collections import OrderedDict
+
+from gi.repository import Gio, GLib
+
+from veracc.utils import Settings
+
+import veracc.tint2config as tint2config
+
+# The keys bound by the modules, per schema
+PROFILE_KEYS = OrderedDict([
+	("org.semplicelinux.vera", (
+		"last-exit-action",
+		"lock-last-exit-action",
+		"hide-exit-window",
+		"ninja-shortcut",
+	)),
+	("org.semplicelinux.vera.settings", (
+		"theme-name",
+		"icon-theme-name",
+		"cursor-theme-name",
+		"button-images",
+		"menu-images",
+		"enable-animations",
+		"font-name",
+		"xft-antialias",
+		"xft-hinting",
+		"xft-hintstyle",
+		"xft-rgba",
+	)),
+	("org.semplicelinux.vera.openbox", (
+		"theme-name",
+		"title-layout",
+		"desktops-number",
+		"font-activewindow",
+		"font-inactivewindow",
+		"font-menuitem",
+		"font-menuheader",
+		"font-onscreendisplay",
+		"font-activeonscreendisplay",
+		"font-inactiveonscreendisplay",
+	)),
+	("org.semplicelinux.vera.compton", (
+		"enable-visual-effects",
+		"shadow",
+		"no-dock-shadow",
+		"shadow-red",
+		"shadow-green",
+		"shadow-blue",
+		"fading",
+		"no-fading-openclose",
+		"menu-opacity",
+		"inactive-opacity",
+		"frame-opacity",
+		"backend",
+		"vsync",
+	)),
+	("org.semplicelinux.vera.desktop", (
+		"image-path",
+		"background-color",
+		"background-mode",
+		"background-random-enabled",
+		"background-random-timeout",
+		"background-search-paths",
+		"background-include",
+		"background-exclude",
+		"vera-color",
+		"vera-color-enabled",
+		"vera-color-lock",
+		"show-launcher",
+	)),
+])
+
+TINT2_SECTION = "tint2"
+
+class ProfileError(Exception):
+	"""
+	Raised when a profile can't be parsed or applied.
+	"""
+
+	pass
+
+def _new_parser():
+	"""
+	Returns a case-sensitive, non-interpolating ConfigParser.
+	"""
+
+	parser = configparser.ConfigParser(interpolation=None)
+	parser.optionxform = str
+
+	return parser
+
+def export_profile(path):
+	"""
+	Exports the current configuration to the profile at path.
+	"""
+
+	parser = _new_parser()
+
+	for schema, keys in PROFILE_KEYS.items():
+		settings = Settings(schema)
+		available = settings.list_keys()
+
+		parser.add_section(schema)
+		for key in keys:
+			if key in available:
+				parser[schema][key] = settings.get_value(key).print_(False)
+
+	config = tint2config.read_config()
+	parser.add_section(TINT2_SECTION)
+	for key, value in config.items():
+		if value is None:
+			continue
+		elif isinstance(value, bool):
+			value = "true" if value else "false"
+		elif isinstance(value, list):
+			value = ";".join(value)
+
+		parser[TINT2_SECTION][key] = value
+
+	with open(path, "w") as f:
+		parser.write(f)
+
+def apply_profile(path):
+	"""
+	Applies the profile at path.
+
+	Raises ProfileError if the profile isn't valid. Nothing is written
+	until every value in the profile has been parsed.
+	"""
+
+	parser = _new_parser()
+
+	try:
+		with open(path) as f:
+			parser.read_file(f)
+	except (OSError, configparser.Error) as e:
+		raise ProfileError("Unable to read profile %s: %s" % (path, e))
+
+	# Parse everything first
+	changes = OrderedDict()
+	for schema in PROFILE_KEYS:
+		if not parser.has_section(schema):
+			continue
+
+		settings = Settings(schema)
+		available = settings.list_keys()
+
+		changes[schema] = (settings, OrderedDict())
+		for key, value in parser[schema].items():
+			if not key in available:
+				raise ProfileError("Unknown key %s in %s" % (key, schema))
+
+			try:
+				variant = GLib.Variant.parse(
+					settings.get_value(key).get_type(),
+					value,
+					None,
+					None
+				)
+			except GLib.Error as e:
+				raise ProfileError("Invalid value for %s in %s: %s" % (key, schema, e))
+
+			changes[schema][1][key] = variant
+
+	config = None
+	if parser.has_section(TINT2_SECTION):
+		config = tint2config.default_config()
+		section = parser[TINT2_SECTION]
+
+		for key, default in config.items():
+			if not key in section:
+				continue
+			elif isinstance(default, bool):
+				try:
+					config[key] = section.getboolean(key)
+				except ValueError:
+					raise ProfileError("Invalid value for %s in %s: %s" % (key, TINT2_SECTION, section[key]))
+			elif isinstance(default, list):
+				config[key] = [x for x in section[key].split(";") if x]
+			else:
+				config[key] = section[key]
+
+		if config["position"] not in tint2config.POSITIONS:
+			raise ProfileError("Invalid tint2 position %s" % config["position"])
+
+	# Then apply, one transaction per schema
+	for schema, (settings, values) in changes.items():
+		settings.delay()
+		for key, variant in values.items():
+			if settings.get_value(key) != variant:
+				settings.set_value(key, variant)
+		settings.apply()
+
+	if changes:
+		Gio.Settings.sync()
+
+	if config is not None:
+		tint2config.write_config(config)
+		tint2config.reload_panel()
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+# Thumbnails, as per the freedesktop.org thumbnail managing standard.
+#
+# Thumbnails are stored in THUMBNAIL_DIRECTORY/<size>/<md5 of the URI>.png
+# and are valid as long as their Thumb::MTime matches the mtime of the
+# original file, so they are shared with file managers and other
+# applications. Files that can't be thumbnailed are recorded in
+# FAIL_DIRECTORY, so that we don't try to decode them again.
+#
+# Images are decoded through a PixbufLoader that is told the target size
+# as soon as the header has been read, so that loaders that support it
+# (e.g. JPEG, via DCT scaling) never allocate the full-size image. Images
+# that would need more than MAX_DECODED_PIXELS anyway are refused.
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+import os
+
+import hashlib
+
+from collections import namedtuple
+
+from gi.repository import GdkPixbuf, GLib
+
+THUMBNAIL_DIRECTORY = os.path.join(
+	os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+	"thumbnails"
+)
+
+FAIL_DIRECTORY = os.path.join(THUMBNAIL_DIRECTORY, "fail", "vera-control-center")
+
+# Thumbnail sizes defined by the standard
+SIZES = {
+	"normal" : 128,
+	"large" : 256,
+}
+
+# The size we use
+THUMBNAIL_SIZE = "large"
+
+SOFTWARE = "vera-control-center"
+
+# Pixel budget of a single decode (about 100 MiB in RGBA)
+MAX_DECODED_PIXELS = 25000000
+
+# Formats whose loader can scale while decoding, with the maximum
+# scale factor
+SCALING_FORMATS = {
+	"jpeg" : 8,
+}
+
+# Bytes fed to the loader at once
+READ_CHUNK = 65536
+
+class ImageTooLarge(Exception):
+	"""
+	Raised when decoding an image would exceed MAX_DECODED_PIXELS.
+	"""
+	
+	pass
+
+# The raw pixel data of a decoded image, so that it can be passed from
+# a worker to the main thread without sharing Pixbufs (see to_data()
+# and from_data())
+PixbufData = namedtuple("PixbufData", ("data", "width", "height", "rowstride", "has_alpha"))
+
+def get_uri(path):
+	"""
+	Returns the URI of the given path.
+	"""
+	
+	return GLib.filename_to_uri(os.path.abspath(path), None)
+
+def get_thumbnail_path(uri, size=THUMBNAIL_SIZE):
+	"""
+	Returns the path of the thumbnail of uri.
+	"""
+	
+	return os.path.join(
+		THUMBNAIL_DIRECTORY,
+		size,
+		hashlib.md5(uri.encode("utf-8")).hexdigest() + ".png"
+	)
+
+def get_fail_path(uri):
+	"""
+	Returns the path of the failure record of uri.
+	"""
+	
+	return os.path.join(
+		FAIL_DIRECTORY,
+		hashlib.md5(uri.encode("utf-8")).hexdigest() + ".png"
+	)
+
+def _load_valid(thumbnail, uri, mtime):
+	"""
+	Loads the given thumbnail, returns None if it's missing or it's not
+	valid for uri and mtime.
+	"""
+	
+	try:
+		pixbuf = GdkPixbuf.Pixbuf.new_from_file(thumbnail)
+	except GLib.Error:
+		return None
+	
+	if (
+		pixbuf.get_option("tEXt::Thumb::URI") != uri or
+		pixbuf.get_option("tEXt::Thumb::MTime") != str(mtime)
+	):
+		return None
+	
+	return pixbuf
+
+def _save(thumbnail, pixbuf, uri, mtime):
+	"""
+	Atomically saves pixbuf as the thumbnail of uri.
+	"""
+	
+	directory = os.path.dirname(thumbnail)
+	if not os.path.exists(directory):
+		os.makedirs(directory, 0o700)
+	
+	temporary = "%s.%d.tmp" % (thumbnail, os.getpid())
+	pixbuf.savev(
+		temporary,
+		"png",
+		["tEXt::Thumb::URI", "tEXt::Thumb::MTime", "tEXt::Software"],
+		[uri, str(mtime), SOFTWARE]
+	)
+	os.chmod(temporary, 0o600)
+	os.replace(temporary, thumbnail)
+
+def load_thumbnail(path, size=THUMBNAIL_SIZE):
+	"""
+	Returns the cached thumbnail of path as a Pixbuf, or None if there
+	isn't a valid one.
+	"""
+	
+	try:
+		mtime = int(os.stat(path).st_mtime)
+	except OSError:
+		return None
+	
+	uri = get_uri(path)
+	
+	return _load_valid(get_thumbnail_path(uri, size), uri, mtime)
+
+def has_failed(path):
+	"""
+	Returns True if path couldn't be thumbnailed the last time we tried
+	(and it didn't change since).
+	"""
+	
+	try:
+		mtime = int(os.stat(path).st_mtime)
+	except OSError:
+		return False
+	
+	uri = get_uri(path)
+	
+	return os.path.exists(get_fail_path(uri)) and _load_valid(get_fail_path(uri), uri, mtime) is not None
+
+def get_decoded_pixels(format, width, height, target_width, target_height):
+	"""
+	Returns the number of pixels the loader of format allocates when
+	decoding a width x height image for target_width x target_height.
+	"""
+	
+	factor = SCALING_FORMATS.get(format, 1)
+	
+	# Loaders scale by powers of two
+	scale = 1
+	while scale * 2 <= factor and width / (scale * 2) >= target_width and height / (scale * 2) >= target_height:
+		scale *= 2
+	
+	return (width // scale) * (height // scale)
+
+def decode_at_size(path, get_size, max_pixels=MAX_DECODED_PIXELS):
+	"""
+	Decodes the image at path at the size returned by get_size, which is
+	called with the size of the image and returns the (width, height)
+	wanted, keeping the memory usage proportional to the target size
+	where the loader permits it.
+	
+	Raises ImageTooLarge if the decode would exceed max_pixels, GLib.Error
+	(or OSError) if the image can't be decoded.
+	"""
+	
+	loader = GdkPixbuf.PixbufLoader()
+	too_large = []
+	
+	def on_size_prepared(loader, image_width, image_height):
+		target_width, target_height = get_size(image_width, image_height)
+		
+		format = loader.get_format()
+		if get_decoded_pixels(
+			format.get_name() if format else None,
+			image_width,
+			image_height,
+			target_width,
+			target_height
+		) > max_pixels:
+			too_large.append((image_width, image_height))
+		
+		loader.set_size(target_width, target_height)
+	
+	loader.connect("size-prepared", on_size_prepared)
+	
+	try:
+		with open(path, "rb") as f:
+			while not too_large:
+				chunk = f.read(READ_CHUNK)
+				if not chunk:
+					break
+				loader.write(chunk)
+	finally:
+		try:
+			loader.close()
+		except GLib.Error:
+			if not too_large:
+				raise
+	
+	if too_large:
+		raise ImageTooLarge("%s is too large (%dx%d)" % ((path,) + too_large[0]))
+	
+	pixbuf = loader.get_pixbuf()
+	if pixbuf is None:
+		raise GLib.Error("Unable to decode %s" % path)
+	
+	return pixbuf
+
+def decode_scaled(path, width, height, max_pixels=MAX_DECODED_PIXELS):
+	"""
+	Decodes the image at path, scaled down (preserving the aspect ratio)
+	to fit in width x height (see decode_at_size()).
+	"""
+	
+	def get_size(image_width, image_height):
+		ratio = min(width / image_width, height / image_height, 1)
+		
+		return max(1, round(image_width * ratio)), max(1, round(image_height * ratio))
+	
+	return decode_at_size(path, get_size, max_pixels)
+
+def create_thumbnail(path, size=THUMBNAIL_SIZE):
+	"""
+	Decodes path, stores its thumbnail and returns it.
+	
+	Raises GLib.Error (or OSError) if path can't be decoded; in that case
+	the failure is recorded (see has_failed()). Raises ImageTooLarge if
+	decoding path would exceed the pixel budget: that's not recorded, as
+	it's detected from the header alone.
+	"""
+	
+	mtime = int(os.stat(path).st_mtime)
+	uri = get_uri(path)
+	
+	try:
+		pixbuf = decode_scaled(path, SIZES[size], SIZES[size])
+	except GLib.Error:
+		try:
+			_save(
+				get_fail_path(uri),
+				GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, True, 8, 1, 1),
+				uri,
+				mtime
+			)
+		except (OSError, GLib.Error):
+			pass
+		raise
+	
+	try:
+		_save(get_thumbnail_path(uri, size), pixbuf, uri, mtime)
+	except (OSError, GLib.Error):
+		print("Unable to save the thumbnail of %s" % path)
+	
+	return pixbuf
+
+def get_thumbnail(path, size=THUMBNAIL_SIZE):
+	"""
+	Returns the thumbnail of path, creating it if needed.
+	
+	Raises GLib.Error (or OSError) or ImageTooLarge if path can't be
+	thumbnailed.
+	"""
+	
+	pixbuf = load_thumbnail(path, size)
+	if pixbuf is None:
+		pixbuf = create_thumbnail(path, size)
+	
+	return pixbuf
+
+def scale_to_fit(pixbuf, width, height):
+	"""
+	Returns pixbuf scaled down (preserving the aspect ratio) to fit
+	in width x height.
+	"""
+	
+	ratio = min(width / pixbuf.get_width(), height / pixbuf.get_height())
+	if ratio >= 1:
+		return pixbuf
+	
+	return pixbuf.scale_simple(
+		max(1, round(pixbuf.get_width() * ratio)),
+		max(1, round(pixbuf.get_height() * ratio)),
+		GdkPixbuf.InterpType.BILINEAR
+	)
+
+def to_data(pixbuf):
+	"""
+	Returns the PixbufData of the given Pixbuf.
+	"""
+	
+	return PixbufData(
+		pixbuf.read_pixel_bytes(),
+		pixbuf.get_width(),
+		pixbuf.get_height(),
+		pixbuf.get_rowstride(),
+		pixbuf.get_has_alpha()
+	)
+
+def from_data(data):
+	"""
+	Wraps the given PixbufData in a new Pixbuf, without copying it.
+	"""
+	
+	return GdkPixbuf.Pixbuf.new_from_bytes(
+		data.data,
+		GdkPixbuf.Colorspace.RGB,
+		data.has_alpha,
+		8,
+		data.width,
+		data.height,
+		data.rowstride
+	)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+# This module reads and writes the tint2 secondary configuration file.
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+import os
+
+import subprocess
+
+CONFIG = os.path.expanduser("~/.config/tint2/secondary_config")
+
+POSITIONS = ("top", "center", "bottom")
+
+def default_config():
+	"""
+	Returns a dictionary with the default configuration.
+	"""
+
+	return {
+		"position" : "bottom",
+		"autohide" : False,
+		"ampm" : False,
+		"launcher" : False,
+		"launchers" : [],
+		"inverted-scroll" : False,
+		"icon-theme" : None,
+	}
+
+def read_config(path=CONFIG):
+	"""
+	Parses the secondary config at path and returns a configuration
+	dictionary (see default_config()).
+	"""
+
+	config = default_config()
+
+	if not os.path.exists(path):
+		return config
+
+	up_inverted = False
+	down_inverted = False
+
+	with open(path) as f:
+		for line in f.readlines():
+			try:
+				line = line.split("=")
+				if line[0].startswith("launcher_item_app"):
+					# A launcher!
+					config["launchers"].append(line[1].strip("\n").replace(" /","/",1))
+				elif line[0].startswith("launcher_icon_theme"):
+					config["icon-theme"] = line[1].strip()
+				elif line[0].startswith("panel_items"):
+					# Is the launcher enabled or not?
+					config["launcher"] = ("L" in line[1])
+				elif line[0].startswith("time1_format"):
+					# AM/PM?
+					config["ampm"] = ("%p" in line[1])
+				elif line[0].startswith("autohide"):
+					# Autohide?
+					config["autohide"] = ("1" in line[1])
+				elif line[0].startswith("panel_position"):
+					# Position
+					splt = line[1].strip("\n").split(" ")
+					while splt.count(""):
+						splt.remove("")
+					if splt[0] in POSITIONS:
+						config["position"] = splt[0]
+				elif line[0].startswith("mouse_scroll_"):
+					# Mouse scroll (up/down) actions.
+					# Usually if they are on the secondary_config
+					# it's because they're inverted, but let's check
+					# anyways...
+					if "down" in line[0] and "toggle" in line[1]:
+						down_inverted = True
+					elif "up" in line[0] and "iconify" in line[1]:
+						up_inverted = True
+			except Exception:
+				print("Error while loading configuration.")
+
+	config["inverted-scroll"] = (down_inverted and up_inverted)
+
+	return config
+
+def write_config(config, path=CONFIG):
+	"""
+	Writes the given configuration dictionary to path.
+	"""
+
+	if not os.path.exists(os.path.dirname(path)):
+		os.makedirs(os.path.dirname(path))
+
+	with open(path, "w") as f:
+		if config["position"] != "bottom":
+			# Panel position. If it is Bottom do not save it.
+			# This avoids messing up with the panel position for those
+			# who already modified it in the *primary* config.
+			f.write("panel_position = %s left horizontal\n" % config["position"])
+
+			# Ensure that windows can be on top of the panel if the position is top
+			if config["position"] == "top":
+				f.write("panel_layer = bottom\n")
+		if config["autohide"]:
+			f.write("autohide = 1\n")
+
+		if config["ampm"]:
+			f.write("time1_format = %I:%M %p\n")
+
+		if config["launcher"]:
+			f.write("panel_items = LTSC\n")
+		else:
+			f.write("panel_items = TSC\n")
+
+		if config["icon-theme"]:
+			f.write("launcher_icon_theme = %s\n" % config["icon-theme"])
+
+		for launcher in config["launchers"]:
+			f.write("launcher_item_app = %s\n" % launcher)
+
+		if config["inverted-scroll"]:
+			f.write("mouse_scroll_down = toggle\nmouse_scroll_up = iconify\n")
+
+def reload_panel():
+	"""
+	Asks the running tint2 instances to reload their configuration.
+	"""
+
+	subprocess.call(
+		["killall", "-SIGUSR1", "tint2"],
+		stdout=subprocess.DEVNULL,
+		stderr=subprocess.DEVNULL
+	)
@@ -21,6 +21,13 @@
 
 from gi.repository import Gio, GLib
 
+from collections import OrderedDict
+
+# Queued key changes are applied before GTK+ resizes (HIGH_IDLE + 10)
+# and redraws (HIGH_IDLE + 20), so a burst of notifications costs a
+# single relayout.
+FLUSH_PRIORITY = GLib.PRIORITY_HIGH_IDLE
+
 class Settings(Gio.Settings):
 	"""
 	Nicey things.
@@ -36,13 +43,92 @@ class Settings(Gio.Settings):
 		# Needed for bind_with_convert
 		self._ignore_key_changed = False
 		self._ignore_prop_changed = True
+		
+		# Coalescing of incoming changes: key -> [updaters]
+		self._key_updaters = {}
+		self._pending_keys = OrderedDict()
+		self._flush_source = None
+	
+	def _queue_key_changed(self, settings, key):
+		"""
+		Queues the update of the widgets bound to key.
+		
+		External tools (dconf load, other control center instances...)
+		may rewrite lots of keys at once. Rather than updating every widget
+		as soon as a notification arrives, we collect the changed keys
+		(collapsing duplicates) and apply them in a single pass, before
+		GTK+ resizes and redraws the next frame.
+		"""
+		
+		if self._ignore_key_changed:
+			return
+		
+		self._pending_keys[key] = True
+		
+		if self._flush_source is None:
+			self._flush_source = GLib.idle_add(
+				self._flush_pending_keys,
+				priority=FLUSH_PRIORITY
+			)
+	
+	def _flush_pending_keys(self):
+		"""
+		Updates the widgets bound to the keys changed since the last flush.
+		"""
+		
+		self._flush_source = None
+		
+		pending = self._pending_keys
+		self._pending_keys = OrderedDict()
+		
+		for key in pending:
+			for updater in self._key_updaters.get(key, ()):
+				updater(self, key)
+		
+		return False
+	
+	def _coerce(self, key, value):
+		"""
+		Converts value (a property value) to the type of key.
+		"""
+		
+		type_ = self.get_value(key).get_type_string()
+		if type_ in ("y", "n", "q", "i", "u", "x", "t", "h"):
+			return int(round(value))
+		elif type_ == "d":
+			return float(value)
+		
+		return value
 	
 	def bind(self, key, obj, prop, flags=Gio.SettingsBindFlags.DEFAULT):
 		"""
 		A simplified version of bind().
+		
+		Incoming changes are coalesced like the ones of the keys bound
+		with bind_with_convert() (see _queue_key_changed()). Only the
+		INVERT_BOOLEAN and NO_SENSITIVITY flags are supported that way,
+		the other ones are left to Gio.Settings.bind().
 		"""
 		
-		return Gio.Settings.bind(self, key, obj, prop, flags)
+		supported = Gio.SettingsBindFlags.INVERT_BOOLEAN | Gio.SettingsBindFlags.NO_SENSITIVITY
+		if flags & ~supported:
+			return Gio.Settings.bind(self, key, obj, prop, flags)
+		
+		invert = bool(flags & Gio.SettingsBindFlags.INVERT_BOOLEAN)
+		
+		# Like Gio.Settings.bind(), widgets bound to locked down keys
+		# are insensitive
+		if not flags & Gio.SettingsBindFlags.NO_SENSITIVITY and not self.is_writable(key):
+			if hasattr(obj, "set_sensitive"):
+				obj.set_sensitive(False)
+		
+		self.bind_with_convert(
+			key,
+			obj,
+			prop,
+			lambda x: (not x) if invert else x,
+			lambda x: (not x) if invert else self._coerce(key, x)
+		)
 	
 	def bind_with_convert(self, key, widget, prop, key_to_prop, prop_to_key):
 		"""
@@ -63,9 +149,10 @@ class Settings(Gio.Settings):
 			
 			self._ignore_prop_changed = True
 			
-			widget.set_property(prop, key_to_prop(self[key]))
-			
-			self._ignore_prop_changed = False
+			try:
+				widget.set_property(prop, key_to_prop(self[key]))
+			finally:
+				self._ignore_prop_changed = False
 
 		def prop_changed(widget, param):
 			"""Update GSettings key."""
@@ -89,9 +176,18 @@ class Settings(Gio.Settings):
 				type_ = range_.get_child_value(0).get_string()
 				if type_ == "range":
 					self.set_value(key, GLib.Variant('i', widget.get_property(prop)))
-			
-			self._ignore_key_changed = False
+			except (ValueError, TypeError):
+				# Not valid for the key (e.g. a combobox without an
+				# active_id for an enum): ignore it, like
+				# Gio.Settings.bind() does
+				pass
+			finally:
+				self._ignore_key_changed = False
 
-		self.connect('changed::' + key, key_changed)
+		if not key in self._key_updaters:
+			self._key_updaters[key] = []
+			self.connect('changed::' + key, self._queue_key_changed)
+		self._key_updaters[key].append(key_changed)
+		
 		widget.connect('notify::' + prop, prop_changed)
 		key_changed(self, key) # init default state
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+
+# Pre-scaled wallpapers.
+#
+# When a wallpaper is applied, a copy scaled to the geometry of every
+# monitor (as the background-mode wants it) is stored in CACHE_DIRECTORY,
+# so that the desktop can draw it as is instead of loading and scaling
+# the full-resolution image at every change:
+#
+#   CACHE_DIRECTORY/<md5 of the URI>-<mtime>-<width>x<height>-<mode>.png
+#
+# The mtime of the original file is part of the name, so a modified
+# wallpaper simply misses the cache. The sizes are in device pixels (the
+# monitor geometry multiplied by its scale factor). Files are written
+# atomically, and only the most recently used ones are kept, up to
+# MAX_SIZE bytes.
+#
+# The control center only writes the cache: it's read by the desktop
+# (vera-plugin-desktop, not part of this tree). To draw a wallpaper, it
+# looks up the name above for the geometry of the monitor (or of the
+# whole screen, for the Screen mode) and the current background-mode, as
+# get_cached() does, and draws the file as is, without scaling. On a miss
+# it loads and scales the original, as before. The URI is the file://
+# URI of the absolute path, the mtime is in whole seconds and the mode is
+# the background-mode value (one of SCALED_MODES).
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+import os
+
+import hashlib
+
+from gi.repository import GLib
+
+import veracc.thumbnails as thumbnails
+
+CACHE_DIRECTORY = os.path.join(
+	os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+	"vera",
+	"wallpapers"
+)
+
+# Modes that draw a scaled image. "Screen" spans the image over the whole
+# screen, so it gets a single variant of the size of the screen.
+SCALED_MODES = ("Stretch", "Screen", "Fit", "Crop")
+
+# Size (in bytes) of the scaled wallpapers kept in the cache. The most
+# recently used one is always kept.
+MAX_SIZE = 64 * 1024 * 1024
+
+def get_variants(wallpapers, mode, monitors, screen):
+	"""
+	Returns the list of the (path, width, height) variants needed to draw
+	wallpapers (one per monitor, an empty string meaning "the same as the
+	first monitor") with the given mode.
+	
+	monitors is the list of the (width, height) of every monitor, screen
+	the (width, height) of the whole screen, in device pixels.
+	"""
+	
+	if mode not in SCALED_MODES or not wallpapers or not wallpapers[0]:
+		return []
+	elif mode == "Screen":
+		# A single image spanning every monitor
+		return [(wallpapers[0],) + tuple(screen)]
+	
+	variants = []
+	for monitor, (width, height) in enumerate(monitors):
+		variant = (
+			wallpapers[monitor] if monitor < len(wallpapers) and wallpapers[monitor] else wallpapers[0],
+			width,
+			height
+		)
+		if not variant in variants:
+			variants.append(variant)
+	
+	return variants
+
+def get_cache_path(path, mtime, width, height, mode):
+	"""
+	Returns the path of the variant of path scaled to width x height
+	for the given mode.
+	"""
+	
+	return os.path.join(
+		CACHE_DIRECTORY,
+		"%s-%d-%dx%d-%s.png" % (
+			hashlib.md5(thumbnails.get_uri(path).encode("utf-8")).hexdigest(),
+			mtime,
+			width,
+			height,
+			mode
+		)
+	)
+
+def get_cached(path, width, height, mode):
+	"""
+	Returns the path of the cached variant of path, or None if there
+	isn't one.
+	"""
+	
+	try:
+		mtime = int(os.stat(path).st_mtime)
+	except OSError:
+		return None
+	
+	cached = get_cache_path(path, mtime, width, height, mode)
+	
+	return cached if os.path.exists(cached) else None
+
+def render(path, width, height, mode):
+	"""
+	Returns a Pixbuf of path scaled to width x height for the given mode.
+	
+	Raises thumbnails.ImageTooLarge, GLib.Error or OSError like
+	thumbnails.decode_at_size().
+	"""
+	
+	def get_size(image_width, image_height):
+		if mode in ("Stretch", "Screen"):
+			return width, height
+		elif mode == "Fit":
+			ratio = min(width / image_width, height / image_height)
+		else:
+			# Crop, cover the monitor
+			ratio = max(width / image_width, height / image_height)
+		
+		return max(1, round(image_width * ratio)), max(1, round(image_height * ratio))
+	
+	pixbuf = thumbnails.decode_at_size(path, get_size)
+	
+	if mode == "Crop" and (pixbuf.get_width() > width or pixbuf.get_height() > height):
+		# Keep the center
+		pixbuf = pixbuf.new_subpixbuf(
+			max(0, (pixbuf.get_width() - width) // 2),
+			max(0, (pixbuf.get_height() - height) // 2),
+			min(width, pixbuf.get_width()),
+			min(height, pixbuf.get_height())
+		).copy()
+	
+	return pixbuf
+
+def prepare(path, width, height, mode):
+	"""
+	Ensures that the variant of path scaled to width x height for the
+	given mode is in the cache, and returns its path.
+	
+	Returns None if the mode doesn't scale the image, or if the image
+	can't be rendered (the desktop will load the original then).
+	"""
+	
+	if mode not in SCALED_MODES:
+		return None
+	
+	cached = get_cached(path, width, height, mode)
+	if cached is not None:
+		# Mark it as recently used
+		try:
+			os.utime(cached)
+		except OSError:
+			pass
+		
+		return cached
+	
+	try:
+		mtime = int(os.stat(path).st_mtime)
+	except OSError:
+		return None
+	
+	cached = get_cache_path(path, mtime, width, height, mode)
+	
+	try:
+		pixbuf = render(path, width, height, mode)
+	except thumbnails.ImageTooLarge as e:
+		print("Unable to pre-scale wallpaper: %s" % e)
+		return None
+	except (GLib.Error, OSError) as e:
+		print("Unable to pre-scale wallpaper %s: %s" % (path, e))
+		return None
+	
+	try:
+		if not os.path.exists(CACHE_DIRECTORY):
+			os.makedirs(CACHE_DIRECTORY, 0o700)
+		
+		# Favour speed over size, these are loaded at every change
+		temporary = "%s.%d.tmp" % (cached, os.getpid())
+		pixbuf.savev(temporary, "png", ["compression"], ["1"])
+		os.replace(temporary, cached)
+	except (GLib.Error, OSError) as e:
+		print("Unable to save pre-scaled wallpaper %s: %s" % (cached, e))
+		return None
+	
+	return cached
+
+def prune(max_size=MAX_SIZE):
+	"""
+	Removes the least recently used variants, until the cache fits in
+	max_size bytes.
+	"""
+	
+	try:
+		names = [name for name in os.listdir(CACHE_DIRECTORY) if name.endswith(".png")]
+	except OSError:
+		return
+	
+	entries = []
+	for name in names:
+		path = os.path.join(CACHE_DIRECTORY, name)
+		try:
+			stat = os.stat(path)
+		except OSError:
+			continue
+		
+		entries.append((stat.st_mtime, stat.st_size, path))
+	
+	entries.sort(reverse=True)
+	
+	total = 0
+	for index, (mtime, size, path) in enumerate(entries):
+		total += size
+		if index == 0 or total <= max_size:
+			continue
+		
+		try:
+			os.remove(path)
+		except OSError:
+			pass
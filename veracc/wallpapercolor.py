@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+
+# Representative colours of the wallpapers, used for vera-color when
+# "Pick color from the current wallpaper" is selected.
+#
+# The colour is extracted from the shared thumbnail (see thumbnails),
+# sampling one pixel every SAMPLE_STEP in both directions and clustering
+# the samples with k-means. The cluster picked is the largest one,
+# weighted by saturation and penalized if it's too dark or too bright to
+# highlight something. NumPy is used if available; without it we fall
+# back to the average colour of the samples.
+#
+# Colours are cached in COLOR_CACHE_FILE per path and mtime, so they can
+# be computed ahead of time (while decoding the previews, or when
+# prefetching the next wallpaper of the rotation) and applied right away
+# when the wallpaper changes. More than a process writes the cache: saves
+# merge what's on disk, under a lock.
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+import os
+
+import json
+
+import fcntl
+
+import threading
+
+from gi.repository import GLib
+
+import veracc.thumbnails as thumbnails
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+COLOR_CACHE_FILE = os.path.join(
+	os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+	"vera-control-center",
+	"wallpaper-colors.json"
+)
+
+# Sampling step on the thumbnail, in pixels (a 256x256 thumbnail gives
+# 4096 samples)
+SAMPLE_STEP = 4
+
+# k-means parameters
+CLUSTERS = 5
+ITERATIONS = 8
+
+# Luma range of a usable colour
+MIN_LUMA = 40
+MAX_LUMA = 215
+
+def to_string(red, green, blue):
+	"""
+	Returns the given colour in the format used by vera-color.
+	"""
+	
+	return "rgb(%d,%d,%d)" % (round(red), round(green), round(blue))
+
+def get_luma(red, green, blue):
+	"""
+	Returns the luma of the given colour.
+	"""
+	
+	return 0.299 * red + 0.587 * green + 0.114 * blue
+
+def get_saturation(red, green, blue):
+	"""
+	Returns the (HSV) saturation of the given colour.
+	"""
+	
+	maximum = max(red, green, blue)
+	
+	return (maximum - min(red, green, blue)) / maximum if maximum else 0
+
+def _extract_numpy(pixbuf):
+	"""
+	Returns the representative colour of pixbuf, using k-means on NumPy
+	arrays.
+	"""
+	
+	width = pixbuf.get_width()
+	height = pixbuf.get_height()
+	channels = pixbuf.get_n_channels()
+	
+	# The last row may not be padded up to the rowstride, view the
+	# buffer through strides rather than reshaping it
+	buffer = numpy.frombuffer(pixbuf.read_pixel_bytes().get_data(), dtype=numpy.uint8)
+	pixels = numpy.lib.stride_tricks.as_strided(
+		buffer,
+		shape=(height, width, channels),
+		strides=(pixbuf.get_rowstride(), channels, 1),
+		writeable=False
+	)
+	
+	samples = pixels[::SAMPLE_STEP, ::SAMPLE_STEP, :3].reshape(-1, 3).astype(numpy.float32)
+	if pixbuf.get_has_alpha():
+		# Ignore the transparent pixels
+		opaque = pixels[::SAMPLE_STEP, ::SAMPLE_STEP, 3].reshape(-1) > 127
+		if opaque.any():
+			samples = samples[opaque]
+	
+	# Start from samples evenly spread over the luma range
+	order = numpy.argsort(samples @ numpy.array([0.299, 0.587, 0.114], dtype=numpy.float32))
+	clusters = min(CLUSTERS, len(samples))
+	centers = samples[order[numpy.linspace(0, len(samples) - 1, clusters).astype(int)]]
+	
+	for iteration in range(ITERATIONS):
+		distances = ((samples[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+		labels = distances.argmin(axis=1)
+		
+		counts = numpy.bincount(labels, minlength=clusters)
+		sums = numpy.stack(
+			[numpy.bincount(labels, weights=samples[:, channel], minlength=clusters) for channel in range(3)],
+			axis=1
+		)
+		
+		populated = counts > 0
+		updated = centers.copy()
+		updated[populated] = sums[populated] / counts[populated, None]
+		if numpy.allclose(updated, centers):
+			break
+		centers = updated
+	
+	best = None
+	best_score = -1
+	for center, count in zip(centers.tolist(), counts.tolist()):
+		score = count * (0.1 + get_saturation(*center))
+		if not MIN_LUMA <= get_luma(*center) <= MAX_LUMA:
+			score *= 0.1
+		
+		if score > best_score:
+			best, best_score = center, score
+	
+	return to_string(*best)
+
+def _extract_python(pixbuf):
+	"""
+	Returns the average colour of the samples of pixbuf.
+	"""
+	
+	width = pixbuf.get_width()
+	height = pixbuf.get_height()
+	channels = pixbuf.get_n_channels()
+	rowstride = pixbuf.get_rowstride()
+	data = pixbuf.read_pixel_bytes().get_data()
+	
+	total = [0, 0, 0]
+	count = 0
+	for y in range(0, height, SAMPLE_STEP):
+		for x in range(0, width, SAMPLE_STEP):
+			offset = y * rowstride + x * channels
+			if channels == 4 and data[offset + 3] <= 127:
+				continue
+			
+			total[0] += data[offset]
+			total[1] += data[offset + 1]
+			total[2] += data[offset + 2]
+			count += 1
+	
+	if not count:
+		return None
+	
+	return to_string(*(channel / count for channel in total))
+
+def extract_color(pixbuf):
+	"""
+	Returns the representative colour of pixbuf, as a vera-color string.
+	"""
+	
+	if numpy is not None:
+		return _extract_numpy(pixbuf)
+	
+	return _extract_python(pixbuf)
+
+class ColorCache:
+	"""
+	The colour cache.
+	"""
+	
+	def __init__(self, path=COLOR_CACHE_FILE):
+		"""
+		Initializes the class.
+		"""
+		
+		self.path = path
+		
+		# path -> {"mtime" : mtime, "color" : color}
+		self.colors = {}
+		self.dirty = False
+		self.lock = threading.Lock()
+		
+		self.load()
+	
+	def read(self):
+		"""
+		Returns the persisted cache, or an empty dictionary if it's not
+		valid.
+		"""
+		
+		try:
+			with open(self.path) as f:
+				colors = dict(json.load(f))
+		except (OSError, ValueError, TypeError):
+			return {}
+		
+		return {
+			path : cached for path, cached in colors.items()
+			if isinstance(cached, dict) and isinstance(cached.get("mtime"), int)
+		}
+	
+	def load(self):
+		"""
+		Loads the persisted cache, if it's valid.
+		"""
+		
+		self.colors = self.read()
+	
+	def save(self):
+		"""
+		Persists the cache, if it has been changed, keeping what the
+		other instances saved in the meantime.
+		"""
+		
+		with self.lock:
+			if not self.dirty:
+				return
+		
+		try:
+			directory = os.path.dirname(self.path)
+			if not os.path.exists(directory):
+				os.makedirs(directory)
+			
+			with open(self.path + ".lock", "w") as lock:
+				fcntl.flock(lock, fcntl.LOCK_EX)
+				
+				saved = self.read()
+				with self.lock:
+					for path, cached in saved.items():
+						current = self.colors.get(path)
+						if not isinstance(current, dict) or cached["mtime"] > current.get("mtime", 0):
+							self.colors[path] = cached
+					
+					data = json.dumps(self.colors)
+					self.dirty = False
+				
+				temporary = "%s.%d.tmp" % (self.path, os.getpid())
+				with open(temporary, "w") as f:
+					f.write(data)
+				os.replace(temporary, self.path)
+		except OSError:
+			print("Unable to save the wallpaper colors to %s" % self.path)
+	
+	def get(self, path):
+		"""
+		Returns the cached colour of path, or None if there isn't a
+		valid one.
+		"""
+		
+		try:
+			mtime = int(os.stat(path).st_mtime)
+		except OSError:
+			return None
+		
+		with self.lock:
+			cached = self.colors.get(path)
+		
+		if not isinstance(cached, dict) or cached.get("mtime") != mtime:
+			return None
+		
+		return cached.get("color")
+	
+	def update(self, path, pixbuf):
+		"""
+		Extracts and caches the colour of path from pixbuf (its
+		thumbnail), unless there's already a valid one. Returns the
+		colour.
+		"""
+		
+		color = self.get(path)
+		if color is not None:
+			return color
+		
+		try:
+			mtime = int(os.stat(path).st_mtime)
+		except OSError:
+			return None
+		
+		color = extract_color(pixbuf)
+		if color is not None:
+			with self.lock:
+				self.colors[path] = {"mtime" : mtime, "color" : color}
+				self.dirty = True
+		
+		return color
+	
+	def compute(self, path):
+		"""
+		Returns the colour of path, extracting it from its thumbnail if
+		it isn't cached. Returns None if path can't be decoded.
+		
+		This may decode the image, don't call it from the main thread.
+		"""
+		
+		color = self.get(path)
+		if color is not None:
+			return color
+		
+		try:
+			return self.update(path, thumbnails.get_thumbnail(path))
+		except (thumbnails.ImageTooLarge, GLib.Error, OSError):
+			return None
+
+def apply_color(settings, color):
+	"""
+	Sets color as vera-color in settings (the org.semplicelinux.vera.desktop
+	Gio.Settings), if it has to follow the wallpaper.
+	"""
+	
+	if (
+		color is not None and
+		settings.get_boolean("vera-color-enabled") and
+		not settings.get_boolean("vera-color-lock") and
+		settings.get_string("vera-color") != color
+	):
+		settings.set_string("vera-color", color)
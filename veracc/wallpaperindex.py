@@ -0,0 +1,717 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+# A persistent index of the wallpapers found in the search paths.
+#
+# Directories are listed with a single bulk enumeration (name, type,
+# size, mtime and the content type guessed from the name); files are
+# sniffed only when their extension is unknown and the name-based guess
+# is ambiguous. Scans are meant to run off the main thread.
+#
+# For every directory we store its mtime, its subdirectories, the images
+# it contains (with content type and dimensions) and the metadata of its
+# .wallpaperpack files. A directory is listed again only if its mtime
+# changed, so rescanning an unchanged tree costs one stat() per
+# directory.
+#
+# Note that a file modified in place doesn't change the mtime of its
+# directory: its cached content type and dimensions are kept until
+# something is added to or removed from the directory.
+#
+# Both the desktop module and the rotation planner save the index: saves
+# merge what's on disk (the most recent listing of every directory wins),
+# under a lock.
+#
+# Copies of the same image (e.g. shipped both in /usr/share/backgrounds
+# and in a wallpaper pack, and saved in ~/Pictures) are found by
+# find_duplicates(), comparing the fingerprint of the images that have
+# the same dimensions: the difference hash (dHash) of their luma and
+# their mean colour, as the hash alone ignores the colour. Flat images
+# (solid colours, smooth gradients) have a hash with (nearly) every bit
+# equal, that tells nothing: they're never considered copies.
+# Fingerprints are computed from a 9x8 decode (or from the shared
+# thumbnail, if there's one) only for the images that may be duplicates,
+# and are stored in the index.
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+import os
+
+import json
+
+import fcntl
+
+import threading
+
+import configparser
+
+from collections import namedtuple, OrderedDict
+
+from gi.repository import Gio, GdkPixbuf, GLib
+
+import veracc.thumbnails as thumbnails
+
+INDEX_VERSION = 1
+
+INDEX_FILE = os.path.join(
+	os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+	"vera-control-center",
+	"wallpapers.json"
+)
+
+PACK_EXTENSION = ".wallpaperpack"
+
+# Attributes requested, in bulk, when listing a directory.
+# fast-content-type is guessed from the file name only.
+ENUMERATE_ATTRIBUTES = ",".join(
+	(
+		Gio.FILE_ATTRIBUTE_STANDARD_NAME,
+		Gio.FILE_ATTRIBUTE_STANDARD_TYPE,
+		Gio.FILE_ATTRIBUTE_STANDARD_IS_SYMLINK,
+		Gio.FILE_ATTRIBUTE_STANDARD_FAST_CONTENT_TYPE,
+		Gio.FILE_ATTRIBUTE_STANDARD_SIZE,
+		Gio.FILE_ATTRIBUTE_TIME_MODIFIED,
+		Gio.FILE_ATTRIBUTE_TIME_MODIFIED_USEC,
+	)
+)
+
+# Number of FileInfos requested at once
+ENUMERATE_BATCH = 256
+
+# Extensions we don't need to sniff
+EXTENSIONS = {
+	".bmp" : "image/bmp",
+	".gif" : "image/gif",
+	".jpg" : "image/jpeg",
+	".jpeg" : "image/jpeg",
+	".jpe" : "image/jpeg",
+	".pbm" : "image/x-portable-bitmap",
+	".png" : "image/png",
+	".xbm" : "image/xbm",
+}
+
+# Content types we can use as wallpapers
+SUPPORTED_MIMETYPES = (
+	"image/bmp",
+	"image/gif",
+	"image/jpeg",
+	"image/x-portable-bitmap",
+	"image/png",
+	"image/xbm",
+)
+
+# Content types guessed from the file name that need sniffing
+AMBIGUOUS_CONTENT_TYPES = (
+	"application/octet-stream",
+	"text/plain",
+)
+
+# Bytes read when sniffing
+SNIFF_SIZE = 4096
+
+# Scan limits: how deep we go into a search path, and how many
+# wallpapers we return at most
+MAX_DEPTH = 8
+MAX_WALLPAPERS = 10000
+
+# Keys of org.semplicelinux.vera.desktop that override the scan limits,
+# honoured when the installed schema provides them. The environment
+# variables win over both (see get_scan_limits()).
+MAX_DEPTH_KEY = "background-scan-max-depth"
+MAX_WALLPAPERS_KEY = "background-scan-max-wallpapers"
+
+# dHash side (the hash has HASH_SIZE * HASH_SIZE bits), and the maximum
+# number of different bits between two copies of the same image (to
+# absorb re-encoding)
+HASH_SIZE = 8
+HASH_THRESHOLD = 2
+
+# Maximum difference, per channel, between the mean colours of two copies
+# of the same image
+MEAN_TOLERANCE = 6
+
+# An indexed wallpaper
+WallpaperEntry = namedtuple("WallpaperEntry", ("path", "content_type", "width", "height"))
+
+# The result of a scan.
+# directories is the list of the directories scanned, complete is False if
+# the scan has been cancelled or stopped by the limits, truncated is True
+# only in the latter case.
+ScanResult = namedtuple("ScanResult", ("wallpapers", "infos", "directories", "complete", "truncated"))
+
+def read_wallpaperpack(path):
+	"""
+	Returns a dictionary (wallpaper basename -> {key: value}) with the
+	informations in the given .wallpaperpack.
+	"""
+	
+	# No interpolation: values (such as links) can contain "%"
+	parser = configparser.ConfigParser(interpolation=None)
+	
+	try:
+		parser.read(path)
+		return {section : dict(parser[section]) for section in parser.sections()}
+	except (configparser.Error, UnicodeDecodeError):
+		# FIXME: Implement true logging
+		print("Unable to load wallpaperpack %s" % path)
+		return {}
+
+def get_scan_limits(settings):
+	"""
+	Returns the (max_depth, max_wallpapers) scan limits, given the
+	org.semplicelinux.vera.desktop settings.
+	
+	They're read from the MAX_DEPTH_KEY and MAX_WALLPAPERS_KEY keys if
+	the schema has them, and can be overridden with the
+	VERACC_SCAN_MAX_DEPTH and VERACC_SCAN_MAX_WALLPAPERS environment
+	variables.
+	"""
+	
+	available = settings.list_keys()
+	
+	limits = []
+	for key, variable, default, minimum in (
+		(MAX_DEPTH_KEY, "VERACC_SCAN_MAX_DEPTH", MAX_DEPTH, 0),
+		(MAX_WALLPAPERS_KEY, "VERACC_SCAN_MAX_WALLPAPERS", MAX_WALLPAPERS, 1)
+	):
+		value = settings.get_int(key) if key in available else default
+		
+		try:
+			value = int(os.environ.get(variable, value))
+		except ValueError:
+			print("Invalid %s, using %d" % (variable, value))
+		
+		limits.append(max(minimum, value))
+	
+	return tuple(limits)
+
+def get_content_type(path, name, fast_content_type):
+	"""
+	Returns the content type of the given file.
+	
+	The extension is trusted if we know it, then the content type
+	guessed from the name; the file is sniffed only if that's ambiguous.
+	"""
+	
+	content_type = EXTENSIONS.get(os.path.splitext(name)[1].lower())
+	if content_type:
+		return content_type
+	
+	if fast_content_type and not Gio.content_type_is_unknown(fast_content_type) and \
+		not fast_content_type in AMBIGUOUS_CONTENT_TYPES:
+		return fast_content_type
+	
+	try:
+		with open(path, "rb") as f:
+			data = f.read(SNIFF_SIZE)
+	except OSError:
+		return None
+	
+	return Gio.content_type_guess(name, data)[0]
+
+def get_dimensions(path):
+	"""
+	Returns the (width, height) of the given image, (0, 0) if GdkPixbuf
+	can't read it. Only the header is read.
+	"""
+	
+	format, width, height = GdkPixbuf.Pixbuf.get_file_info(path)
+	if format is None:
+		return 0, 0
+	
+	return width, height
+
+def get_fingerprint(path):
+	"""
+	Returns the fingerprint of the given image: its difference hash, as
+	an integer, and its mean colour, as a [red, green, blue] list.
+	
+	Raises GLib.Error (or OSError) or thumbnails.ImageTooLarge if the image
+	can't be decoded.
+	"""
+	
+	thumbnail = thumbnails.load_thumbnail(path)
+	if thumbnail is not None:
+		pixbuf = thumbnail.scale_simple(HASH_SIZE + 1, HASH_SIZE, GdkPixbuf.InterpType.BILINEAR)
+	else:
+		# The loaders that support it decode at a fraction of the size
+		pixbuf = thumbnails.decode_at_size(path, lambda width, height: (HASH_SIZE + 1, HASH_SIZE))
+	
+	channels = pixbuf.get_n_channels()
+	rowstride = pixbuf.get_rowstride()
+	data = pixbuf.read_pixel_bytes().get_data()
+	
+	dhash = 0
+	mean = [0, 0, 0]
+	for y in range(HASH_SIZE):
+		offsets = [y * rowstride + x * channels for x in range(HASH_SIZE + 1)]
+		row = [
+			299 * data[offset] + 587 * data[offset + 1] + 114 * data[offset + 2]
+			for offset in offsets
+		]
+		for x in range(HASH_SIZE):
+			dhash = (dhash << 1) | (row[x] < row[x + 1])
+		
+		for offset in offsets:
+			for channel in range(3):
+				mean[channel] += data[offset + channel]
+	
+	return dhash, [channel / (HASH_SIZE * (HASH_SIZE + 1)) for channel in mean]
+
+def is_flat(dhash):
+	"""
+	Returns True if the given difference hash has (nearly) every bit
+	equal, as the ones of solid colours and smooth gradients.
+	"""
+	
+	bits = bin(dhash).count("1")
+	
+	return bits <= HASH_THRESHOLD or bits >= HASH_SIZE * HASH_SIZE - HASH_THRESHOLD
+
+def is_copy(fingerprint, other):
+	"""
+	Returns True if the given fingerprints are the ones of two copies of
+	the same image.
+	"""
+	
+	return (
+		bin(fingerprint[0] ^ other[0]).count("1") <= HASH_THRESHOLD and
+		all(abs(x - y) <= MEAN_TOLERANCE for x, y in zip(fingerprint[1], other[1]))
+	)
+
+def get_mtime(info):
+	"""
+	Returns the modification time in the given FileInfo, in seconds.
+	"""
+	
+	return info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_TIME_MODIFIED) + \
+		info.get_attribute_uint32(Gio.FILE_ATTRIBUTE_TIME_MODIFIED_USEC) / 1000000
+
+def list_directory(directory, cancellable=None):
+	"""
+	Returns a list of the FileInfos (see ENUMERATE_ATTRIBUTES) of the
+	children of directory, sorted by name.
+	
+	Raises GLib.Error if the directory can't be listed (or if cancellable
+	has been cancelled).
+	"""
+	
+	enumerator = Gio.File.new_for_path(directory).enumerate_children(
+		ENUMERATE_ATTRIBUTES,
+		Gio.FileQueryInfoFlags.NONE,
+		cancellable
+	)
+	
+	infos = []
+	try:
+		while True:
+			batch = enumerator.next_files(ENUMERATE_BATCH, cancellable)
+			if not batch:
+				break
+			infos.extend(batch)
+	finally:
+		enumerator.close(None)
+	
+	return sorted(infos, key=lambda x: x.get_name())
+
+class WallpaperIndex:
+	"""
+	The index.
+	"""
+	
+	def __init__(self, path=INDEX_FILE):
+		"""
+		Initializes the class.
+		"""
+		
+		self.path = path
+		
+		# directory -> record (see scan_directory())
+		self.directories = {}
+		self.dirty = False
+		self.lock = threading.Lock()
+		
+		# Directories pruned since the last save, they must not come
+		# back from the saved index
+		self.removed = set()
+		
+		self.load()
+	
+	def read(self):
+		"""
+		Returns the directories in the persisted index, or an empty
+		dictionary if it's not valid.
+		"""
+		
+		try:
+			with open(self.path) as f:
+				data = json.load(f)
+			
+			if data["version"] == INDEX_VERSION:
+				return dict(data["directories"])
+		except (OSError, ValueError, KeyError, TypeError):
+			pass
+		
+		return {}
+	
+	def load(self):
+		"""
+		Loads the persisted index, if it's valid.
+		"""
+		
+		self.directories = self.read()
+	
+	def merge(self, saved):
+		"""
+		Merges the saved directories in the index. Must be called with
+		the lock held.
+		"""
+		
+		for directory, record in saved.items():
+			if directory in self.removed:
+				continue
+			
+			current = self.directories.get(directory)
+			try:
+				if current is None or record["mtime"] > current["mtime"]:
+					self.directories[directory] = record
+				elif record["mtime"] == current["mtime"]:
+					# Same listing, keep the fingerprints computed
+					# elsewhere
+					for name, file in record["files"].items():
+						cached = current["files"].get(name)
+						if (
+							cached and "fingerprint" in file and not "fingerprint" in cached and
+							cached["mtime"] == file["mtime"]
+						):
+							cached["fingerprint"] = file["fingerprint"]
+			except (KeyError, TypeError, AttributeError):
+				continue
+	
+	def save(self):
+		"""
+		Persists the index, if it has been changed, keeping what the
+		other instances saved in the meantime.
+		"""
+		
+		with self.lock:
+			if not self.dirty:
+				return
+		
+		try:
+			directory = os.path.dirname(self.path)
+			if not os.path.exists(directory):
+				os.makedirs(directory)
+			
+			with open(self.path + ".lock", "w") as lock:
+				fcntl.flock(lock, fcntl.LOCK_EX)
+				
+				saved = self.read()
+				with self.lock:
+					self.merge(saved)
+					self.removed = set()
+					
+					data = json.dumps(
+						{
+							"version" : INDEX_VERSION,
+							"directories" : self.directories
+						}
+					)
+					self.dirty = False
+				
+				temporary = "%s.%d.tmp" % (self.path, os.getpid())
+				with open(temporary, "w") as f:
+					f.write(data)
+				os.replace(temporary, self.path)
+		except OSError:
+			print("Unable to save the wallpaper index to %s" % self.path)
+	
+	def scan_directory(self, directory, mtime, previous, cancellable=None):
+		"""
+		Lists the given directory and returns its record, or None if
+		the scan has been cancelled.
+		previous is the old record of the directory, if any: the
+		informations of the files that didn't change are reused.
+		"""
+		
+		record = {
+			"mtime" : mtime,
+			"subdirectories" : [],
+			"files" : OrderedDict(),
+			"packs" : OrderedDict(),
+		}
+		
+		old_files = previous.get("files", {}) if previous else {}
+		old_packs = previous.get("packs", {}) if previous else {}
+		
+		try:
+			infos = list_directory(directory, cancellable)
+		except GLib.Error:
+			return None if cancellable and cancellable.is_cancelled() else record
+		
+		for info in infos:
+			name = info.get_name()
+			path = os.path.join(directory, name)
+			file_type = info.get_file_type()
+			
+			if file_type == Gio.FileType.DIRECTORY:
+				# Symlinked directories are not followed (like os.walk())
+				if not info.get_is_symlink():
+					record["subdirectories"].append(name)
+				continue
+			elif file_type != Gio.FileType.REGULAR:
+				# Broken symlinks, sockets, ...
+				continue
+			
+			mtime = get_mtime(info)
+			size = info.get_size()
+			
+			if name.endswith(PACK_EXTENSION):
+				cached = old_packs.get(name)
+				if not cached or cached["mtime"] != mtime:
+					cached = {
+						"mtime" : mtime,
+						"infos" : read_wallpaperpack(path)
+					}
+				
+				record["packs"][name] = cached
+				continue
+			
+			cached = old_files.get(name)
+			if not cached or cached["mtime"] != mtime or cached["size"] != size:
+				content_type = get_content_type(
+					path,
+					name,
+					info.get_attribute_string(Gio.FILE_ATTRIBUTE_STANDARD_FAST_CONTENT_TYPE)
+				)
+				if not content_type or not content_type.startswith("image/"):
+					# Not an image
+					continue
+				
+				width, height = get_dimensions(path)
+				if not width:
+					continue
+				
+				cached = {
+					"mtime" : mtime,
+					"size" : size,
+					"content-type" : content_type,
+					"width" : width,
+					"height" : height
+				}
+			
+			record["files"][name] = cached
+		
+		return record
+	
+	def scan(self, search_paths, cancellable=None, progress=None, max_depth=MAX_DEPTH, max_wallpapers=MAX_WALLPAPERS, prune=True):
+		"""
+		Scans the given search paths, reusing the records of the unchanged
+		directories.
+		
+		The scan stops when cancellable (a Gio.Cancellable) is cancelled,
+		or when max_wallpapers have been found. Directories deeper than
+		max_depth are not scanned, and every directory is scanned only
+		once (even if it's reachable from more than a search path, or via
+		bind mounts).
+		
+		progress, if given, is called with the number of directories and
+		wallpapers found so far after every directory.
+		
+		If prune is True and the scan is complete, the records of the
+		directories not reached are dropped: pass False when scanning only
+		a part of the search paths.
+		
+		Returns a ScanResult, where wallpapers is a list of WallpaperEntries
+		in walk order and infos is a dictionary with the merged metadata
+		of the .wallpaperpacks found. When a limit is hit the truncation is
+		logged and the result is marked as truncated.
+		"""
+		
+		wallpapers = []
+		infos = OrderedDict()
+		directories = []
+		visited = set()
+		visited_inodes = set()
+		complete = True
+		too_many = False
+		too_deep = []
+		
+		# Depth-first, top-down (like os.walk())
+		stack = [(directory, 0) for directory in reversed(search_paths)]
+		while stack:
+			if cancellable and cancellable.is_cancelled():
+				complete = False
+				break
+			
+			directory, depth = stack.pop()
+			if directory in visited:
+				continue
+			visited.add(directory)
+			
+			try:
+				stat = os.stat(directory)
+			except OSError:
+				continue
+			
+			# Loop protection
+			if (stat.st_dev, stat.st_ino) in visited_inodes:
+				continue
+			visited_inodes.add((stat.st_dev, stat.st_ino))
+			directories.append(directory)
+			
+			with self.lock:
+				record = self.directories.get(directory)
+			
+			if not record or record["mtime"] != stat.st_mtime:
+				record = self.scan_directory(directory, stat.st_mtime, record, cancellable)
+				if record is None:
+					# Cancelled
+					complete = False
+					break
+				
+				with self.lock:
+					self.directories[directory] = record
+					self.dirty = True
+			
+			for pack in record["packs"].values():
+				infos.update(pack["infos"])
+			
+			for name, file in record["files"].items():
+				if len(wallpapers) >= max_wallpapers:
+					complete = False
+					too_many = True
+					break
+				
+				wallpapers.append(
+					WallpaperEntry(
+						os.path.join(directory, name),
+						file["content-type"],
+						file["width"],
+						file["height"]
+					)
+				)
+			
+			if progress:
+				progress(len(visited), len(wallpapers))
+			
+			if len(wallpapers) >= max_wallpapers:
+				complete = False
+				too_many = True
+				break
+			
+			if depth >= max_depth:
+				if record["subdirectories"]:
+					complete = False
+					too_deep.append(directory)
+				continue
+			
+			stack.extend(
+				(os.path.join(directory, name), depth + 1)
+				for name in reversed(record["subdirectories"])
+			)
+		
+		if complete and prune:
+			# Forget the directories that aren't there anymore
+			with self.lock:
+				for directory in set(self.directories) - visited:
+					del self.directories[directory]
+					self.removed.add(directory)
+					self.dirty = True
+		
+		if too_many:
+			print("Wallpaper scan truncated: more than %d wallpapers found" % max_wallpapers)
+		for directory in too_deep:
+			print("Wallpaper scan truncated: subfolders of %s are deeper than %d levels" % (directory, max_depth))
+		
+		return ScanResult(wallpapers, infos, directories, complete, too_many or bool(too_deep))
+	
+	def get_fingerprint(self, path):
+		"""
+		Returns the fingerprint of the given indexed wallpaper (see
+		get_fingerprint()), computing it if needed. Returns None if it
+		can't be computed.
+		"""
+		
+		with self.lock:
+			record = self.directories.get(os.path.dirname(path))
+			cached = record["files"].get(os.path.basename(path)) if record else None
+			if cached and "fingerprint" in cached:
+				return cached["fingerprint"]
+		
+		try:
+			fingerprint = get_fingerprint(path)
+		except (thumbnails.ImageTooLarge, GLib.Error, OSError):
+			fingerprint = None
+		
+		if cached is not None:
+			with self.lock:
+				cached["fingerprint"] = fingerprint
+				self.dirty = True
+		
+		return fingerprint
+	
+	def find_duplicates(self, wallpapers, cancellable=None, preferred=()):
+		"""
+		Finds the copies of the same image in the given WallpaperEntries.
+		
+		Returns a dictionary with the path of every entry that has copies
+		(the first one in wallpapers, or the first one in preferred) as
+		key, and the list of the paths of its copies as value.
+		
+		Only the entries with the same dimensions are compared, flat
+		images are never considered copies. The scan stops when
+		cancellable gets cancelled.
+		"""
+		
+		by_dimensions = OrderedDict()
+		for entry in wallpapers:
+			by_dimensions.setdefault((entry.width, entry.height), []).append(entry.path)
+		
+		duplicates = OrderedDict()
+		for paths in by_dimensions.values():
+			if len(paths) < 2:
+				continue
+			
+			# (fingerprint, paths of the copies)
+			groups = []
+			for path in paths:
+				if cancellable and cancellable.is_cancelled():
+					return duplicates
+				
+				fingerprint = self.get_fingerprint(path)
+				if fingerprint is None or is_flat(fingerprint[0]):
+					continue
+				
+				for group_fingerprint, group in groups:
+					if is_copy(group_fingerprint, fingerprint):
+						group.append(path)
+						break
+				else:
+					groups.append((fingerprint, [path]))
+			
+			for fingerprint, group in groups:
+				if len(group) < 2:
+					continue
+				
+				keep = next((path for path in group if path in preferred), group[0])
+				duplicates[keep] = [path for path in group if path != keep]
+		
+		return duplicates
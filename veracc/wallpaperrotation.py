@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+
+# Random wallpaper rotation planning.
+#
+# The upcoming sequence of the random rotation is computed ahead of time
+# from the wallpaper index (honouring background-include and
+# background-exclude) and stored in PLAN_FILE, e.g.
+#
+#   {"sequence": ["/usr/share/backgrounds/a.jpg", "/home/user/b.png"]}
+#
+# Once a wallpaper has been applied, the scaled variants of the next one
+# are rendered into the wallpapercache by a single background worker
+# running at idle CPU and I/O priority, long before its timeout fires, so
+# that the switch doesn't touch the original file. Its colour is
+# extracted too, and applied as soon as it becomes the wallpaper.
+#
+# The rotation itself is done by the desktop (vera-plugin-desktop, not
+# part of this tree). To use the plan, at every rotation it has to:
+#
+#   1. read PLAN_FILE and take the first path of "sequence" that still
+#      exists (falling back to its own random pick if there's none, or
+#      if the file is missing or not valid);
+#   2. draw it, using the variants in wallpapercache.CACHE_DIRECTORY
+#      when they're there;
+#   3. set it as the first item of image-path.
+#
+# The desktop never writes PLAN_FILE: the scheduler sees the change of
+# image-path, drops the wallpaper from the plan and prefetches the next
+# one. Until the desktop does so, the plan is only a (cheap) hint: the
+# rotation works as before without it.
+#
+# The scheduler (veracc-cli rotation) runs only while the random rotation
+# is enabled: it's started in the session by vera-wallpaper-rotation.desktop
+# and by the desktop module when the rotation gets enabled (see start()),
+# it exits as soon as the rotation is disabled, and a single instance
+# runs at a time (see LOCK_FILE).
+# It doesn't depend on Gtk so it can be used outside of the UI too.
+
+import os
+
+import json
+
+import random
+
+import fcntl
+
+import threading
+
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+from gi.repository import GLib
+
+from veracc.utils import Settings
+
+import veracc.wallpaperindex as wallpaperindex
+import veracc.wallpapercache as wallpapercache
+import veracc.wallpapercolor as wallpapercolor
+
+PLAN_FILE = os.path.join(
+	os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+	"vera",
+	"wallpaper-rotation.json"
+)
+
+# Held by the running scheduler
+LOCK_FILE = PLAN_FILE + ".lock"
+
+# Niceness of the prefetching worker
+PREFETCH_NICE = 19
+
+# Keys that change the candidates or what has to be prefetched
+WATCHED_KEYS = (
+	"image-path",
+	"background-mode",
+	"background-random-enabled",
+	"background-search-paths",
+	"background-include",
+	"background-exclude",
+	wallpaperindex.MAX_DEPTH_KEY,
+	wallpaperindex.MAX_WALLPAPERS_KEY,
+)
+
+def get_candidates(index, search_paths, include, exclude, cancellable=None, max_depth=wallpaperindex.MAX_DEPTH, max_wallpapers=wallpaperindex.MAX_WALLPAPERS):
+	"""
+	Returns the list of the wallpapers the rotation can pick from: the
+	supported images in the search_paths (as found by index, a
+	wallpaperindex.WallpaperIndex) and the ones in include, minus the ones
+	in exclude. Copies of the same image are picked once.
+	
+	max_depth and max_wallpapers are the scan limits (see
+	wallpaperindex.WallpaperIndex.scan()).
+	"""
+	
+	excluded = set(exclude)
+	
+	result = index.scan(search_paths, cancellable, max_depth=max_depth, max_wallpapers=max_wallpapers)
+	
+	entries = [
+		entry for entry in result.wallpapers
+		if entry.content_type in wallpaperindex.SUPPORTED_MIMETYPES and not entry.path in excluded
+	]
+	hidden = set(
+		alternate
+		for group in index.find_duplicates(entries, cancellable).values()
+		for alternate in group
+	)
+	index.save()
+	
+	candidates = [entry.path for entry in entries if not entry.path in hidden]
+	seen = set(candidates) | hidden
+	
+	for wallpaper in include:
+		if not wallpaper in seen and not wallpaper in excluded and os.path.exists(wallpaper):
+			seen.add(wallpaper)
+			candidates.append(wallpaper)
+	
+	return candidates
+
+def lower_priority():
+	"""
+	Lowers the CPU and I/O priority of the calling thread.
+	"""
+	
+	# On Linux both are per-thread: who = 0 is the calling thread for
+	# setpriority(), ionice needs the thread id.
+	try:
+		os.setpriority(os.PRIO_PROCESS, 0, PREFETCH_NICE)
+	except OSError:
+		print("Unable to lower the priority of the prefetching worker")
+	
+	try:
+		thread = os.path.basename(os.readlink("/proc/thread-self"))
+		subprocess.call(
+			["ionice", "-c", "3", "-p", thread],
+			stdout=subprocess.DEVNULL,
+			stderr=subprocess.DEVNULL
+		)
+	except OSError:
+		print("Unable to lower the I/O priority of the prefetching worker")
+
+class RotationPlan:
+	"""
+	The upcoming sequence of wallpapers.
+	"""
+	
+	def __init__(self, path=PLAN_FILE):
+		"""
+		Initializes the class.
+		"""
+		
+		self.path = path
+		self.sequence = []
+		
+		self.load()
+	
+	def load(self):
+		"""
+		Loads the persisted plan, if it's valid.
+		"""
+		
+		try:
+			with open(self.path) as f:
+				self.sequence = [x for x in json.load(f)["sequence"] if isinstance(x, str)]
+		except (OSError, ValueError, KeyError, TypeError):
+			self.sequence = []
+	
+	def save(self):
+		"""
+		Atomically persists the plan.
+		"""
+		
+		try:
+			directory = os.path.dirname(self.path)
+			if not os.path.exists(directory):
+				os.makedirs(directory)
+			
+			temporary = "%s.%d.tmp" % (self.path, os.getpid())
+			with open(temporary, "w") as f:
+				json.dump({"sequence" : self.sequence}, f)
+			os.replace(temporary, self.path)
+		except OSError:
+			print("Unable to save the wallpaper rotation plan to %s" % self.path)
+	
+	def update(self, candidates, current=None):
+		"""
+		Updates the sequence so that it contains every candidate once.
+		
+		The wallpapers still planned keep their order (minus the ones
+		that aren't candidates anymore, and current, that has just been
+		applied); the new candidates are shuffled and appended.
+		"""
+		
+		available = set(candidates)
+		
+		sequence = [x for x in self.sequence if x in available and x != current]
+		planned = set(sequence)
+		
+		new = [x for x in candidates if not x in planned and x != current]
+		random.shuffle(new)
+		sequence += new
+		
+		if not sequence and current in available:
+			# A single wallpaper
+			sequence = [current]
+		
+		self.sequence = sequence
+	
+	def peek(self):
+		"""
+		Returns the next wallpaper, or None if there isn't one.
+		"""
+		
+		return self.sequence[0] if self.sequence else None
+
+class RotationScheduler:
+	"""
+	Keeps the rotation plan up to date with the settings and prefetches
+	the next wallpaper.
+	
+	Needs a running GLib main loop.
+	"""
+	
+	def __init__(self, settings, get_geometry):
+		"""
+		Initializes the class.
+		
+		settings is the org.semplicelinux.vera.desktop Gio.Settings,
+		get_geometry a function returning the (monitors, screen) sizes
+		(see wallpapercache.get_variants()).
+		"""
+		
+		self.settings = settings
+		self.get_geometry = get_geometry
+		
+		self.index = wallpaperindex.WallpaperIndex()
+		self.plan = RotationPlan()
+		self.colors = wallpapercolor.ColorCache()
+		
+		# A single, low-priority worker (lowered on its first job).
+		# Only the latest request counts.
+		self.pool = ThreadPoolExecutor(max_workers=1)
+		self.worker = threading.local()
+		self.generation = 0
+		
+		for key in WATCHED_KEYS:
+			self.settings.connect("changed::%s" % key, self.on_settings_changed)
+		
+		self.schedule()
+	
+	def on_settings_changed(self, settings, key):
+		"""
+		Fired when one of the WATCHED_KEYS has been changed.
+		"""
+		
+		if key == "image-path":
+			# Extracted when prefetching
+			current = self.settings.get_strv("image-path")
+			if current:
+				wallpapercolor.apply_color(self.settings, self.colors.get(current[0]))
+		
+		self.schedule()
+	
+	def schedule(self):
+		"""
+		Queues the update of the plan and the prefetch of the next
+		wallpaper.
+		"""
+		
+		if not self.settings.get_boolean("background-random-enabled"):
+			return
+		
+		monitors, screen = self.get_geometry()
+		
+		self.generation += 1
+		self.pool.submit(
+			self.prefetch,
+			self.generation,
+			self.settings.get_strv("image-path"),
+			self.settings.get_string("background-mode"),
+			self.settings.get_strv("background-search-paths"),
+			self.settings.get_strv("background-include"),
+			self.settings.get_strv("background-exclude"),
+			wallpaperindex.get_scan_limits(self.settings),
+			monitors,
+			screen
+		)
+	
+	def prefetch(self, generation, current, mode, search_paths, include, exclude, limits, monitors, screen):
+		"""
+		Updates the plan and renders the scaled variants of the next
+		wallpaper.
+		
+		This runs in the prefetching worker.
+		"""
+		
+		if not getattr(self.worker, "lowered", False):
+			lower_priority()
+			self.worker.lowered = True
+		
+		if generation != self.generation:
+			return
+		
+		self.plan.update(
+			get_candidates(self.index, search_paths, include, exclude, None, *limits),
+			current[0] if current else None
+		)
+		self.plan.save()
+		
+		following = self.plan.peek()
+		if following is None:
+			return
+		
+		self.colors.compute(following)
+		self.colors.save()
+		
+		for path, width, height in wallpapercache.get_variants([following], mode, monitors, screen):
+			if generation != self.generation:
+				return
+			
+			wallpapercache.prepare(path, width, height, mode)
+		
+		wallpapercache.prune()
+	
+	def shutdown(self):
+		"""
+		Stops the worker once it's done.
+		"""
+		
+		self.generation += 1
+		self.pool.shutdown(wait=False)
+
+def start():
+	"""
+	Starts the scheduler (veracc-cli rotation) in the background. It exits
+	on its own if it's already running, or if the rotation is disabled.
+	"""
+	
+	try:
+		GLib.spawn_async(["veracc-cli", "rotation"], flags=GLib.SpawnFlags.SEARCH_PATH)
+	except GLib.Error:
+		print("Unable to start the wallpaper rotation scheduler")
+
+def run(get_geometry):
+	"""
+	Runs a RotationScheduler while the random rotation is enabled.
+	
+	Returns immediately if it's disabled, or if another scheduler is
+	running.
+	"""
+	
+	settings = Settings("org.semplicelinux.vera.desktop")
+	if not settings.get_boolean("background-random-enabled"):
+		return
+	
+	directory = os.path.dirname(LOCK_FILE)
+	if not os.path.exists(directory):
+		os.makedirs(directory)
+	
+	with open(LOCK_FILE, "w") as lock:
+		try:
+			fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+		except OSError:
+			# Already running
+			return
+		
+		scheduler = RotationScheduler(settings, get_geometry)
+		
+		loop = GLib.MainLoop()
+		
+		def on_random_enabled_changed(settings, key):
+			if not settings.get_boolean(key):
+				# Nothing to plan anymore
+				loop.quit()
+		
+		settings.connect("changed::background-random-enabled", on_random_enabled_changed)
+		
+		try:
+			loop.run()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			scheduler.shutdown()
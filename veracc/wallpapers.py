@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# vera-control-center - Vera Control Center
+# Copyright (C) 2014  Semplice Project
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+# Authors:
+#    Eugenio "g7" Paolantonio <me@medesimo.eu>
+#
+
+
+# Wallpaper list helpers shared by the desktop module and veracc-cli.
+# They don't depend on Gtk so they can be used outside of the UI too.
+
+def include_wallpaper(settings, path):
+	"""
+	Adds the given wallpaper to the list, either by removing it
+	from background-exclude or by appending it to background-include.
+	"""
+	
+	include = settings.get_strv("background-include")
+	exclude = settings.get_strv("background-exclude")
+	
+	if path in exclude:
+		# Already excluded, so we can simply remove it
+		# from the list
+		exclude.remove(path)
+	elif path not in include:
+		# Not excluded, append to the include list
+		include.append(path)
+	
+	settings.set_strv("background-include", include)
+	settings.set_strv("background-exclude", exclude)
+
+def exclude_wallpaper(settings, path):
+	"""
+	Removes the given wallpaper from the list.
+	If it is in background-include it is removed from there, otherwise
+	an exclusion rule is added.
+	"""
+	
+	include = settings.get_strv("background-include")
+	if path in include:
+		include.remove(path)
+		settings.set_strv("background-include", include)
+	else:
+		exclude = settings.get_strv("background-exclude")
+		if not path in exclude:
+			exclude.append(path)
+			settings.set_strv("background-exclude", exclude)
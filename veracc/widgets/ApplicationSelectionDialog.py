@@ -21,7 +21,32 @@
 
 import quickstart
 
-from gi.repository import Gtk, Gio, GMenu, GObject
+import threading
+
+import time
+
+from collections import deque
+
+from gi.repository import Gtk, Gio, GMenu, GObject, GLib
+
+import veracc.menusnapshot as menusnapshot
+
+from veracc.appindex import ApplicationIndex
+
+from veracc.menusnapshot import MenuItem
+
+# The menu shown in the dialog
+MENU_FILE = "vera-applications.menu"
+
+# Time budget (in seconds) for the population of the model in a single
+# main loop iteration
+POPULATE_FRAME_BUDGET = 0.008
+
+# Maximum number of search results shown
+SEARCH_LIMIT = 50
+
+# The ApplicationMenu shared by every dialog, see get_menu()
+_menu = None
 
 class DirectoryIterate:
 	"""
@@ -44,6 +69,210 @@ class DirectoryIterate:
 		elif nxt == GMenu.TreeItemType.ENTRY:
 			return self.obj.get_entry(), GMenu.TreeItemType.ENTRY
 
+def flatten_directory(directory, parent=()):
+	"""
+	Yields a MenuItem for every directory and entry in the given GMenu
+	directory, recursively. Directories are yielded before their children.
+	"""
+	
+	def serialize(icon):
+		return icon.to_string() if icon else None
+	
+	for child, typ in DirectoryIterate(directory):
+		if typ == GMenu.TreeItemType.DIRECTORY:
+			# Directory
+			
+			if not child:
+				continue
+			
+			yield MenuItem(parent, child.get_name(), None, serialize(child.get_icon()))
+			yield from flatten_directory(child, parent + (child.get_name(),))
+		elif typ == GMenu.TreeItemType.ENTRY:
+			# Entry
+			
+			info = child.get_app_info()
+			
+			yield MenuItem(parent, info.get_name(), child.get_desktop_file_path(), serialize(info.get_icon()))
+
+class ApplicationMenu(GObject.Object):
+	"""
+	An ApplicationMenu holds the application menu tree and the TreeStore
+	built from it.
+	
+	The GMenu tree is loaded and walked in a thread; the model is then
+	populated in the main thread, in time-sliced chunks (see populate()).
+	The menu is reloaded when the tree changes.
+	
+	The flattened menu is persisted (see veracc.menusnapshot): the model
+	is first populated from the snapshot, while the tree is loaded; the
+	model is populated again only if the snapshot was stale. After that,
+	the menu is reloaded only when the tree emits "changed".
+	
+	The ApplicationIndex used by the search is rebuilt, in the thread,
+	together with the model.
+	
+	There is only one ApplicationMenu per process, see get_menu().
+	"""
+	
+	__gsignals__ = {
+		"populated" : (
+			GObject.SIGNAL_RUN_LAST,
+			None,
+			()
+		),
+	}
+	
+	def __init__(self):
+		"""
+		Initialization.
+		"""
+		
+		super().__init__()
+		
+		# (name, desktop_file_path, icon)
+		self.model = Gtk.TreeStore(str, str, Gio.Icon)
+		
+		self.populated = False
+		self.populate_source = None
+		
+		# The MenuItems in the model
+		self.items = None
+		
+		# The ApplicationIndex of the items in the model
+		self.index = None
+		
+		# Parent path -> TreeIter of the directory
+		self.parents = {}
+		
+		self.tree = GMenu.Tree.new(MENU_FILE, GMenu.TreeFlags.SORT_DISPLAY_NAME)
+		self.tree.connect("changed", self.on_tree_changed)
+		
+		# Serializes load_sync() calls
+		self.lock = threading.Lock()
+		
+		self.load()
+	
+	def on_tree_changed(self, tree):
+		"""
+		Fired when the menu tree changed on disk.
+		"""
+		
+		self.load()
+	
+	@quickstart.threads.thread
+	def load(self):
+		"""
+		(Re)loads the tree and schedules the population of the model,
+		if something changed.
+		
+		The first time, the snapshot (if any) is shown right away. The
+		tree is loaded anyway, so that its "changed" signal is emitted
+		from now on.
+		"""
+		
+		with self.lock:
+			if self.items is None:
+				# First load, show the snapshot right away
+				self.items = menusnapshot.load_snapshot(MENU_FILE)[0]
+				if self.items is not None:
+					GObject.idle_add(self.start_population, deque(self.items), ApplicationIndex(self.items))
+			
+			try:
+				self.tree.load_sync()
+			except GLib.Error as e:
+				print("Unable to load the application menu: %s" % e)
+				return
+			
+			items = list(flatten_directory(self.tree.get_root_directory()))
+			
+			if items == self.items:
+				# The snapshot was right
+				return
+			
+			self.items = items
+			GObject.idle_add(self.start_population, deque(items), ApplicationIndex(items))
+			
+			menusnapshot.save_snapshot(MENU_FILE, items, menusnapshot.get_mtimes(MENU_FILE))
+	
+	def start_population(self, items, index):
+		"""
+		Clears the model and starts populating it with the given MenuItem
+		deque. index is the ApplicationIndex of the items.
+		"""
+		
+		if self.populate_source is not None:
+			# Superseded
+			GLib.source_remove(self.populate_source)
+		
+		self.model.clear()
+		self.index = index
+		self.parents = {(): None}
+		self.populated = False
+		
+		self.populate_source = GObject.idle_add(self.populate, items)
+		
+		return False
+	
+	def populate(self, items):
+		"""
+		Adds the given MenuItems to the model, stopping when the
+		POPULATE_FRAME_BUDGET is exhausted.
+		
+		This is an idle callback, so it's called again (in another
+		main loop iteration) until every item has been added.
+		"""
+		
+		deadline = time.monotonic() + POPULATE_FRAME_BUDGET
+		
+		while items and time.monotonic() < deadline:
+			item = items.popleft()
+			
+			treeiter = self.model.append(
+				self.parents.get(item.parent),
+				(
+					item.name,
+					item.desktop_file,
+					Gio.Icon.new_for_string(item.icon) if item.icon else None
+				)
+			)
+			
+			if item.desktop_file is None:
+				self.parents[item.parent + (item.name,)] = treeiter
+		
+		if items:
+			return True
+		
+		self.populate_source = None
+		self.populated = True
+		self.emit("populated")
+		
+		return False
+	
+	def search(self, query):
+		"""
+		Returns a list of the MenuItems matching query, best first.
+		"""
+		
+		if self.index is None:
+			return []
+		
+		return self.index.search(query, SEARCH_LIMIT)
+
+def get_menu():
+	"""
+	Returns the ApplicationMenu shared by every dialog, creating it
+	if needed. It keeps itself up to date (see ApplicationMenu.load()).
+	
+	Must be called from the main thread.
+	"""
+	
+	global _menu
+	
+	if _menu is None:
+		_menu = ApplicationMenu()
+	
+	return _menu
+
 class ApplicationSelectionDialog(Gtk.Dialog):
 	"""
 	The ApplicationSelectionDialog is a dialog that lets the user choose
@@ -66,46 +295,60 @@ class ApplicationSelectionDialog(Gtk.Dialog):
 			return None
 		
 
-	def menu_iterate(self, directory, menu_iter=None, create_menu_iter=False, skip=None):
-		""" Iterates through the menu entries and adds them to the launcher_add_treeview. """
-
-		if not directory: return
-		if not skip: skip = ()
+	def on_menu_populated(self, menu):
+		"""
+		Fired when the shared menu has been (re)populated.
+		"""
 		
-		if create_menu_iter:
-			menu_iter = self.launcher_add_model.append(None, (directory.get_name(), None, directory.get_icon()))
+		if self.search_entry.get_text():
+			# Refresh the results
+			self.on_search_changed(self.search_entry)
+		else:
+			self.treeview.expand_all()
+	
+	def on_search_changed(self, entry):
+		"""
+		Fired when the text in the search entry changed.
+		Shows the ranked search results, or the whole menu if the entry is
+		empty.
+		"""
 		
-		for child, typ in DirectoryIterate(directory):
-			if typ == GMenu.TreeItemType.DIRECTORY:
-				# Directory
-
-				if not child or child.get_menu_id() in skip:
-					continue
-
-				_menu_iter = self.launcher_add_model.append(menu_iter, (child.get_name(), None, child.get_icon()))
-				self.menu_iterate(child, _menu_iter, skip=skip)
-			elif typ == GMenu.TreeItemType.ENTRY:
-				# Entry
-
-				info = child.get_app_info()
-				#print info.get_icon()
-				
-				self.launcher_add_model.append(
-					menu_iter,
+		query = entry.get_text()
+		
+		if not query:
+			self.treeview.set_model(self.launcher_add_model)
+			self.treeview.expand_all()
+		else:
+			self.results_model.clear()
+			for item in self.menu.search(query):
+				self.results_model.append(
 					(
-						info.get_name(),
-						child.get_desktop_file_path(),
-						info.get_icon()
+						item.name,
+						item.desktop_file,
+						Gio.Icon.new_for_string(item.icon) if item.icon else None
 					)
 				)
-
-	#@quickstart.threads.thread
+			
+			self.treeview.set_model(self.results_model)
+			
+			# Select the best result
+			if len(self.results_model) > 0:
+				self.treeview.set_cursor(Gtk.TreePath.new_first(), None, False)
+		
+		self.treeview.emit("cursor-changed")
+	
+	def on_search_activate(self, entry):
+		"""
+		Fired when Enter has been pressed in the search entry.
+		Picks the selected result.
+		"""
+		
+		if self.get_widget_for_response(Gtk.ResponseType.OK).get_sensitive():
+			self.response(Gtk.ResponseType.OK)
+	
 	def build_application_list(self):
 		""" Builds the application list. """
 		
-		self.tree = GMenu.Tree.new("vera-applications.menu", GMenu.TreeFlags.SORT_DISPLAY_NAME)
-		self.tree.load_sync()
-
 		# Column
 		column = Gtk.TreeViewColumn("Everything")
 		
@@ -122,17 +365,20 @@ class ApplicationSelectionDialog(Gtk.Dialog):
 		# Append
 		self.treeview.append_column(column)		
 		
-		#GObject.idle_add(self.menu_iterate, self.tree.get_root_directory(), None, False, ("Preferences", "Administration"))		
-		#GObject.idle_add(self.menu_iterate, self.tree.get_directory_from_path("/System/Preferences"), None, True)
-		#GObject.idle_add(self.menu_iterate, self.tree.get_directory_from_path("/System/Administration"), None, True)
-		GObject.idle_add(self.menu_iterate, self.tree.get_root_directory(), None, False)
-		
-		GObject.idle_add(self.treeview.expand_all)
+		# The model is populated by the shared menu, expand it when it's
+		# ready
+		self.menu_handler = self.menu.connect("populated", self.on_menu_populated)
+		if self.menu.populated:
+			self.treeview.expand_all()
+	
+	def on_destroy(self, window):
+		"""
+		Disconnects from the shared menu.
+		"""
 		
-		# First start, disable OK button.
-		#GObject.idle_add(self.objects["launcher_ok_button"].set_sensitive, False)
-
-		#GObject.idle_add(self.objects["add_launcher"].show_all)
+		if self.menu_handler is not None:
+			self.menu.disconnect(self.menu_handler)
+			self.menu_handler = None
 	
 	def handle_delete_event(self, window, event_type):
 		"""
@@ -165,11 +411,14 @@ class ApplicationSelectionDialog(Gtk.Dialog):
 		# Emit cursor-changed on the treeview so that we'll disable the Select button
 		self.treeview.emit("cursor-changed")
 		
+		# Clear the search, this shows the whole menu again
+		self.search_entry.set_text("")
+		
 		# Scroll to top
 		GObject.idle_add(self.scrolledwindow.get_vadjustment().set_value, 0.0)
 		
-		# Grab focus on the treeview
-		self.treeview.grab_focus()
+		# Grab focus on the search entry
+		self.search_entry.grab_focus()
 	
 	def __init__(self):
 		"""
@@ -197,13 +446,20 @@ class ApplicationSelectionDialog(Gtk.Dialog):
 			_("_Select"), Gtk.ResponseType.OK
 		)
 		
+		# Search entry
+		self.search_entry = Gtk.SearchEntry()
+		self.search_entry.set_margin_bottom(5)
+		self.search_entry.set_placeholder_text(_("Search applications"))
+		self.search_entry.connect("search-changed", self.on_search_changed)
+		self.search_entry.connect("activate", self.on_search_activate)
+		
 		# Treeview
 		self.scrolledwindow = Gtk.ScrolledWindow()
 		self.scrolledwindow.set_margin_bottom(5)
 		self.treeview = Gtk.TreeView()
 		self.treeview.set_headers_visible(False)
-		self.treeview.set_search_column(0)
-		self.treeview.set_enable_search(True)
+		# The search entry replaces the interactive search
+		self.treeview.set_enable_search(False)
 		
 		# Show the "Select" button only when something has been selected
 		self.treeview.connect(
@@ -218,18 +474,24 @@ class ApplicationSelectionDialog(Gtk.Dialog):
 					# should not trigger the sensitiveness of the button
 					# to True
 					
-					self.launcher_add_model[x.get_selection().get_selected()[1]][1] == None
+					x.get_model()[x.get_selection().get_selected()[1]][1] == None
 				)
 			)
 		)
 
-		# Create store
-		self.launcher_add_model = Gtk.TreeStore(str, str, Gio.Icon)
+		# Get the shared store
+		self.menu = get_menu()
+		self.menu_handler = None
+		self.launcher_add_model = self.menu.model
 		# And link the TreeView to it...
 		self.treeview.set_model(self.launcher_add_model)
+		
+		# Flat store for the search results
+		self.results_model = Gtk.ListStore(str, str, Gio.Icon)
 
 		# Add the widgets to the main dialog
 		self.scrolledwindow.add_with_viewport(self.treeview)
+		box.pack_start(self.search_entry, False, False, 0)
 		box.pack_start(self.scrolledwindow, True, True, 0)
 		
 		# Handle hide
@@ -238,6 +500,9 @@ class ApplicationSelectionDialog(Gtk.Dialog):
 		# Handle delete event
 		self.connect("delete-event", self.handle_delete_event)
 		
+		# Handle destroy
+		self.connect("destroy", self.on_destroy)
+		
 		box.show_all()
 	
 	#def run(self):